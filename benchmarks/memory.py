@@ -0,0 +1,97 @@
+import argparse
+import os
+import os.path
+import tempfile
+import numpy as np
+
+import matchmaker as Matchmaker
+
+# Report the memory taken up by each of the engine's structures, with the population's feature matrix stored as each
+# population feature dtype (see Engine.POPULATION_FEATURE_DTYPE), built from the input data in data/. For comparison,
+# also reports the population as a preprocessed pandas data frame (float64 features and object strings for the direct
+# lookups), the way that it was held before there was a population snapshot.
+#
+# Each dtype is built and trained in a temporary directory, so the model artifact and population snapshot in models/ are
+# left alone.
+#
+# Usage: python -m benchmarks.memory [--dtypes float64 float32]
+def parse_arguments():
+  parser = argparse.ArgumentParser(
+    allow_abbrev = False,
+    description = 'Memory taken up by the engine with each population feature dtype.'
+  )
+
+  parser.add_argument(
+    '--dtypes',
+    nargs = '+',
+    default = Matchmaker.Engine.POPULATION_FEATURE_DTYPES,
+    choices = Matchmaker.Engine.POPULATION_FEATURE_DTYPES,
+    help = 'The population feature dtypes to build the engine with (default: all of them).'
+  )
+
+  return parser.parse_args()
+
+# Build an engine with the given population feature dtype, from the input data in the given data directory, in a
+# temporary working directory, and return its state (see Engine.EngineState). The engine's dtype is put back afterwards.
+def build_engine(population_feature_dtype, data_directory):
+  working_directory = os.getcwd()
+
+  with tempfile.TemporaryDirectory() as temporary_directory:
+    os.symlink(data_directory, os.path.join(temporary_directory, 'data'))
+    os.mkdir(os.path.join(temporary_directory, 'models'))
+    os.chdir(temporary_directory)
+
+    engine_population_feature_dtype = Matchmaker.Engine.POPULATION_FEATURE_DTYPE
+    Matchmaker.Engine.POPULATION_FEATURE_DTYPE = population_feature_dtype
+
+    try:
+      return Matchmaker.Engine.Engine().refresh().state
+    finally:
+      Matchmaker.Engine.POPULATION_FEATURE_DTYPE = engine_population_feature_dtype
+      os.chdir(working_directory)
+
+# The bytes taken up by the population as a preprocessed data frame, by the features and by the direct lookups.
+def measure_data_frame(engine):
+  data_frame = engine.fetch_preprocessed_population_rows(np.arange(len(engine.population_row_ids)))
+  memory_usage = data_frame.memory_usage(deep = True)
+
+  return {
+    'data_frame_features': int(memory_usage[engine.feature_columns].sum()),
+    'data_frame_direct_lookups': int(memory_usage[Matchmaker.DataPreprocessing.DIRECT_LOOKUP_FEATURES].sum()),
+    'data_frame_index': int(memory_usage['Index'])
+  }
+
+def main():
+  arguments = parse_arguments()
+
+  memory_usages = {}
+
+  for population_feature_dtype in arguments.dtypes:
+    engine = build_engine(population_feature_dtype, os.path.abspath('data'))
+
+    # Build every candidates mask that queries could, so that they are counted too.
+    for sex in Matchmaker.DataPreprocessing.SEX_VALUES:
+      for sexual_orientation in Matchmaker.DataPreprocessing.SEXUAL_ORIENTATION_VALUES:
+        engine.build_candidates_mask(Matchmaker.Model.compatible_segments(sex, sexual_orientation), 'english')
+
+    memory_usages[population_feature_dtype] = engine.memory_usage()
+
+  data_frame_memory_usage = measure_data_frame(engine)
+
+  print(f'{len(engine.population_row_ids)} rows, {len(engine.feature_columns)} features\n')
+  print(f'{"structure":<40}' + ''.join(f'{population_feature_dtype:>16}' for population_feature_dtype in arguments.dtypes))
+
+  for structure in memory_usages[arguments.dtypes[0]]:
+    print(f'{structure:<40}' + ''.join(f'{memory_usages[population_feature_dtype][structure]:>16,}' for population_feature_dtype in arguments.dtypes))
+
+  print(f'{"total":<40}' + ''.join(f'{sum(memory_usages[population_feature_dtype].values()):>16,}' for population_feature_dtype in arguments.dtypes))
+
+  print(f'\n{"preprocessed data frame":<40}')
+
+  for structure, size in data_frame_memory_usage.items():
+    print(f'{structure:<40}{size:>16,}')
+
+  print(f'{"total":<40}{sum(data_frame_memory_usage.values()):>16,}')
+
+if __name__ == '__main__':
+  main()
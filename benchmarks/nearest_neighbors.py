@@ -0,0 +1,135 @@
+import argparse
+import os
+import os.path
+import tempfile
+import time
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+import matchmaker as Matchmaker
+from . import synthetic_profiles as SyntheticProfiles
+
+# Compare the approximate (graph) nearest neighbors backend against the exact one, on the population that the engine
+# loads (i.e. the same dataset that queries are run against), or on a population of synthetic profiles of any size (see
+# SyntheticProfiles), built in a temporary directory. The engine has a model per segment, so --largest-segment only
+# indexes the largest segment, the most that any one search does. For each set of graph parameters, reports how long the
+# index takes to build, the per-query search latency, and recall@k: the fraction of the k neighbors that the graph finds
+# that are no further away than the true kth nearest neighbor (as found by the exact model). This compares by distance
+# rather than by index, as there are many duplicates (i.e. ties) in the population, so the true k nearest neighbors
+# aren't unique (as in Engine.tune_nearest_neighbors_model).
+#
+# Queries are population rows with a little noise added, so that they aren't exactly on top of an indexed row.
+#
+# Usage: python -m benchmarks.nearest_neighbors [--synthetic-rows 100000] [--largest-segment] [--queries 200] [--k 50] [--ef-search 16 64 256] ...
+def parse_arguments():
+  parser = argparse.ArgumentParser(
+    allow_abbrev = False,
+    description = 'Recall and latency of the approximate nearest neighbors backend, compared to the exact one.'
+  )
+
+  parser.add_argument('--synthetic-rows', type = int, default = None, help = 'Build a population of this many synthetic profiles, rather than loading the engine\'s.')
+  parser.add_argument('--largest-segment', action = 'store_true', help = 'Only index the largest segment of the population.')
+  parser.add_argument('--rows', type = int, default = None, help = 'Only index this many rows of the population (default: all).')
+  parser.add_argument('--queries', type = int, default = 200, help = 'The number of queries to run (default: 200).')
+  parser.add_argument('--k', type = int, default = 50, help = 'The number of neighbors to find per query (default: 50).')
+  parser.add_argument('--max-neighbors', type = int, nargs = '+', default = [Matchmaker.GraphIndex.MAX_NEIGHBORS], help = 'Graph max_neighbors values to try.')
+  parser.add_argument('--ef-construction', type = int, nargs = '+', default = [Matchmaker.GraphIndex.EF_CONSTRUCTION], help = 'Graph ef_construction values to try.')
+  parser.add_argument('--ef-search', type = int, nargs = '+', default = [16, Matchmaker.GraphIndex.EF_SEARCH, 256], help = 'Graph ef_search values to try.')
+  parser.add_argument('--seed', type = int, default = 0, help = 'Seed for choosing and perturbing the queries (default: 0).')
+
+  return parser.parse_args()
+
+# Returns the latency (in milliseconds) and the distances of the neighbors found of each query.
+def time_queries(model, queries, k):
+  latencies = []
+  distances = []
+
+  for query in queries:
+    start = time.perf_counter()
+    query_distances, query_indices = model.kneighbors(query[np.newaxis, :], n_neighbors = k)
+    latencies.append(time.perf_counter() - start)
+    distances.append(query_distances[0])
+
+  return np.array(latencies) * 1000, np.array(distances)
+
+def recall(true_distances, found_distances):
+  return np.mean([
+    np.count_nonzero((row_found_distances <= row_true_distances[-1]) | np.isclose(row_found_distances, row_true_distances[-1])) / len(row_true_distances)
+    for row_true_distances, row_found_distances in zip(true_distances, found_distances)
+  ])
+
+def report(name, build_seconds, latencies, recall_at_k, k):
+  print(
+    f'{name:<64} build {build_seconds:8.2f}s   '
+    f'latency p50 {np.percentile(latencies, 50):7.3f}ms p95 {np.percentile(latencies, 95):7.3f}ms   '
+    f'recall@{k} {recall_at_k:.4f}'
+  )
+
+# The features of the population (see Engine.EngineState.population_features) of the engine, or of a new engine built from
+# the given number of synthetic profiles in a temporary working directory. Only the largest segment's, if asked for.
+def load_features(synthetic_rows, largest_segment):
+  if synthetic_rows is None:
+    return select_features(Matchmaker.Engine.get_engine().state, largest_segment)
+
+  working_directory = os.getcwd()
+
+  with tempfile.TemporaryDirectory() as temporary_directory:
+    os.mkdir(os.path.join(temporary_directory, 'data'))
+    os.mkdir(os.path.join(temporary_directory, 'models'))
+    SyntheticProfiles.generate_profiles_file(synthetic_rows, os.path.join(temporary_directory, 'data', 'okcupid_profiles_1.csv'))
+    os.chdir(temporary_directory)
+
+    try:
+      return select_features(Matchmaker.Engine.Engine().refresh().state, largest_segment)
+    finally:
+      os.chdir(working_directory)
+
+# A copy of the given engine state's features (which are memory-mapped from the population snapshot), or of only its
+# largest segment's.
+def select_features(engine_state, largest_segment):
+  features = engine_state.population_features
+
+  if largest_segment:
+    segment_model = max(engine_state.segment_models.values(), key = lambda segment_model: segment_model['stop'] - segment_model['start'])
+    features = features[segment_model['start']:segment_model['stop']]
+
+  return np.array(features)
+
+def main():
+  arguments = parse_arguments()
+
+  features = load_features(arguments.synthetic_rows, arguments.largest_segment)[:arguments.rows]
+
+  random_number_generator = np.random.default_rng(arguments.seed)
+  queries = features[random_number_generator.choice(len(features), size = arguments.queries, replace = len(features) < arguments.queries)]
+  queries = queries + random_number_generator.normal(scale = 0.05, size = queries.shape)
+
+  print(f'{len(features)} rows, {features.shape[1]} features, {len(queries)} queries, k = {arguments.k}\n')
+
+  start = time.perf_counter()
+  exact_model = NearestNeighbors(algorithm = 'auto', metric = 'minkowski', p = 2).fit(features)
+  exact_build_seconds = time.perf_counter() - start
+
+  exact_latencies, exact_distances = time_queries(exact_model, queries, arguments.k)
+  report('exact', exact_build_seconds, exact_latencies, 1.0, arguments.k)
+
+  for max_neighbors in arguments.max_neighbors:
+    for ef_construction in arguments.ef_construction:
+      start = time.perf_counter()
+      graph_index = Matchmaker.GraphIndex.GraphIndex(max_neighbors = max_neighbors, ef_construction = ef_construction).fit(features)
+      graph_build_seconds = time.perf_counter() - start
+
+      for ef_search in arguments.ef_search:
+        graph_index.ef_search = ef_search
+
+        graph_latencies, graph_distances = time_queries(graph_index, queries, arguments.k)
+        report(
+          f'graph max_neighbors={max_neighbors} ef_construction={ef_construction} ef_search={ef_search}',
+          graph_build_seconds,
+          graph_latencies,
+          recall(exact_distances, graph_distances),
+          arguments.k
+        )
+
+if __name__ == '__main__':
+  main()
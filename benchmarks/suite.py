@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import os.path
+import platform
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import sklearn
+
+import matchmaker as Matchmaker
+from . import synthetic_profiles as SyntheticProfiles
+
+# Benchmark the whole pipeline on synthetic profiles (see SyntheticProfiles) of a given size, or on the input data files
+# in a given directory, and report the results as JSON:
+# * load_seconds: Loading the input data files into a data frame.
+# * preprocess_seconds: Fitting new encoders to, and preprocessing, all of the input data at once.
+# * train_seconds: Building the population snapshot and training the models (i.e. --force-training).
+# * engine_load_seconds: Loading the engine from the saved model artifact and population snapshot.
+# * single_query_milliseconds: The latency (p50, p95 and p99) of matching one profile at a time.
+# * batch_query_milliseconds: The latency (p50, p95 and p99) of matching a batch of profiles at once.
+# * engine_bytes: The memory taken up by the engine's structures (see Engine.EngineState.memory_usage).
+# * peak_rss_bytes: The peak resident memory of this process.
+#
+# Queries are profiles from the input data, matched without the result cache, so every query searches. How many of them
+# found any matches is reported too (queries_with_matches), as queries without any candidates skip the search. Everything
+# is built in a temporary directory, so the model artifact and population snapshot in models/ are left alone.
+#
+# If given a baseline (the JSON results of an earlier run), every result is compared to it, and any that is worse by more
+# than the tolerance is flagged as a regression, exiting with a non-zero status.
+#
+# Usage: python -m benchmarks.suite [--rows 10000 | --data-directory data] [--output results.json] [--baseline baseline.json]
+def parse_arguments():
+  parser = argparse.ArgumentParser(
+    allow_abbrev = False,
+    description = 'Benchmark loading, preprocessing, training and querying, and compare the results to a baseline.'
+  )
+
+  parser.add_argument('--rows', type = int, default = 10000, help = 'The number of synthetic profiles to generate (default: 10000).')
+  parser.add_argument('--data-directory', default = None, help = 'Benchmark the input data files in this directory instead of synthetic profiles.')
+  parser.add_argument('--seed', type = int, default = 0, help = 'Seed for generating the profiles and choosing the queries (default: 0).')
+  parser.add_argument('--queries', type = int, default = 200, help = 'The number of single queries to run (default: 200).')
+  parser.add_argument('--batches', type = int, default = 20, help = 'The number of batch queries to run (default: 20).')
+  parser.add_argument('--batch-size', type = int, default = 50, help = 'The number of profiles per batch query (default: 50).')
+  parser.add_argument('--matches', type = int, default = 40, help = 'The number of matches to find per query (default: 40).')
+  parser.add_argument('--output', default = None, help = 'Write the results to this JSON file, as well as printing them.')
+  parser.add_argument('--baseline', default = None, help = 'Compare the results to the results in this JSON file.')
+  parser.add_argument(
+    '--tolerance',
+    type = float,
+    default = 0.2,
+    help = 'How much worse than the baseline (as a fraction) a result can be before it is a regression (default: 0.2).'
+  )
+
+  return parser.parse_args()
+
+# Run every benchmark in the given working directory (with data/ and models/ directories). Returns the results, and the
+# number of queries that found any matches.
+def run_benchmarks(arguments):
+  results = {}
+
+  start = time.perf_counter()
+  input_data = Matchmaker.DataPreprocessing.load_input_data()
+  results['load_seconds'] = time.perf_counter() - start
+
+  start = time.perf_counter()
+  Matchmaker.DataPreprocessing.preprocess_input_data(
+    input_data.copy(),
+    use_fitted_encoders = False,
+    encoders = Matchmaker.DataPreprocessing.build_encoders(use_fitted_encoders = False)
+  )
+  results['preprocess_seconds'] = time.perf_counter() - start
+
+  start = time.perf_counter()
+  Matchmaker.Engine.get_engine(force_training = True)
+  results['train_seconds'] = time.perf_counter() - start
+
+  start = time.perf_counter()
+  engine = Matchmaker.Engine.Engine().refresh()
+  results['engine_load_seconds'] = time.perf_counter() - start
+
+  # Queries in the same format as for Model.execute, with relationship_status (which was filtered on, and removed from,
+  # the input data) put back in, and with one language, as the form asks for (otherwise there are no candidates, and
+  # nothing is searched). That's the profile's first language, as consolidated in preprocessing, or english (which
+  # missing languages are filled in with) if it isn't one of SPEAKS_LANGUAGES.
+  random_number_generator = np.random.default_rng(arguments.seed)
+  input_data = input_data[Matchmaker.Model.INPUT_DATA_FRAME_COLUMNS].copy()
+  input_data['speaks'] = [
+    speaks if speaks in Matchmaker.DataPreprocessing.SPEAKS_LANGUAGES else 'english'
+    for speaks in Matchmaker.DataPreprocessing.consolidate_values(input_data[['speaks']].copy())['speaks']
+  ]
+  input_data = input_data.astype(object).where(input_data.notna(), None)
+  input_rows = [
+    input_row[:1] + ['single'] + input_row[1:]
+    for input_row in input_data.iloc[
+      random_number_generator.choice(len(input_data), size = arguments.queries + (arguments.batches * arguments.batch_size))
+    ].values.tolist()
+  ]
+
+  single_query_latencies = []
+  queries_with_matches = 0
+
+  for input_row in input_rows[:arguments.queries]:
+    Matchmaker.ResultCache.RESULT_CACHE.clear()
+
+    start = time.perf_counter()
+    input_data_frame, matches_data_frame = Matchmaker.Model.execute(input_row, force_training = False, matches_to_retrieve = arguments.matches)
+    single_query_latencies.append(time.perf_counter() - start)
+
+    queries_with_matches += int(len(matches_data_frame) > 0)
+
+  batch_query_latencies = []
+
+  for batch in range(arguments.batches):
+    batch_input_rows = input_rows[arguments.queries + (batch * arguments.batch_size):arguments.queries + ((batch + 1) * arguments.batch_size)]
+    Matchmaker.ResultCache.RESULT_CACHE.clear()
+
+    start = time.perf_counter()
+    batch_results = Matchmaker.Model.execute_batch(dict(enumerate(batch_input_rows)), matches_to_retrieve = arguments.matches)
+    batch_query_latencies.append(time.perf_counter() - start)
+
+    queries_with_matches += sum(len(matches_data_frame) > 0 for input_data_frame, matches_data_frame in batch_results.values())
+
+  results['single_query_milliseconds'] = summarize_latencies(single_query_latencies)
+  results['batch_query_milliseconds'] = summarize_latencies(batch_query_latencies)
+  results['engine_bytes'] = sum(engine.state.memory_usage().values())
+
+  # Kilobytes on Linux, but bytes on macOS.
+  results['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+  return results, queries_with_matches
+
+def summarize_latencies(latencies):
+  return {
+    f'p{percentile}': float(np.percentile(np.array(latencies) * 1000, percentile)) if len(latencies) > 0 else None
+    for percentile in [50, 95, 99]
+  }
+
+# Flatten nested results into one level, e.g. { 'single_query_milliseconds.p50': 1.5 }.
+def flatten_results(results, prefix = ''):
+  flattened_results = {}
+
+  for name, result in results.items():
+    if isinstance(result, dict):
+      flattened_results.update(flatten_results(result, prefix = f'{prefix}{name}.'))
+    else:
+      flattened_results[f'{prefix}{name}'] = result
+
+  return flattened_results
+
+# Compare the given results to the baseline's. Every result is a time or a size, so lower is better. Returns a list of
+# tuples of each result's name, baseline value, value, ratio (value over baseline value) and whether it is a regression.
+def compare_results(results, baseline_results, tolerance):
+  flattened_results = flatten_results(results)
+  flattened_baseline_results = flatten_results(baseline_results)
+
+  comparisons = []
+
+  for name, value in flattened_results.items():
+    baseline_value = flattened_baseline_results.get(name)
+
+    if (value is None) or (baseline_value is None) or (baseline_value <= 0):
+      continue
+
+    ratio = value / baseline_value
+    comparisons.append((name, baseline_value, value, ratio, ratio > (1 + tolerance)))
+
+  return comparisons
+
+def describe_environment():
+  return {
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'cpus': os.cpu_count(),
+    'numpy': np.__version__,
+    'pandas': pd.__version__,
+    'scikit-learn': sklearn.__version__,
+    'nearest_neighbors_backend': Matchmaker.Engine.NEAREST_NEIGHBORS_BACKEND,
+    'population_feature_dtype': Matchmaker.Engine.POPULATION_FEATURE_DTYPE
+  }
+
+def main():
+  arguments = parse_arguments()
+
+  working_directory = os.getcwd()
+  output_path = None if arguments.output is None else os.path.abspath(arguments.output)
+
+  with tempfile.TemporaryDirectory() as temporary_directory:
+    os.mkdir(os.path.join(temporary_directory, 'models'))
+
+    if arguments.data_directory is None:
+      os.mkdir(os.path.join(temporary_directory, 'data'))
+      SyntheticProfiles.generate_profiles_file(
+        arguments.rows,
+        os.path.join(temporary_directory, 'data', 'okcupid_profiles_1.csv'),
+        seed = arguments.seed
+      )
+    else:
+      os.symlink(os.path.abspath(arguments.data_directory), os.path.join(temporary_directory, 'data'))
+
+    os.chdir(temporary_directory)
+
+    try:
+      rows = len(Matchmaker.DataPreprocessing.load_input_data())
+      benchmark_results, queries_with_matches = run_benchmarks(arguments)
+    finally:
+      os.chdir(working_directory)
+
+  results = {
+    'dataset': 'synthetic' if arguments.data_directory is None else os.path.abspath(arguments.data_directory),
+    'rows': rows,
+    'environment': describe_environment(),
+    'queries': arguments.queries + (arguments.batches * arguments.batch_size),
+    'queries_with_matches': queries_with_matches,
+    'results': benchmark_results
+  }
+
+  print(json.dumps(results, indent = 2))
+
+  if output_path is not None:
+    with open(output_path, 'w') as output_file:
+      json.dump(results, output_file, indent = 2)
+
+  if arguments.baseline is not None:
+    with open(arguments.baseline) as baseline_file:
+      baseline = json.load(baseline_file)
+
+    comparisons = compare_results(results['results'], baseline['results'], arguments.tolerance)
+
+    print(f'\nCompared to {arguments.baseline} ({baseline["rows"]} rows):')
+
+    for name, baseline_value, value, ratio, is_regression in comparisons:
+      print(f'{name:<36} {baseline_value:>16.4f} {value:>16.4f} {ratio:>8.2f}x{"   REGRESSION" if is_regression else ""}')
+
+    if any(is_regression for name, baseline_value, value, ratio, is_regression in comparisons):
+      sys.exit(1)
+
+if __name__ == '__main__':
+  main()
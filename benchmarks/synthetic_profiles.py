@@ -0,0 +1,235 @@
+import argparse
+import os.path
+import numpy as np
+import pandas as pd
+
+import matchmaker as Matchmaker
+
+# Generate synthetic OkCupid profiles, in the same layout as the input data files (see
+# DataPreprocessing.INPUT_DATA_COLUMN_NAMES), so that benchmarks (and anything else that needs input data) can run
+# without the real dataset, at any size.
+#
+# Each feature that is used follows the distribution documented for it in DataPreprocessing.INPUT_DATA_COLUMNS_TO_USE
+# where there is one (e.g. the fraction of missing values, or the share of the most common values), and is otherwise
+# drawn uniformly from the values that preprocessing knows about (see DataPreprocessing.apply_value_consolidation_rules).
+# The columns that aren't used get a plausible value, or none (the essays).
+#
+# Usage: python -m benchmarks.synthetic_profiles --rows 100000 [--output data/okcupid_profiles_1.csv] [--seed 0]
+
+# Profiles are generated and written this many rows at a time, so that any number of rows can be generated without
+# holding them all in memory.
+GENERATION_CHUNK_SIZE = 100000
+
+# Minimum: 18, maximum: 110, mean: 32.3, std: 9.4
+AGE_MEAN = 32.3
+AGE_STANDARD_DEVIATION = 9.4
+AGE_RANGE = (18, 110)
+
+# Each feature's values, their weights (or uniform, if None), and the fraction of missing values.
+FEATURE_DISTRIBUTIONS = {
+  'relationship_status': (['single', 'seeing someone', 'available', 'married', 'unknown'], [93, 3, 3, 0.5, 0.02], 0),
+  'sex': (['m', 'f'], [59.8, 40.2], 0),
+  'sexual_orientation': (['straight', 'gay', 'bisexual'], [86, 9.3, 4.6], 0),
+  'body_type': (
+    [
+      'average', 'fit', 'athletic', 'thin', 'curvy', 'a little extra', 'skinny', 'full figured', 'jacked', 'used up',
+      'rather not say', 'overweight'
+    ],
+    None,
+    0.088
+  ),
+  'diet': (
+    [
+      'anything', 'mostly anything', 'strictly anything', 'vegetarian', 'mostly vegetarian', 'strictly vegetarian', 'vegan',
+      'mostly vegan', 'strictly vegan', 'kosher', 'mostly kosher', 'strictly kosher', 'halal', 'mostly halal',
+      'strictly halal', 'other', 'mostly other', 'strictly other'
+    ],
+    None,
+    0.41
+  ),
+  # Socially is by far the most common value, at 70%.
+  'drinks': (['socially', 'rarely', 'often', 'not at all', 'very often', 'desperately'], [70, 10, 9, 5.5, 0.8, 0.5], 0.05),
+  'drugs': (['never', 'sometimes', 'often'], None, 0.23),
+  'education': (
+    [
+      'dropped out of high school', 'working on high school', 'high school', 'graduated from high school',
+      'dropped out of two-year college', 'dropped out of college/university', 'dropped out of law school',
+      'dropped out of med school', 'two-year college', 'college/university', 'working on two-year college',
+      'working on college/university', 'law school', 'working on law school', 'working on med school', 'med school',
+      'graduated from two-year college', 'graduated from college/university', 'graduated from law school',
+      'dropped out of masters program', 'dropped out of ph.d program', 'masters program', 'working on masters program',
+      'working on ph.d program', 'ph.d program', 'graduated from masters program', 'graduated from ph.d program',
+      'graduated from med school', 'dropped out of space camp', 'working on space camp', 'space camp',
+      'graduated from space camp'
+    ],
+    None,
+    0.11
+  ),
+  # 81% of all non-missing values are white, asian, hispanic/latin or black.
+  'ethnicity': (
+    [
+      'white', 'asian', 'hispanic / latin', 'black', 'asian, white', 'hispanic / latin, white', 'other', 'indian',
+      'black, white', 'pacific islander', 'native american', 'middle eastern', 'white, other'
+    ],
+    [60, 10, 6, 5] + [19 / 9] * 9,
+    0.095
+  ),
+  'offspring': (
+    [
+      'wants kids', 'might want kids', 'doesn\'t have kids', 'doesn\'t have kids, but might want them',
+      'doesn\'t have kids, but wants them', 'doesn\'t want kids', 'doesn\'t have kids, and doesn\'t want any', 'has a kid',
+      'has a kid, but doesn\'t want more', 'has a kid, and might want more', 'has a kid, and wants more', 'has kids',
+      'has kids, but doesn\'t want more', 'has kids, and might want more', 'has kids, and wants more'
+    ],
+    None,
+    0.593
+  ),
+  'pets': (
+    [
+      'dislikes dogs and dislikes cats', 'dislikes cats', 'dislikes dogs', 'dislikes dogs and likes cats', 'likes cats',
+      'likes dogs', 'likes dogs and dislikes cats', 'likes dogs and likes cats', 'has cats', 'dislikes dogs and has cats',
+      'likes dogs and has cats', 'has dogs', 'has dogs and dislikes cats', 'has dogs and likes cats', 'has dogs and has cats'
+    ],
+    None,
+    0.332
+  ),
+  'religion': (
+    [
+      religion + seriousness
+      for religion in ['atheism', 'agnosticism', 'buddhism', 'hinduism', 'islam', 'judaism', 'christianity', 'catholicism', 'other']
+      for seriousness in ['', ' but not too serious about it', ' and somewhat serious about it', ' and very serious about it', ' and laughing about it']
+    ],
+    None,
+    0.337
+  ),
+  # 81% of all non-missing values are no.
+  'smokes': (['no', 'sometimes', 'when drinking', 'yes', 'trying to quit'], [81, 4.75, 4.75, 4.75, 4.75], 0.092),
+  'sign': (
+    [
+      'aries', 'taurus', 'gemini', 'cancer', 'leo', 'virgo', 'libra', 'scorpio', 'sagittarius', 'capricorn', 'aquarius',
+      'pisces'
+    ],
+    None,
+    0.18
+  ),
+  'job': (
+    [
+      'student', 'science / tech / engineering', 'computer / hardware / software', 'artistic / musical / writer',
+      'sales / marketing / biz dev', 'medicine / health', 'education / academia', 'executive / management',
+      'banking / financial / real estate', 'entertainment / media', 'law / legal services', 'other'
+    ],
+    None,
+    0.137
+  ),
+  'location': (['san francisco, california', 'oakland, california', 'berkeley, california', 'san mateo, california'], [78, 12, 7, 3], 0)
+}
+
+# 50 missing values (~0%). Almost everyone speaks english, most often first. Each profile speaks up to this many other
+# languages (of these, and a few that aren't consolidated), each with an optional fluency.
+SPEAKS_MISSING_FRACTION = 50 / 59946
+SPEAKS_ENGLISH_FIRST_FRACTION = 0.9
+SPEAKS_MAX_OTHER_LANGUAGES = 2
+SPEAKS_OTHER_LANGUAGES = ['spanish', 'french', 'mandarin', 'hindi', 'russian', 'japanese', 'portuguese', 'afrikaans', 'german', 'c++', 'chinese']
+SPEAKS_FLUENCIES = ['', ' (fluently)', ' (okay)', ' (poorly)']
+
+# 81% of all rows have a value of -1.
+INCOME_MISSING_FRACTION = 0.81
+INCOME_VALUES = [20000, 30000, 40000, 50000, 60000, 70000, 80000, 100000, 150000, 250000, 500000, 1000000]
+
+def parse_arguments():
+  parser = argparse.ArgumentParser(
+    allow_abbrev = False,
+    description = 'Generate synthetic OkCupid profiles in the same layout as the input data files.'
+  )
+
+  parser.add_argument('--rows', type = int, required = True, help = 'The number of profiles to generate.')
+  parser.add_argument(
+    '--output',
+    default = os.path.join('data/okcupid_profiles_synthetic.csv'),
+    help = 'The CSV file to write the profiles to (default: data/okcupid_profiles_synthetic.csv).'
+  )
+  parser.add_argument('--seed', type = int, default = 0, help = 'Seed for generating the profiles (default: 0).')
+
+  return parser.parse_args()
+
+# Write the given number of synthetic profiles to the given CSV file. The same seed always generates the same profiles.
+def generate_profiles_file(rows, output_path, seed = 0):
+  random_number_generator = np.random.default_rng(seed)
+  speaks_values, speaks_weights = build_speaks_values(random_number_generator)
+
+  for chunk_start in range(0, max(rows, 1), GENERATION_CHUNK_SIZE):
+    profiles = generate_profiles(
+      min(GENERATION_CHUNK_SIZE, rows - chunk_start),
+      random_number_generator,
+      speaks_values,
+      speaks_weights
+    )
+
+    profiles.to_csv(output_path, mode = 'w' if chunk_start == 0 else 'a', header = chunk_start == 0, index = False)
+
+# Returns a data frame of the given number of synthetic profiles, with the input data columns.
+def generate_profiles(rows, random_number_generator, speaks_values, speaks_weights):
+  profiles = {
+    feature: choose_values(random_number_generator, rows, values, weights, missing_fraction)
+    for feature, (values, weights, missing_fraction) in FEATURE_DISTRIBUTIONS.items()
+  }
+
+  profiles['age'] = np.clip(
+    np.rint(random_number_generator.normal(AGE_MEAN, AGE_STANDARD_DEVIATION, size = rows)),
+    *AGE_RANGE
+  ).astype(int)
+  profiles['speaks'] = choose_values(random_number_generator, rows, speaks_values, speaks_weights, SPEAKS_MISSING_FRACTION)
+  profiles['height'] = np.rint(random_number_generator.normal(68.3, 4, size = rows)).astype(int)
+  profiles['income'] = np.where(
+    random_number_generator.random(rows) < INCOME_MISSING_FRACTION,
+    -1,
+    random_number_generator.choice(INCOME_VALUES, size = rows)
+  )
+  profiles['last_online'] = '2012-06-29-12-00'
+
+  return pd.DataFrame(profiles).reindex(columns = Matchmaker.DataPreprocessing.INPUT_DATA_COLUMN_NAMES)
+
+# Draw the given number of values, with the given weights (or uniformly), and with the given fraction of them missing.
+def choose_values(random_number_generator, rows, values, weights, missing_fraction):
+  probabilities = None if weights is None else np.array(weights) / np.sum(weights)
+  chosen_values = random_number_generator.choice(np.array(values, dtype = object), size = rows, p = probabilities)
+
+  if missing_fraction > 0:
+    chosen_values[random_number_generator.random(rows) < missing_fraction] = None
+
+  return chosen_values
+
+# The distinct speaks values to choose from, and their weights: a pool of combinations of languages, most starting with
+# english.
+def build_speaks_values(random_number_generator, pool_size = 1000):
+  speaks_values = {}
+
+  for combination in range(pool_size):
+    other_languages = [
+      language + random_number_generator.choice(SPEAKS_FLUENCIES)
+      for language in random_number_generator.choice(
+        SPEAKS_OTHER_LANGUAGES,
+        size = random_number_generator.integers(SPEAKS_MAX_OTHER_LANGUAGES + 1),
+        replace = False
+      )
+    ]
+
+    if random_number_generator.random() < SPEAKS_ENGLISH_FIRST_FRACTION:
+      languages = ['english'] + other_languages
+    else:
+      languages = other_languages + ['english' + random_number_generator.choice(SPEAKS_FLUENCIES)]
+
+    speaks = ', '.join(languages)
+    speaks_values[speaks] = speaks_values.get(speaks, 0) + 1
+
+  return list(speaks_values.keys()), list(speaks_values.values())
+
+def main():
+  arguments = parse_arguments()
+
+  generate_profiles_file(arguments.rows, arguments.output, seed = arguments.seed)
+
+  print(f'Wrote {arguments.rows} synthetic profiles to {arguments.output}')
+
+if __name__ == '__main__':
+  main()
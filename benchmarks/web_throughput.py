@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+from urllib.parse import urlencode
+import numpy as np
+
+# Compare the throughput and latency of the synchronous matches views (as served by WSGI, with a thread per concurrent
+# request) to the async ones (as served by ASGI, with every request on the one event loop and the searches on the search
+# executor), at various numbers of concurrent clients.
+#
+# Requests go through Django's whole request handling (middleware, URL routing, the view, etc), by way of its test
+# clients, in this process, so what is compared is the two paths through the app rather than any particular web server.
+# The searches use the models in models/ (training if necessary), with the search executor configured as for the app
+# (see MATCHMAKER_SEARCH_* in web/settings.py). Each run starts with an empty result cache and uses the same profiles.
+#
+# Usage: python -m benchmarks.web_throughput [--requests 200] [--concurrency 1 8 32] [--endpoint api]
+def parse_arguments():
+  parser = argparse.ArgumentParser(
+    allow_abbrev = False,
+    description = 'Compare the throughput of the synchronous (WSGI) and async (ASGI) matches views.'
+  )
+
+  parser.add_argument('--requests', type = int, default = 200, help = 'The number of requests per run (default: 200).')
+  parser.add_argument('--concurrency', type = int, nargs = '+', default = [1, 8, 32], help = 'The numbers of concurrent clients to run with (default: 1 8 32).')
+  parser.add_argument('--endpoint', choices = ['api', 'html'], default = 'api', help = 'The JSON API or the HTML matches (default: api).')
+  parser.add_argument('--seed', type = int, default = 0, help = 'Seed for choosing the profiles (default: 0).')
+
+  return parser.parse_args()
+
+# Random, valid profile form data: a choice for every field, and an age.
+def build_profile_form_data(ProfileForm, count, seed):
+  random_number_generator = np.random.default_rng(seed)
+  profile_form_data = []
+
+  for _ in range(count):
+    data = { 'age': int(random_number_generator.integers(18, 60)), 'relationship_status': 'single' }
+
+    for name, field in ProfileForm.base_fields.items():
+      if name in data:
+        continue
+
+      choices = [value for value, label in field.choices if value != '']
+      data[name] = choices[random_number_generator.integers(len(choices))]
+
+    profile_form_data.append(data)
+
+  return profile_form_data
+
+def run_wsgi(Client, path, profile_form_data, concurrency):
+  # A client per thread.
+  clients = threading.local()
+
+  def post(data):
+    if not hasattr(clients, 'client'):
+      clients.client = Client()
+
+    start = time.perf_counter()
+    response = clients.client.post(path, data, secure = True)
+    return response.status_code, time.perf_counter() - start
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers = concurrency) as executor:
+    return list(executor.map(post, profile_form_data))
+
+def run_asgi(AsyncClient, path, profile_form_data, concurrency):
+  async def run():
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(data):
+      async with semaphore:
+        start = time.perf_counter()
+        response = await client.post(path, urlencode(data), content_type = 'application/x-www-form-urlencoded', secure = True)
+        return response.status_code, time.perf_counter() - start
+
+    return await asyncio.gather(*[post(data) for data in profile_form_data])
+
+  return asyncio.run(run())
+
+def main():
+  arguments = parse_arguments()
+
+  os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web.settings')
+  os.environ.setdefault('SECRET_KEY', 'benchmark')
+  os.environ['MATCHMAKER_WARM_UP'] = 'false'
+
+  import django
+  django.setup()
+
+  from django.conf import settings
+  from django.test import AsyncClient, Client
+  from django.test.utils import setup_test_environment
+  import matchmaker as Matchmaker
+  from web.matchmaker.forms import ProfileForm
+
+  # Allows the test clients' host. (Requests are made over HTTPS, so as not to be redirected to it.)
+  setup_test_environment()
+
+  Matchmaker.Model.warm_up(matches_to_retrieve = settings.MATCHMAKER_MATCHES_TO_RETRIEVE)
+
+  paths = {
+    'api': ('/api/matches', '/api/matches/async'),
+    'html': ('/matches', '/matches/async')
+  }[arguments.endpoint]
+
+  profile_form_data = build_profile_form_data(ProfileForm, arguments.requests, arguments.seed)
+
+  # Start the search executor (and its processes, if it has them) before timing anything.
+  run_asgi(AsyncClient, paths[1], profile_form_data[:1], 1)
+
+  print(f'{"path":<6} {"clients":>8} {"requests/s":>12} {"p50 ms":>10} {"p95 ms":>10} {"p99 ms":>10} {"errors":>8}')
+
+  for concurrency in arguments.concurrency:
+    for name, run in [('wsgi', lambda: run_wsgi(Client, paths[0], profile_form_data, concurrency)), ('asgi', lambda: run_asgi(AsyncClient, paths[1], profile_form_data, concurrency))]:
+      Matchmaker.ResultCache.RESULT_CACHE.clear()
+
+      start = time.perf_counter()
+      results = run()
+      seconds = time.perf_counter() - start
+
+      latencies = np.array([latency for status_code, latency in results]) * 1000
+      errors = sum(status_code != 200 for status_code, latency in results)
+
+      print(
+        f'{name:<6} {concurrency:>8} {len(results) / seconds:>12.1f} {np.percentile(latencies, 50):>10.1f} '
+        f'{np.percentile(latencies, 95):>10.1f} {np.percentile(latencies, 99):>10.1f} {errors:>8}'
+      )
+
+if __name__ == '__main__':
+  main()
@@ -1,3 +1,7 @@
+import os
+import os.path
+import tempfile
+
 from matchmaker import *
 
 def main():
@@ -29,10 +33,15 @@ def main():
   # Override single value for testing/debugging:
   # input_data[] = ''
 
+  if ARGUMENTS.profile:
+    profile(ARGUMENTS, input_data)
+    return
+
   input_data_frame, nearest_neighbors_data_frame = Model.execute(
     input_data = input_data,
     force_training = ARGUMENTS.force_training,
-    matches_to_retrieve = ARGUMENTS.matches_to_retrieve
+    matches_to_retrieve = ARGUMENTS.matches_to_retrieve,
+    tune_nearest_neighbors = ARGUMENTS.tune_nearest_neighbors
   )
 
   if len(nearest_neighbors_data_frame) == 0:
@@ -41,5 +50,46 @@ def main():
     print('Input data:\n', input_data_frame, '\n\n')
     print('Nearest Neighbors:\n', nearest_neighbors_data_frame)
 
+# Run the query repeatedly under the profiler (see Profiling.profile), clearing the result cache each time so that every
+# query searches. Training (if forced) and tuning happen in the first query. Given a data directory or a number of
+# synthetic profiles, the model is trained and queried in a temporary directory, so that models/ is left alone.
+def profile(ARGUMENTS, input_data):
+  output_directory = os.path.abspath(ARGUMENTS.profile_output)
+  working_directory = os.getcwd()
+
+  def run_query(call):
+    ResultCache.RESULT_CACHE.clear()
+
+    Model.execute(
+      input_data = input_data,
+      force_training = ARGUMENTS.force_training and (call == 0),
+      matches_to_retrieve = ARGUMENTS.matches_to_retrieve,
+      tune_nearest_neighbors = ARGUMENTS.tune_nearest_neighbors and (call == 0)
+    )
+
+  with tempfile.TemporaryDirectory() as temporary_directory:
+    if ARGUMENTS.profile_data_directory is not None:
+      os.mkdir(os.path.join(temporary_directory, 'models'))
+      os.symlink(os.path.abspath(ARGUMENTS.profile_data_directory), os.path.join(temporary_directory, 'data'))
+      os.chdir(temporary_directory)
+    elif ARGUMENTS.profile_synthetic_profiles is not None:
+      from benchmarks import synthetic_profiles as SyntheticProfiles
+
+      os.mkdir(os.path.join(temporary_directory, 'models'))
+      os.mkdir(os.path.join(temporary_directory, 'data'))
+      SyntheticProfiles.generate_profiles_file(
+        ARGUMENTS.profile_synthetic_profiles,
+        os.path.join(temporary_directory, 'data', 'okcupid_profiles_1.csv')
+      )
+      os.chdir(temporary_directory)
+
+    try:
+      report = Profiling.profile(run_query, ARGUMENTS.profile_queries, output_directory)
+    finally:
+      os.chdir(working_directory)
+
+  print(report)
+  print(f'\nWrote the profile statistics, collapsed stacks and report to {output_directory}.')
+
 if __name__ == '__main__':
   main()
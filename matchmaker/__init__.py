@@ -1,7 +1,15 @@
 from . import arguments as Arguments
+from . import coalescer as Coalescer
 from . import data_preprocessing as DataPreprocessing
+from . import engine as Engine
+from . import graph_index as GraphIndex
+from . import ingestion as Ingestion
 from . import match as Match
 from . import match_score_calculator as MatchScoreCalculator
+from . import metrics as Metrics
 from . import model as Model
+from . import population as Population
+from . import profiling as Profiling
+from . import result_cache as ResultCache
 from . import serialization as Serialization
 from . import utilities as Utilities
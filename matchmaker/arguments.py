@@ -22,4 +22,52 @@ def parse_arguments():
     help = 'Train the model even if a previously trained and saved model can be loaded and used (default: false).'
   )
 
+  parser.add_argument(
+    '--tune-nearest-neighbors',
+    action = 'store_true',
+    dest = 'tune_nearest_neighbors',
+    help = 'Benchmark the nearest neighbors algorithms again and train the model with the fastest (default: false).'
+  )
+
+  parser.add_argument(
+    '--profile',
+    action = 'store_true',
+    dest = 'profile',
+    help = 'Run the query repeatedly under cProfile and tracemalloc, reporting the time and memory allocated per function and stage (default: false).'
+  )
+
+  parser.add_argument(
+    '--profile-queries',
+    action = 'store',
+    default = 20,
+    type = int,
+    dest = 'profile_queries',
+    help = 'The number of queries to run when profiling; the first trains the model if --force-training is given (default: 20).'
+  )
+
+  parser.add_argument(
+    '--profile-output',
+    action = 'store',
+    default = 'profile',
+    dest = 'profile_output',
+    help = 'The directory to write the profile statistics, collapsed stacks and report to when profiling (default: profile).'
+  )
+
+  parser.add_argument(
+    '--profile-data-directory',
+    action = 'store',
+    default = None,
+    dest = 'profile_data_directory',
+    help = 'Profile with the input data files in this directory, training in a temporary directory (default: the data directory).'
+  )
+
+  parser.add_argument(
+    '--profile-synthetic-profiles',
+    action = 'store',
+    default = None,
+    type = int,
+    dest = 'profile_synthetic_profiles',
+    help = 'Profile with this many generated synthetic profiles, training in a temporary directory (default: the data directory).'
+  )
+
   return parser.parse_args()
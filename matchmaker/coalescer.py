@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+
+from . import metrics as Metrics
+
+# Opt in to coalescing queries with the MATCHMAKER_COALESCING environment variable (see Coalescer). Queries wait at most
+# MATCHMAKER_COALESCING_WINDOW seconds for others to join their batch, and batches are at most
+# MATCHMAKER_COALESCING_MAX_BATCH_SIZE queries.
+COALESCING_ENABLED = os.environ.get('MATCHMAKER_COALESCING', 'false') == 'true'
+COALESCING_WINDOW = float(os.environ.get('MATCHMAKER_COALESCING_WINDOW', 0.002))
+COALESCING_MAX_BATCH_SIZE = int(os.environ.get('MATCHMAKER_COALESCING_MAX_BATCH_SIZE', 32))
+
+# Queries that are run together, and their results (or the exception raised) once they have been.
+class Batch:
+  def __init__(self):
+    self.input_rows = []
+    self.arrival_times = []
+    self.full = threading.Event()
+    self.done = threading.Event()
+    self.results = None
+    self.exception = None
+
+# Coalesces concurrent queries (from different threads) into batches, so that they are run together by the batch
+# function (Model.execute_batch, which searches each set of direct lookups once for all of the batch's queries), rather
+# than one by one. The first query to arrive starts a batch and waits for up to the window for others to join it (or
+# for it to fill up), then runs it and hands each query its result. So a query waits at most the window longer than it
+# would have, and less if other queries arrive.
+#
+# Only queries for the same number of matches are run together. The sizes of the batches run, and how long queries
+# waited to be run, are recorded as metrics (see Metrics). Safe to share between threads.
+class Coalescer:
+  def __init__(self, batch_function, window, max_batch_size):
+    self.batch_function = batch_function
+    self.window = window
+    self.max_batch_size = max_batch_size
+
+    self.__open_batches = {}
+    self.__lock = threading.Lock()
+
+  # Returns the result of the batch function for the input data, once its batch has been run.
+  def execute(self, input_data, matches_to_retrieve):
+    arrival_time = time.perf_counter()
+
+    with self.__lock:
+      batch = self.__open_batches.get(matches_to_retrieve)
+      is_first = batch is None
+
+      if is_first:
+        batch = self.__open_batches[matches_to_retrieve] = Batch()
+
+      input_position = len(batch.input_rows)
+      batch.input_rows.append(input_data)
+      batch.arrival_times.append(arrival_time)
+
+      # Full batches are closed to new queries straight away, which start a new one.
+      if len(batch.input_rows) >= self.max_batch_size:
+        del self.__open_batches[matches_to_retrieve]
+        batch.full.set()
+
+    if is_first:
+      batch.full.wait(self.window)
+
+      with self.__lock:
+        if self.__open_batches.get(matches_to_retrieve) is batch:
+          del self.__open_batches[matches_to_retrieve]
+
+      self.__run(batch, matches_to_retrieve)
+    else:
+      batch.done.wait()
+
+    if batch.exception is not None:
+      raise batch.exception
+
+    return batch.results[input_position]
+
+  def __run(self, batch, matches_to_retrieve):
+    start = time.perf_counter()
+
+    Metrics.observe('matchmaker_coalesced_batch_size', len(batch.input_rows))
+
+    for arrival_time in batch.arrival_times:
+      Metrics.observe('matchmaker_coalescing_delay_seconds', start - arrival_time)
+
+    try:
+      batch.results = self.batch_function(dict(enumerate(batch.input_rows)), matches_to_retrieve = matches_to_retrieve)
+    except Exception as exception:
+      batch.exception = exception
+    finally:
+      batch.done.set()
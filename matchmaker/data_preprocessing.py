@@ -1,8 +1,10 @@
+from . import serialization as Serialization
 from . import utilities as Utilities
 
+import collections
 import glob
 import os.path
-import joblib
+import threading
 import numpy as np
 import pandas as pd
 import sklearn
@@ -11,7 +13,7 @@ from sklearn import preprocessing
 pd.set_option('display.min_rows', 25)
 
 # Relative from the project root directory.
-INPUT_DATA_FILE_PATHS = sorted(glob.glob(os.path.join('data/okcupid_profiles_*.csv')))
+INPUT_DATA_FILE_PATTERN = os.path.join('data/okcupid_profiles_*.csv')
 
 INPUT_DATA_COLUMN_NAMES = [
   'age', 'relationship_status', 'sex', 'sexual_orientation', 'body_type', 'diet', 'drinks', 'drugs', 'education',
@@ -184,8 +186,38 @@ INPUT_DATA_COLUMNS_TO_USE = [
 
 DIRECT_LOOKUP_FEATURES = ['sex', 'sexual_orientation', 'speaks']
 
-# Relative from the project root directory.
-FITTED_ENCODERS_DIRECTORY = 'models/encoders/'
+# The values of the direct lookup features, for encoding them once at ingest: sex and sexual_orientation as small integer
+# codes (their index in these lists), and speaks as a bitmask of the languages spoken (bit n set for the nth language in
+# this list), as it's a comma-separated list of languages, such as "english (fluently), spanish (poorly)".
+SEX_VALUES = ['m', 'f']
+SEXUAL_ORIENTATION_VALUES = ['straight', 'gay', 'bisexual']
+SPEAKS_LANGUAGES = ['afrikaans', 'english', 'french', 'hindi', 'japanese', 'mandarin_chinese', 'portuguese', 'russian', 'spanish']
+
+# Languages that go by a different name in the input data than in SPEAKS_LANGUAGES (which uses the consolidated names).
+SPEAKS_LANGUAGE_INPUT_NAMES = {
+  'mandarin_chinese': 'mandarin'
+}
+
+# The features that consolidate_values applies to, and its cache of each feature's distinct values to their
+# consolidated values.
+CONSOLIDATED_FEATURES = ['body_type', 'diet', 'drinks', 'drugs', 'education', 'ethnicity', 'offspring', 'pets', 'religion', 'smokes', 'speaks']
+CONSOLIDATED_VALUES_CACHE = {}
+
+# An immutable bundle of every encoder used in preprocessing. Bundles are passed explicitly through preprocessing, so a
+# request keeps using the same bundle from start to finish, even if the encoders are re-fitted or reloaded part way
+# through it. Only a new bundle's encoders are ever fitted, and only before it is shared.
+Encoders = collections.namedtuple(
+  'Encoders',
+  [
+    'age_scaler', 'body_type_scaler', 'diet_scaler', 'drinks_scaler', 'drugs_scaler', 'education_scaler', 'smokes_scaler',
+    'one_hot_encoder', 'ordinal_encoder'
+  ]
+)
+
+# The fitted encoders bundle shared by everything in this process, loaded from the model artifact (see Serialization)
+# the first time it is needed (see get_fitted_encoders), and replaced whenever the model artifact is loaded again.
+FITTED_ENCODERS = None
+FITTED_ENCODERS_LOCK = threading.Lock()
 
 # The wider the range, the more stretched out the scale, the greater the distance of variations, the less near/similar
 # variations are, the less likely they are to be a near neighbor. Therefore, use a wider range for continuous features
@@ -234,8 +266,9 @@ CATEGORICAL_FEATURE_WANT_CHILDREN_LABEL_ENCODINGS = { False: 0, True: 1 }
 CATEGORICAL_FEATURE_PETS_CATS_LABEL_ENCODINGS = { False: 0, True: 0.1 }
 CATEGORICAL_FEATURE_PETS_DOGS_LABEL_ENCODINGS = { False: 0, True: 0.1 }
 
-# Preserve the order of the features from the input data, after both applying and reversing one-hot encoding.
-# Note that the one-hot encoded features need to match the column name(s) both with and without the encoding.
+# Preserve the order of the features from the input data, both with one-hot encoding applied (preprocessed rows) and
+# without it (display rows). Note that the one-hot encoded features need to match the column name(s) both with and
+# without the encoding.
 FEATURE_SORT_ORDER = [
   r'^age$',
   r'^sex$',
@@ -255,23 +288,101 @@ FEATURE_SORT_ORDER = [
   r'^speaks$'
 ]
 
-def load_input_data():
-  input_data = pd.concat([pd.read_csv(
+# The attributes of a profile that are shown for it (such as in the input and matches data frames that Model.execute
+# returns): its consolidated, human-readable values, in the same order as FEATURE_SORT_ORDER.
+DISPLAY_ATTRIBUTES = [
+  'age', 'sex', 'sexual_orientation', 'body_type', 'diet', 'drinks', 'drugs', 'education', 'ethnicity', 'have_children',
+  'want_children', 'pets_cats', 'pets_dogs', 'religion', 'smokes', 'speaks'
+]
+
+# Everything in this module that the contents of the model artifact depend on: which features there are, how they are
+# encoded, and the order of them. A model artifact is only loaded if it was saved with the same schema (see
+# Serialization.load_model_artifact), so changing any of these means training again.
+MODEL_ARTIFACT_SCHEMA = {
+  'feature_sort_order': FEATURE_SORT_ORDER,
+  'direct_lookup_features': DIRECT_LOOKUP_FEATURES,
+  'categorical_features_to_one_hot_encode': CATEGORICAL_FEATURES_TO_ONE_HOT_ENCODE,
+  'categorical_features_to_ordinal_encode': CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE,
+  'categorical_feature_ordinalities': [
+    CATEGORICAL_FEATURE_BODY_TYPE_ORDINALITIES,
+    CATEGORICAL_FEATURE_DIET_ORDINALITIES,
+    CATEGORICAL_FEATURE_DRINKS_ORDINALITIES,
+    CATEGORICAL_FEATURE_DRUGS_ORDINALITIES,
+    CATEGORICAL_FEATURE_EDUCATION_ORDINALITIES,
+    CATEGORICAL_FEATURE_SMOKES_ORDINALITIES
+  ],
+  'encoders': list(Encoders._fields)
+}
+
+# Every input data file currently on disk. New files can be added at any time (see Population), so look every time.
+def find_input_data_file_paths():
+  return sorted(glob.glob(INPUT_DATA_FILE_PATTERN))
+
+# Load the given input data files (all of them by default), in order, as one data frame. Only for input data small
+# enough to hold in memory at once; see Ingestion for building the population from any amount of it.
+def load_input_data(input_data_file_paths = None):
+  if input_data_file_paths is None:
+    input_data_file_paths = find_input_data_file_paths()
+
+  input_data = pd.concat(
+    [read_input_data_file(input_data_file_path) for input_data_file_path in input_data_file_paths],
+    ignore_index = True
+  )
+
+  input_data = filter_input_data(input_data)
+
+  input_data = reindex_data_frame(input_data)
+
+  return input_data
+
+# Read only the columns used from an input data file: as one data frame, or as an iterator of data frames of up to
+# chunk_size rows each, if given.
+def read_input_data_file(input_data_file_path, chunk_size = None):
+  return pd.read_csv(
     input_data_file_path,
     header = 0,
     names = INPUT_DATA_COLUMN_NAMES,
-    usecols = INPUT_DATA_COLUMNS_TO_USE
-  ) for input_data_file_path in INPUT_DATA_FILE_PATHS], ignore_index = True)
+    usecols = INPUT_DATA_COLUMNS_TO_USE,
+    chunksize = chunk_size
+  )
 
+# Drop the rows of (raw) input data that aren't part of the population.
+def filter_input_data(input_data):
   input_data = filter_and_drop_relationship_status(input_data)
 
   # Drop the tiny number (50) of rows that don't have a value for this feature.
   input_data = input_data[input_data['speaks'].notna()]
 
-  input_data = reindex_data_frame(input_data)
-
   return input_data
 
+# Encode values as their index in the given list of possible values, or -1 if they aren't in it.
+def encode_direct_lookup_codes(series, values):
+  return pd.Categorical(series, categories = values).codes.astype(np.int8)
+
+# Encode each speaks value as a bitmask of the SPEAKS_LANGUAGES spoken. There are far fewer distinct values than rows, so
+# each distinct value is only parsed once.
+def encode_speaks_languages(speaks_series):
+  codes, distinct_speaks = pd.factorize(speaks_series.fillna(''))
+
+  distinct_speaks_languages = np.array(
+    [speaks_languages_bitmask(speaks) for speaks in distinct_speaks],
+    dtype = np.uint16
+  )
+
+  return distinct_speaks_languages[codes]
+
+def speaks_languages_bitmask(speaks):
+  # Drop the fluency in parentheses, e.g. "spanish (poorly)" to "spanish".
+  languages_spoken = { language.split('(')[0].strip() for language in speaks.split(',') }
+
+  bitmask = 0
+
+  for bit, language in enumerate(SPEAKS_LANGUAGES):
+    if SPEAKS_LANGUAGE_INPUT_NAMES.get(language, language) in languages_spoken:
+      bitmask |= (1 << bit)
+
+  return bitmask
+
 # After dropping rows, use this to re-index the data frame. Need to use this so that concatenation of dataframes can be
 # done cleanly. Make sure to preserve the "input" index.
 def reindex_data_frame(data_frame):
@@ -279,20 +390,24 @@ def reindex_data_frame(data_frame):
 
   return data_frame
 
-def preprocess_input_data(data_frame, use_fitted_encoders):
-  data_frame = reindex_data_frame(data_frame)
-  data_frame = consolidate_values(data_frame)
-  data_frame = split_and_drop_offspring(data_frame)
-  data_frame = split_and_drop_pets(data_frame)
+# Preprocess using the given encoders bundle. If no bundle is given, use the shared fitted encoders (if using fitted
+# encoders) or a new bundle (if not). When not using fitted encoders, the bundle is fitted to the data frame, ready to be
+# saved in a new model artifact.
+def preprocess_input_data(data_frame, use_fitted_encoders, encoders = None):
+  return encode_input_data(consolidate_input_data(data_frame), use_fitted_encoders, encoders = encoders)
 
-  build_encoders(use_fitted_encoders)
+# The steps of preprocessing after consolidate_input_data: encoding (and scaling) every feature. The consolidated data
+# frame is left as it is.
+def encode_input_data(data_frame, use_fitted_encoders, encoders = None):
+  if encoders is None:
+    encoders = build_encoders(use_fitted_encoders)
 
   # Apply one-hot encoding to categorical features.
   if use_fitted_encoders is False:
-    CATEGORICAL_FEATURES_ONE_HOT_ENCODER.fit(data_frame[CATEGORICAL_FEATURES_TO_ONE_HOT_ENCODE])
+    encoders.one_hot_encoder.fit(data_frame[CATEGORICAL_FEATURES_TO_ONE_HOT_ENCODE])
   categorical_features_one_hot_encoded_data_frame = pd.DataFrame(
-    CATEGORICAL_FEATURES_ONE_HOT_ENCODER.transform(data_frame[CATEGORICAL_FEATURES_TO_ONE_HOT_ENCODE]),
-    columns = CATEGORICAL_FEATURES_ONE_HOT_ENCODER.get_feature_names(input_features = CATEGORICAL_FEATURES_TO_ONE_HOT_ENCODE)
+    encoders.one_hot_encoder.transform(data_frame[CATEGORICAL_FEATURES_TO_ONE_HOT_ENCODE]),
+    columns = encoders.one_hot_encoder.get_feature_names(input_features = CATEGORICAL_FEATURES_TO_ONE_HOT_ENCODE)
   )
   data_frame = pd.concat(
     [data_frame, categorical_features_one_hot_encoded_data_frame],
@@ -304,8 +419,8 @@ def preprocess_input_data(data_frame, use_fitted_encoders):
 
   # Apply ordinal/positional encodings to categorical features.
   if use_fitted_encoders is False:
-    CATEGORICAL_FEATURES_ORDINAL_ENCODER.fit(data_frame[CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE])
-  data_frame[CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE] = CATEGORICAL_FEATURES_ORDINAL_ENCODER.transform(data_frame[CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE])
+    encoders.ordinal_encoder.fit(data_frame[CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE])
+  data_frame[CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE] = encoders.ordinal_encoder.transform(data_frame[CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE])
 
   # Apply label replacement encodings to categorical features.
   data_frame = data_frame.replace(
@@ -319,29 +434,43 @@ def preprocess_input_data(data_frame, use_fitted_encoders):
 
   # Linearly scale/normalize continuous features.
   if use_fitted_encoders is False:
-    CONTINUOUS_FEATURE_AGE_SCALER.fit(data_frame[['age']])
-    CONTINUOUS_FEATURE_BODY_TYPE_SCALER.fit(data_frame[['body_type']])
-    CONTINUOUS_FEATURE_DIET_SCALER.fit(data_frame[['diet']])
-    CONTINUOUS_FEATURE_DRINKS_SCALER.fit(data_frame[['drinks']])
-    CONTINUOUS_FEATURE_DRUGS_SCALER.fit(data_frame[['drugs']])
-    CONTINUOUS_FEATURE_EDUCATION_SCALER.fit(data_frame[['education']])
-    CONTINUOUS_FEATURE_SMOKES_SCALER.fit(data_frame[['smokes']])
-
-  data_frame[['age']] = CONTINUOUS_FEATURE_AGE_SCALER.transform(data_frame[['age']])
-  data_frame[['body_type']] = CONTINUOUS_FEATURE_BODY_TYPE_SCALER.transform(data_frame[['body_type']])
-  data_frame[['diet']] = CONTINUOUS_FEATURE_DIET_SCALER.transform(data_frame[['diet']])
-  data_frame[['drinks']] = CONTINUOUS_FEATURE_DRINKS_SCALER.transform(data_frame[['drinks']])
-  data_frame[['drugs']] = CONTINUOUS_FEATURE_DRUGS_SCALER.transform(data_frame[['drugs']])
-  data_frame[['education']] = CONTINUOUS_FEATURE_EDUCATION_SCALER.transform(data_frame[['education']])
-  data_frame[['smokes']] = CONTINUOUS_FEATURE_SMOKES_SCALER.transform(data_frame[['smokes']])
-
-  if use_fitted_encoders is False:
-    save_fitted_encoders()
+    encoders.age_scaler.fit(data_frame[['age']])
+    encoders.body_type_scaler.fit(data_frame[['body_type']])
+    encoders.diet_scaler.fit(data_frame[['diet']])
+    encoders.drinks_scaler.fit(data_frame[['drinks']])
+    encoders.drugs_scaler.fit(data_frame[['drugs']])
+    encoders.education_scaler.fit(data_frame[['education']])
+    encoders.smokes_scaler.fit(data_frame[['smokes']])
+
+  data_frame[['age']] = encoders.age_scaler.transform(data_frame[['age']])
+  data_frame[['body_type']] = encoders.body_type_scaler.transform(data_frame[['body_type']])
+  data_frame[['diet']] = encoders.diet_scaler.transform(data_frame[['diet']])
+  data_frame[['drinks']] = encoders.drinks_scaler.transform(data_frame[['drinks']])
+  data_frame[['drugs']] = encoders.drugs_scaler.transform(data_frame[['drugs']])
+  data_frame[['education']] = encoders.education_scaler.transform(data_frame[['education']])
+  data_frame[['smokes']] = encoders.smokes_scaler.transform(data_frame[['smokes']])
 
   data_frame = Utilities.sort_data_frame(data_frame)
 
   return data_frame
 
+# The steps of preprocessing before any encoding: consolidate values, and split up composite features.
+def consolidate_input_data(data_frame):
+  data_frame = reindex_data_frame(data_frame)
+  data_frame = consolidate_values(data_frame)
+  data_frame = split_and_drop_offspring(data_frame)
+  data_frame = split_and_drop_pets(data_frame)
+
+  return data_frame
+
+# The display attributes of consolidated input data (see consolidate_input_data): the consolidated values, before any
+# encoding, in order, with ages as float64.
+def build_display_data_frame(data_frame):
+  display_data_frame = data_frame[DISPLAY_ATTRIBUTES].copy()
+  display_data_frame['age'] = display_data_frame['age'].astype(np.float64)
+
+  return display_data_frame
+
 # Drop rows where relationship_status is unknown.
 # Also drop rows that are seeing someone or married. Get off OkCupid.
 # Then drop the column, as it is not needed outside of preprocessing.
@@ -357,7 +486,43 @@ def filter_and_drop_relationship_status(data_frame):
 #   to "curvy" and "skinny" to "thin". This is irreversible.
 # * Next, in a later method, apply encodings using Scikit's encoders to turn everything into machine-usable integers.
 #   This second step is reversible.
+#
+# The consolidation rules (see apply_value_consolidation_rules) are only ever applied to each distinct value of each
+# feature once, and the results are cached, as there are far fewer distinct values than rows. Every row is then
+# consolidated by looking its value up in the results.
 def consolidate_values(data_frame):
+  for feature in CONSOLIDATED_FEATURES:
+    if feature not in data_frame.columns:
+      continue
+
+    consolidated_values = CONSOLIDATED_VALUES_CACHE.setdefault(feature, {})
+
+    # Missing values get a code of -1, so put the consolidation of the missing value last.
+    codes, distinct_values = pd.factorize(data_frame[feature])
+    distinct_values = list(distinct_values) + [np.nan]
+
+    unconsolidated_values = [value for value in distinct_values if consolidated_values_cache_key(value) not in consolidated_values]
+
+    if len(unconsolidated_values) > 0:
+      newly_consolidated_values = apply_value_consolidation_rules(pd.DataFrame({ feature: pd.Series(unconsolidated_values, dtype = object) }))[feature]
+
+      for value, consolidated_value in zip(unconsolidated_values, newly_consolidated_values):
+        consolidated_values[consolidated_values_cache_key(value)] = consolidated_value
+
+    distinct_consolidated_values = np.array(
+      [consolidated_values[consolidated_values_cache_key(value)] for value in distinct_values],
+      dtype = object
+    )
+
+    data_frame[feature] = distinct_consolidated_values.take(codes)
+
+  return data_frame
+
+# Missing values (NaN) never equal each other, so can't be used as dict keys.
+def consolidated_values_cache_key(value):
+  return None if pd.isna(value) else value
+
+def apply_value_consolidation_rules(data_frame):
   # First do standard string replacements.
   data_frame = data_frame.replace(
     {
@@ -570,42 +735,24 @@ def apply_scaling_to_one_hot_encodings(data_frame):
 
   return data_frame
 
+# Returns the shared fitted encoders bundle if using fitted encoders, or a new (unfitted) bundle if not.
 def build_encoders(use_fitted_encoders):
-  global CONTINUOUS_FEATURE_AGE_SCALER
-  global CONTINUOUS_FEATURE_BODY_TYPE_SCALER
-  global CONTINUOUS_FEATURE_DIET_SCALER
-  global CONTINUOUS_FEATURE_DRINKS_SCALER
-  global CONTINUOUS_FEATURE_DRUGS_SCALER
-  global CONTINUOUS_FEATURE_EDUCATION_SCALER
-  global CONTINUOUS_FEATURE_SMOKES_SCALER
-  global CATEGORICAL_FEATURES_ONE_HOT_ENCODER
-  global CATEGORICAL_FEATURES_ORDINAL_ENCODER
-
   if use_fitted_encoders is True:
-    CONTINUOUS_FEATURE_AGE_SCALER = joblib.load(os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_age_scaler.skencoder'))
-    CONTINUOUS_FEATURE_BODY_TYPE_SCALER = joblib.load(os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_body_type_scaler.skencoder'))
-    CONTINUOUS_FEATURE_DIET_SCALER = joblib.load(os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_diet_scaler.skencoder'))
-    CONTINUOUS_FEATURE_DRINKS_SCALER = joblib.load(os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_drinks_scaler.skencoder'))
-    CONTINUOUS_FEATURE_DRUGS_SCALER = joblib.load(os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_drugs_scaler.skencoder'))
-    CONTINUOUS_FEATURE_EDUCATION_SCALER = joblib.load(os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_education_scaler.skencoder'))
-    CONTINUOUS_FEATURE_SMOKES_SCALER = joblib.load(os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_smokes_scaler.skencoder'))
-
-    CATEGORICAL_FEATURES_ONE_HOT_ENCODER = joblib.load(os.path.join(FITTED_ENCODERS_DIRECTORY, 'categorical_features_one_hot_encoder.skencoder'))
-
-    CATEGORICAL_FEATURES_ORDINAL_ENCODER = joblib.load(os.path.join(FITTED_ENCODERS_DIRECTORY, 'categorical_features_ordinal_encoder.skencoder'))
-  else:
-    # Initialize new encoders.
-    CONTINUOUS_FEATURE_AGE_SCALER = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_AGE_SCALER_RANGE)
-    CONTINUOUS_FEATURE_BODY_TYPE_SCALER = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_BODY_TYPE_SCALER_RANGE)
-    CONTINUOUS_FEATURE_DIET_SCALER = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_DIET_SCALER_RANGE)
-    CONTINUOUS_FEATURE_DRINKS_SCALER = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_DRINKS_SCALER_RANGE)
-    CONTINUOUS_FEATURE_DRUGS_SCALER = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_DRUGS_SCALER_RANGE)
-    CONTINUOUS_FEATURE_EDUCATION_SCALER = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_EDUCATION_SCALER_RANGE)
-    CONTINUOUS_FEATURE_SMOKES_SCALER = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_SMOKES_SCALER_RANGE)
-
-    CATEGORICAL_FEATURES_ONE_HOT_ENCODER = sklearn.preprocessing.OneHotEncoder(sparse = False)
-
-    CATEGORICAL_FEATURES_ORDINAL_ENCODER = sklearn.preprocessing.OrdinalEncoder(
+    return get_fitted_encoders()
+
+  # Initialize new encoders.
+  return Encoders(
+    age_scaler = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_AGE_SCALER_RANGE),
+    body_type_scaler = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_BODY_TYPE_SCALER_RANGE),
+    diet_scaler = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_DIET_SCALER_RANGE),
+    drinks_scaler = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_DRINKS_SCALER_RANGE),
+    drugs_scaler = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_DRUGS_SCALER_RANGE),
+    education_scaler = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_EDUCATION_SCALER_RANGE),
+    smokes_scaler = sklearn.preprocessing.MinMaxScaler(feature_range = CONTINUOUS_FEATURE_SMOKES_SCALER_RANGE),
+
+    one_hot_encoder = sklearn.preprocessing.OneHotEncoder(sparse = False),
+
+    ordinal_encoder = sklearn.preprocessing.OrdinalEncoder(
       categories = [
         CATEGORICAL_FEATURE_BODY_TYPE_ORDINALITIES,
         CATEGORICAL_FEATURE_DIET_ORDINALITIES,
@@ -616,16 +763,33 @@ def build_encoders(use_fitted_encoders):
       ],
       dtype = int
     )
+  )
+
+# Returns the shared fitted encoders bundle, loading it from the model artifact if this process hasn't yet.
+def get_fitted_encoders():
+  encoders = FITTED_ENCODERS
+
+  if encoders is None:
+    encoders = reload_fitted_encoders()
+
+  return encoders
+
+# Load the fitted encoders from the model artifact on disk (e.g. after it has been saved again by another process).
+def reload_fitted_encoders():
+  model_artifact = Serialization.load_model_artifact(MODEL_ARTIFACT_SCHEMA)
+
+  if model_artifact is None:
+    raise FileNotFoundError(f'There is no model artifact at {Serialization.MODEL_ARTIFACT_PATH} to load the fitted encoders from; train the model first.')
+
+  return load_fitted_encoders(model_artifact)
+
+# Build a bundle from the fitted encoders in the given (already loaded) model artifact, which becomes the shared bundle.
+def load_fitted_encoders(model_artifact):
+  global FITTED_ENCODERS
 
-def save_fitted_encoders():
-  joblib.dump(CONTINUOUS_FEATURE_AGE_SCALER, os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_age_scaler.skencoder'))
-  joblib.dump(CONTINUOUS_FEATURE_BODY_TYPE_SCALER, os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_body_type_scaler.skencoder'))
-  joblib.dump(CONTINUOUS_FEATURE_DIET_SCALER, os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_diet_scaler.skencoder'))
-  joblib.dump(CONTINUOUS_FEATURE_DRINKS_SCALER, os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_drinks_scaler.skencoder'))
-  joblib.dump(CONTINUOUS_FEATURE_DRUGS_SCALER, os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_drugs_scaler.skencoder'))
-  joblib.dump(CONTINUOUS_FEATURE_EDUCATION_SCALER, os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_education_scaler.skencoder'))
-  joblib.dump(CONTINUOUS_FEATURE_SMOKES_SCALER, os.path.join(FITTED_ENCODERS_DIRECTORY, 'continuous_feature_smokes_scaler.skencoder'))
+  encoders = Encoders(**model_artifact['encoders'])
 
-  joblib.dump(CATEGORICAL_FEATURES_ONE_HOT_ENCODER, os.path.join(FITTED_ENCODERS_DIRECTORY, 'categorical_features_one_hot_encoder.skencoder'))
+  with FITTED_ENCODERS_LOCK:
+    FITTED_ENCODERS = encoders
 
-  joblib.dump(CATEGORICAL_FEATURES_ORDINAL_ENCODER, os.path.join(FITTED_ENCODERS_DIRECTORY, 'categorical_features_ordinal_encoder.skencoder'))
+  return encoders
@@ -0,0 +1,808 @@
+import os.path
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import NearestNeighbors
+
+from . import data_preprocessing as DataPreprocessing
+from . import graph_index as GraphIndex
+from . import ingestion as Ingestion
+from . import metrics as Metrics
+from . import serialization as Serialization
+from . import utilities as Utilities
+
+# The features that the population is segmented by. Every direct lookup on these is an exact match against a handful of
+# values, so can be resolved to a set of segments before searching rather than by filtering the search results.
+SEGMENT_FEATURES = ['sex', 'sexual_orientation']
+
+# Filtered searches (see search_segment) start by probing for this many times the number of neighbors wanted, growing by
+# this factor each time too few candidates come back, until the probe would cover this fraction of the segment, at which
+# point the distance to every candidate is calculated instead.
+INITIAL_PROBE_OVERSAMPLING = 5
+PROBE_GROWTH_FACTOR = 2
+BRUTE_FORCE_PROBE_FRACTION = 0.25
+
+# Which kind of model to search each segment with:
+# * exact: scikit-learn's NearestNeighbors, which always finds the true nearest neighbors.
+# * graph: an approximate index (see GraphIndex), which is much faster to search large populations, at the cost of
+#   sometimes missing some of the true nearest neighbors. Built with the given parameters; ef_search can be changed
+#   without training again.
+# Opt in to the graph backend with the MATCHMAKER_NEAREST_NEIGHBORS_BACKEND environment variable. The model artifact
+# records which backend its models are, and is trained again if that isn't the one chosen here.
+NEAREST_NEIGHBORS_BACKENDS = ['exact', 'graph']
+NEAREST_NEIGHBORS_BACKEND = os.environ.get('MATCHMAKER_NEAREST_NEIGHBORS_BACKEND', 'exact')
+GRAPH_INDEX_PARAMETERS = {
+  'max_neighbors': GraphIndex.MAX_NEIGHBORS,
+  'ef_construction': GraphIndex.EF_CONSTRUCTION,
+  'ef_search': GraphIndex.EF_SEARCH
+}
+
+# How the population's feature matrix is stored (in the population snapshot and deltas), and so what the models are
+# trained on and search:
+# * float64: as preprocessed.
+# * float32: half the size, as are the models' own copies of it (apart from the exact backend's trees, which scikit-learn
+#   always builds as float64). The matches and their scores are unchanged, as the matches' features are restored to
+#   exactly their float64 values (see Ingestion.build_feature_value_tables) before they are scored; only their order
+#   could differ, between candidates that are all but the same distance away.
+# Opt in to float32 with the MATCHMAKER_POPULATION_FEATURE_DTYPE environment variable. The model artifact records which
+# dtype its models were trained on, and is trained again if that isn't the one chosen here.
+POPULATION_FEATURE_DTYPES = ['float64', 'float32']
+POPULATION_FEATURE_DTYPE = os.environ.get('MATCHMAKER_POPULATION_FEATURE_DTYPE', 'float64')
+
+# The exact backend's algorithm and leaf size are chosen by benchmarking each of these candidates when training (see
+# tune_nearest_neighbors_model): searching for this many neighbors (a typical probe) for this many queries, held out of
+# the population. The fastest candidate that finds at least this fraction of the true nearest neighbors wins.
+NEAREST_NEIGHBORS_TUNING_CANDIDATES = [{ 'algorithm': 'brute', 'leaf_size': 30 }] + [
+  { 'algorithm': algorithm, 'leaf_size': leaf_size } for algorithm in ['kd_tree', 'ball_tree'] for leaf_size in [10, 30, 100]
+]
+NEAREST_NEIGHBORS_TUNING_NEIGHBORS = 200
+NEAREST_NEIGHBORS_TUNING_QUERIES = 200
+NEAREST_NEIGHBORS_TUNING_MINIMUM_RECALL = 1.0
+
+# Once the population deltas (which are searched by brute force) or the rows removed since the snapshot was built make up
+# more than this fraction of the snapshot, the population is compacted: the snapshot is built again without the removed
+# rows and with the deltas' rows, and the models trained again (with the same encoders).
+POPULATION_COMPACTION_THRESHOLD = 0.1
+
+# Long-lived, process-resident holder of everything that is needed to answer match queries: the population's direct
+# lookup values, the population preprocessed into a feature matrix, and the fitted model and encoders. These are loaded
+# (or trained) once, and then only loaded again when the files that they were loaded from change on disk, rather than on
+# every query.
+#
+# The feature matrix is memory-mapped from the population snapshot, and the models from the model artifact (see
+# Serialization), so that every process serving queries shares the one copy of them in the OS page cache.
+#
+# Rather than one model of the entire population, there is one per segment of the population (see SEGMENT_FEATURES), so
+# that queries only search among the segments that are compatible with the input. The snapshot is sorted by segment, so
+# each segment is a contiguous slice of the feature matrix.
+#
+# The population can also change without building the snapshot again, as recorded in the population manifest (see
+# Serialization): new input data files (e.g. profiles added with Population.add_profiles) are preprocessed with the
+# fitted encoders and saved as population deltas, which are appended to the population after the snapshot's rows and
+# searched by brute force, and removed rows are kept but are never candidates. Once there are too many of either, the
+# population is compacted (see POPULATION_COMPACTION_THRESHOLD).
+class Engine:
+  def __init__(self):
+    self.state = None
+
+    self.__lock = threading.Lock()
+
+  def is_loaded(self):
+    return self.state is not None
+
+  # Make sure that the engine is loaded and up to date with the files on disk. Cheap to call on every query when nothing
+  # has changed, as it only stats the source files.
+  #
+  # If tuning the nearest neighbors models, they are trained again with the backend benchmarked again.
+  def refresh(self, force_training = False, tune_nearest_neighbors = False):
+    with self.__lock:
+      if force_training or tune_nearest_neighbors or (self.state is None) or (self.state.source_fingerprint != build_source_fingerprint()):
+        self.__load(force_training, tune_nearest_neighbors)
+
+    return self
+
+  # Loading builds a whole new state, which is then published with a single assignment, so queries that are still using
+  # the previous state (see EngineState) are unaffected.
+  def __load(self, force_training, tune_nearest_neighbors):
+    # Hold the population lock while deciding whether to build, ingest or compact (and doing so), so that only one
+    # process ever does, and the others then load the result.
+    with Serialization.lock_population():
+      model_artifact, population_snapshot, population_manifest = load_population(force_training, tune_nearest_neighbors)
+
+      population_deltas = [
+        Serialization.load_population_snapshot(population_delta['path'])
+        for population_delta in population_manifest['deltas']
+      ]
+
+    self.state = EngineState(model_artifact, population_snapshot, population_deltas, population_manifest)
+
+# Everything loaded from one model artifact, population snapshot (and its deltas) and population manifest, and the
+# queries against them. A query reads the engine's state once (see Model.execute_batch) and uses only that, so every step
+# of it sees the same population, models and encoders, even if the engine is loaded again part way through it. Nothing
+# is changed once built, apart from the cache of candidates masks, which are derived from the rest.
+class EngineState:
+  def __init__(self, model_artifact, population_snapshot, population_deltas, population_manifest):
+    # Fingerprint after saving anything, so that the engine doesn't immediately consider its own output to be a change.
+    self.source_fingerprint = build_source_fingerprint()
+
+    # Every query against this engine uses the same encoders bundle that the population snapshot was preprocessed with.
+    self.encoders = DataPreprocessing.load_fitted_encoders(model_artifact)
+
+    metadata, snapshot_sections = population_snapshot
+
+    # The snapshot's sections with the deltas' appended, except for the features, which are kept apart so that the
+    # snapshot's don't need to be copied out of the memory map (see fetch_population_features).
+    sections = {
+      name: np.concatenate([section] + [delta_sections[name] for delta_metadata, delta_sections in population_deltas])
+      for name, section in snapshot_sections.items()
+      if name != 'features'
+    } if len(population_deltas) > 0 else snapshot_sections
+
+    # One boolean array over the population per direct lookup value, for building candidates masks from.
+    self.__direct_lookup_masks = {
+      'sex': { sex: (sections['sex'] == code) for code, sex in enumerate(DataPreprocessing.SEX_VALUES) },
+      'sexual_orientation': {
+        sexual_orientation: (sections['sexual_orientation'] == code)
+        for code, sexual_orientation in enumerate(DataPreprocessing.SEXUAL_ORIENTATION_VALUES)
+      },
+      'speaks': {
+        language: ((sections['speaks_languages'] & (1 << bit)) != 0)
+        for bit, language in enumerate(DataPreprocessing.SPEAKS_LANGUAGES)
+      }
+    }
+    self.__candidates_masks = {}
+
+    # Restore the features that are fetched to float64 with the distinct values of every feature in the snapshot and
+    # deltas.
+    if model_artifact['population_feature_dtype'] == 'float64':
+      self.__feature_value_tables = None
+    else:
+      self.__feature_value_tables = Ingestion.build_feature_value_tables(
+        Ingestion.merge_feature_values(
+          [metadata['feature_values']] + [delta_metadata['feature_values'] for delta_metadata, delta_sections in population_deltas]
+        ),
+        model_artifact['population_feature_dtype']
+      )
+
+    if len(population_manifest['removed_row_ids']) > 0:
+      self.__alive_mask = ~np.isin(sections['row_ids'], population_manifest['removed_row_ids'])
+      self.__alive_mask.flags.writeable = False
+    else:
+      self.__alive_mask = None
+
+    self.population_row_ids = sections['row_ids']
+    self.population_sex_codes = sections['sex']
+    self.population_sexual_orientation_codes = sections['sexual_orientation']
+    self.population_features = snapshot_sections['features']
+    self.population_consolidated_speaks = sections['consolidated_speaks']
+    self.population_display_sections = {
+      attribute: sections[f'display_{attribute}'] for attribute in Ingestion.DISPLAY_SECTION_ATTRIBUTES
+    }
+    self.__display_attribute_values = {
+      attribute: np.array(values, dtype = object)
+      for attribute, values in Ingestion.build_display_attribute_values(self.encoders).items()
+    }
+    self.population_delta_features = np.concatenate(
+      [np.empty((0, self.population_features.shape[1]), dtype = self.population_features.dtype)] +
+      [delta_sections['features'] for delta_metadata, delta_sections in population_deltas]
+    )
+    self.population_version = population_manifest['revision']
+    self.feature_columns = model_artifact['feature_columns']
+    self.model_artifact_id = model_artifact['id']
+    self.segment_models = model_artifact['segment_models']
+
+    if NEAREST_NEIGHBORS_BACKEND == 'graph':
+      for segment_model in self.segment_models.values():
+        segment_model['nearest_neighbors_model'].ef_search = GRAPH_INDEX_PARAMETERS['ef_search']
+
+  # Build a data frame of the given population rows (by index, not label) in the same shape as the output of
+  # DataPreprocessing.preprocess_input_data.
+  def fetch_preprocessed_population_rows(self, population_indices):
+    data_frame = pd.DataFrame(
+      self.fetch_population_features(population_indices),
+      columns = self.feature_columns,
+      index = self.population_row_ids[population_indices]
+    )
+
+    data_frame['sex'] = np.array(DataPreprocessing.SEX_VALUES)[self.population_sex_codes[population_indices]]
+    data_frame['sexual_orientation'] = np.array(DataPreprocessing.SEXUAL_ORIENTATION_VALUES)[self.population_sexual_orientation_codes[population_indices]]
+    data_frame['speaks'] = np.char.decode(self.population_consolidated_speaks[population_indices], 'utf-8')
+
+    return Utilities.sort_data_frame(data_frame)
+
+  # Build a data frame of the display attributes (see DataPreprocessing.DISPLAY_ATTRIBUTES) of the given population rows
+  # (by index, not label), labelled by their row ids. Looked up from the display sections stored at ingest (see
+  # Ingestion.build_display_sections), in the same shape as the consolidated input data (see
+  # DataPreprocessing.build_display_data_frame).
+  def fetch_population_display_rows(self, population_indices):
+    display_columns = {
+      'sex': np.array(DataPreprocessing.SEX_VALUES, dtype = object)[self.population_sex_codes[population_indices]],
+      'sexual_orientation': np.array(DataPreprocessing.SEXUAL_ORIENTATION_VALUES, dtype = object)[self.population_sexual_orientation_codes[population_indices]],
+      'speaks': np.char.decode(self.population_consolidated_speaks[population_indices], 'utf-8').astype(object)
+    }
+
+    for attribute in Ingestion.DISPLAY_SECTION_ATTRIBUTES:
+      display_section = self.population_display_sections[attribute][population_indices]
+
+      if attribute == 'age':
+        display_columns[attribute] = display_section.astype(np.float64)
+      elif attribute in Ingestion.DISPLAY_FLAG_ATTRIBUTES:
+        display_columns[attribute] = display_section
+      else:
+        display_columns[attribute] = self.__display_attribute_values[attribute][display_section]
+
+    return pd.DataFrame(
+      { attribute: display_columns[attribute] for attribute in DataPreprocessing.DISPLAY_ATTRIBUTES },
+      index = pd.Index(self.population_row_ids[population_indices], name = 'row_id')
+    )
+
+  # The features of the given population rows (by index, not label), whether they are in the snapshot or a delta, as
+  # the float64 values that they were preprocessed into (whatever the population feature dtype).
+  def fetch_population_features(self, population_indices):
+    population_indices = np.asarray(population_indices, dtype = np.int64)
+    snapshot_size = len(self.population_features)
+
+    if (len(population_indices) == 0) or (population_indices.max() < snapshot_size):
+      features = self.population_features[population_indices]
+    else:
+      features = np.empty((len(population_indices), self.population_features.shape[1]), dtype = self.population_features.dtype)
+
+      in_snapshot = population_indices < snapshot_size
+      features[in_snapshot] = self.population_features[population_indices[in_snapshot]]
+      features[~in_snapshot] = self.population_delta_features[population_indices[~in_snapshot] - snapshot_size]
+
+    if self.__feature_value_tables is not None:
+      return Ingestion.restore_features(features, self.__feature_value_tables)
+
+    return features
+
+  # Returns a (read-only) boolean array over the population of whether each row is within the given segments, speaks the
+  # given language and hasn't been removed. Built by combining the precomputed per-value masks, and cached, as there are
+  # only a handful of possible combinations.
+  def build_candidates_mask(self, segments, language):
+    candidates_mask_key = (tuple(segments), language)
+    candidates_mask = self.__candidates_masks.get(candidates_mask_key)
+
+    if candidates_mask is None:
+      candidates_mask = self.__build_segments_mask(segments)
+
+      if language in self.__direct_lookup_masks['speaks']:
+        candidates_mask &= self.__direct_lookup_masks['speaks'][language]
+      else:
+        candidates_mask[:] = False
+
+      if self.__alive_mask is not None:
+        candidates_mask &= self.__alive_mask
+
+      candidates_mask.flags.writeable = False
+      self.__candidates_masks[candidates_mask_key] = candidates_mask
+
+    return candidates_mask
+
+  # Find the nearest neighbors to each row of the given features within each of the given population segments. Returns
+  # a list with, for each row, an array of population indices (not labels) sorted by distance in ascending order, merged
+  # across the segments.
+  #
+  # If a candidates mask (a boolean array over the population) is given, only rows that are candidates are returned, and
+  # the search is exact: it returns the nearest n_neighbors candidates, or all of them if there are fewer than that.
+  # Removed rows are never returned either way.
+  def kneighbors(self, features, segments, n_neighbors, candidates_mask = None):
+    distances = [[] for row in range(len(features))]
+    population_indices = [[] for row in range(len(features))]
+
+    # Search as the population feature dtype, so that the models don't convert the population to the features' dtype.
+    features = np.asarray(features, dtype = self.population_features.dtype)
+
+    if candidates_mask is None:
+      candidates_mask = self.__alive_mask
+
+    for segment in segments:
+      segment_model = self.segment_models.get(segment)
+
+      if segment_model is None:
+        continue
+
+      start = segment_model['start']
+      stop = segment_model['stop']
+
+      segment_results = search_segment(
+        segment_model['nearest_neighbors_model'],
+        self.population_features[start:stop],
+        features,
+        n_neighbors,
+        None if candidates_mask is None else candidates_mask[start:stop]
+      )
+
+      for row, (segment_distances, segment_indices) in enumerate(segment_results):
+        distances[row].append(segment_distances)
+        population_indices[row].append(segment_indices + start)
+
+    # The deltas have no models, so calculate the distance to each of their rows within the segments instead.
+    if len(self.population_delta_features) > 0:
+      snapshot_size = len(self.population_features)
+
+      delta_candidates_mask = self.__build_segments_mask(segments)[snapshot_size:]
+      if candidates_mask is not None:
+        delta_candidates_mask &= candidates_mask[snapshot_size:]
+
+      delta_indices = np.flatnonzero(delta_candidates_mask)
+
+      if len(delta_indices) > 0:
+        delta_features = self.population_delta_features[delta_indices]
+
+        for row, row_features in enumerate(features):
+          delta_distances = np.sqrt(((delta_features - row_features) ** 2).sum(axis = 1))
+          nearest_first = np.argsort(delta_distances, kind = 'stable')[:n_neighbors]
+
+          distances[row].append(delta_distances[nearest_first])
+          population_indices[row].append(delta_indices[nearest_first] + snapshot_size)
+
+    return [
+      merge_nearest_neighbors(row_distances, row_population_indices, n_neighbors)
+      for row_distances, row_population_indices in zip(distances, population_indices)
+    ]
+
+  # The number of bytes of memory (or memory-mapped files) taken up by each of the engine's structures, by name.
+  def memory_usage(self):
+    return {
+      'population_features': self.population_features.nbytes,
+      'population_delta_features': self.population_delta_features.nbytes,
+      'population_row_ids': self.population_row_ids.nbytes,
+      'population_sex_codes': self.population_sex_codes.nbytes,
+      'population_sexual_orientation_codes': self.population_sexual_orientation_codes.nbytes,
+      'population_consolidated_speaks': self.population_consolidated_speaks.nbytes,
+      'population_display_sections': sum(display_section.nbytes for display_section in self.population_display_sections.values()),
+      'direct_lookup_masks': sum(
+        direct_lookup_mask.nbytes
+        for direct_lookup_value_masks in self.__direct_lookup_masks.values()
+        for direct_lookup_mask in direct_lookup_value_masks.values()
+      ),
+      'candidates_masks': sum(candidates_mask.nbytes for candidates_mask in self.__candidates_masks.values()),
+      'alive_mask': 0 if self.__alive_mask is None else self.__alive_mask.nbytes,
+      'segment_models': sum(
+        measure_nearest_neighbors_model(segment_model['nearest_neighbors_model'])
+        for segment_model in self.segment_models.values()
+      )
+    }
+
+  # A boolean array over the population of whether each row is within the given segments.
+  def __build_segments_mask(self, segments):
+    segments_mask = np.zeros(len(self.population_row_ids), dtype = bool)
+
+    for sex, sexual_orientation in segments:
+      segments_mask |= self.__direct_lookup_masks['sex'][sex] & self.__direct_lookup_masks['sexual_orientation'][sexual_orientation]
+
+    return segments_mask
+
+# Returns the model artifact, population snapshot and population manifest to load the engine from. Builds the snapshot
+# (training and saving a new model artifact) if there isn't a usable one, ingests any new input data files as a delta,
+# and compacts the population if it is due. Must be called while holding the population lock.
+def load_population(force_training, tune_nearest_neighbors):
+  model_artifact = None
+  population_snapshot = None
+  population_manifest = Serialization.load_population_manifest()
+
+  if not force_training:
+    model_artifact = Serialization.load_model_artifact(DataPreprocessing.MODEL_ARTIFACT_SCHEMA)
+
+  # Keep the fitted encoders, but train the models again if they aren't the chosen backend or population feature dtype
+  # (or are being tuned).
+  models_stale = (model_artifact is not None) and (
+    tune_nearest_neighbors or
+    (model_artifact['nearest_neighbors_backend'] != NEAREST_NEIGHBORS_BACKEND) or
+    (model_artifact['population_feature_dtype'] != POPULATION_FEATURE_DTYPE)
+  )
+
+  if (model_artifact is not None) and (not models_stale) and (not is_population_manifest_stale(population_manifest, model_artifact)):
+    population_snapshot = Serialization.load_population_snapshot()
+
+  # The snapshot's segments must be the ones that the model artifact's models were trained on.
+  if (population_snapshot is not None) and (population_snapshot[0]['model_artifact_id'] != model_artifact['id']):
+    population_snapshot = None
+
+  if population_snapshot is None:
+    build_population_snapshot(model_artifact, tune_nearest_neighbors, population_manifest)
+    return load_population(force_training = False, tune_nearest_neighbors = False)
+
+  processed_input_data_file_paths = [input_data_file['path'] for input_data_file in population_manifest['input_data_files']]
+  new_input_data_file_paths = [
+    input_data_file_path for input_data_file_path in DataPreprocessing.find_input_data_file_paths()
+    if input_data_file_path not in processed_input_data_file_paths
+  ]
+
+  if len(new_input_data_file_paths) > 0:
+    population_manifest = ingest_population_delta(
+      DataPreprocessing.load_input_data(new_input_data_file_paths),
+      model_artifact,
+      population_manifest,
+      input_data_file_paths = new_input_data_file_paths
+    )
+
+  if is_population_compaction_due(population_manifest):
+    build_population_snapshot(model_artifact, population_manifest = population_manifest)
+    return load_population(force_training = False, tune_nearest_neighbors = False)
+
+  return model_artifact, population_snapshot, population_manifest
+
+# Load and preprocess the population from the input data, train the segment models on it, and save them as a new model
+# artifact along with the result as the population snapshot, and a new population manifest. If there is no (previous)
+# model artifact given, the encoders are fitted and the nearest neighbors models tuned too, otherwise its fitted encoders
+# and tuning are used (unless asked to tune again).
+#
+# If there is a (previous) population manifest given, and none of the input data files that it records have changed
+# since, the population is compacted: the input data files are loaded in the same order as before, so that every row
+# keeps its row ID, and the removed rows are left out. Otherwise, the population is built afresh from every input data
+# file.
+def build_population_snapshot(model_artifact, tune_nearest_neighbors = False, population_manifest = None):
+  if POPULATION_FEATURE_DTYPE not in POPULATION_FEATURE_DTYPES:
+    raise ValueError(f'Unknown population feature dtype {POPULATION_FEATURE_DTYPE}; expected one of {POPULATION_FEATURE_DTYPES}.')
+
+  if (population_manifest is None) or are_input_data_files_changed(population_manifest):
+    input_data_file_paths = DataPreprocessing.find_input_data_file_paths()
+    removed_row_ids = []
+  else:
+    processed_input_data_file_paths = [input_data_file['path'] for input_data_file in population_manifest['input_data_files']]
+    input_data_file_paths = processed_input_data_file_paths + [
+      input_data_file_path for input_data_file_path in DataPreprocessing.find_input_data_file_paths()
+      if input_data_file_path not in processed_input_data_file_paths
+    ]
+    removed_row_ids = population_manifest['removed_row_ids']
+
+  # The input data is preprocessed a chunk at a time (see Ingestion), so it is never all in memory at once.
+  if model_artifact is None:
+    encoders = Ingestion.fit_encoders(input_data_file_paths)
+  else:
+    encoders = DataPreprocessing.Encoders(**model_artifact['encoders'])
+
+  model_artifact_id = uuid.uuid4().hex
+
+  # The snapshot is only renamed into place after the model artifact is saved, so that the snapshot is only ever newer
+  # than the model artifact that it belongs to.
+  with Ingestion.create_population_snapshot(
+    input_data_file_paths, encoders, removed_row_ids, model_artifact_id, feature_dtype = POPULATION_FEATURE_DTYPE
+  ) as (feature_columns, segments, sections, next_row_id):
+    population_features = sections['features']
+    snapshot_rows = len(population_features)
+
+    nearest_neighbors_tuning = None
+
+    if NEAREST_NEIGHBORS_BACKEND == 'exact':
+      if (model_artifact is not None) and (not tune_nearest_neighbors):
+        nearest_neighbors_tuning = model_artifact['nearest_neighbors_tuning']
+
+      if nearest_neighbors_tuning is None:
+        nearest_neighbors_tuning = tune_nearest_neighbors_model(population_features, segments)
+
+    Serialization.save_model_artifact(
+      {
+        'feature_columns': feature_columns,
+        'encoders': encoders._asdict(),
+        'nearest_neighbors_backend': NEAREST_NEIGHBORS_BACKEND,
+        'population_feature_dtype': POPULATION_FEATURE_DTYPE,
+        'nearest_neighbors_tuning': nearest_neighbors_tuning,
+        'segment_models': train_segment_models(
+          population_features,
+          segments,
+          nearest_neighbors_parameters = None if nearest_neighbors_tuning is None else nearest_neighbors_tuning['parameters']
+        )
+      },
+      schema = DataPreprocessing.MODEL_ARTIFACT_SCHEMA,
+      model_artifact_id = model_artifact_id
+    )
+
+  # The removed row IDs are kept (though they are no longer in the snapshot), so that they stay removed the next time
+  # that the population is compacted.
+  Serialization.save_population_manifest({
+    'model_artifact_id': model_artifact_id,
+    'input_data_files': [describe_input_data_file(input_data_file_path) for input_data_file_path in input_data_file_paths],
+    'deltas': [],
+    'removed_row_ids': removed_row_ids,
+    'snapshot_rows': snapshot_rows,
+    'snapshot_removed_rows': len(removed_row_ids),
+    'next_row_id': next_row_id
+  })
+
+  if population_manifest is not None:
+    for population_delta in population_manifest['deltas']:
+      if os.path.isfile(population_delta['path']):
+        os.remove(population_delta['path'])
+
+# Preprocess the given (new) rows of the population with the model artifact's fitted encoders, and save them as a
+# population delta (with the feature matrix as the model artifact's population feature dtype), numbering them on from
+# the last row ID given out. Returns the updated population manifest, which records the delta, and the given input data
+# files (if any) as processed.
+def ingest_population_delta(population_data_frame, model_artifact, population_manifest, input_data_file_paths = None):
+  if input_data_file_paths is None:
+    input_data_file_paths = []
+
+  population_data_frame = population_data_frame.set_axis(
+    population_data_frame.index + population_manifest['next_row_id'],
+    axis = 'index'
+  )
+
+  encoders = DataPreprocessing.Encoders(**model_artifact['encoders'])
+  consolidated_population_data_frame = DataPreprocessing.consolidate_input_data(population_data_frame.copy())
+  preprocessed_population_data_frame = DataPreprocessing.encode_input_data(
+    consolidated_population_data_frame,
+    use_fitted_encoders = True,
+    encoders = encoders
+  )
+
+  metadata, sections = Ingestion.build_population_sections(
+    population_data_frame,
+    consolidated_population_data_frame,
+    preprocessed_population_data_frame,
+    encoders,
+    feature_dtype = model_artifact['population_feature_dtype']
+  )
+
+  if metadata['feature_columns'] != model_artifact['feature_columns']:
+    raise ValueError('The population delta was not preprocessed into the same features as the model artifact.')
+
+  population_delta_path = Serialization.POPULATION_DELTA_PATH_FORMAT.format(delta_id = uuid.uuid4().hex)
+
+  Serialization.save_population_snapshot(
+    metadata = dict(metadata, model_artifact_id = model_artifact['id']),
+    sections = sections,
+    snapshot_path = population_delta_path
+  )
+
+  population_manifest = dict(
+    population_manifest,
+    input_data_files = population_manifest['input_data_files'] + [
+      describe_input_data_file(input_data_file_path) for input_data_file_path in input_data_file_paths
+    ],
+    deltas = population_manifest['deltas'] + [{ 'path': population_delta_path, 'rows': len(population_data_frame) }],
+    next_row_id = population_manifest['next_row_id'] + len(population_data_frame)
+  )
+
+  return Serialization.save_population_manifest(population_manifest)
+
+# Nearest neighbor search within one segment, for each row of the given features. Returns a list with, for each row, a
+# tuple of the distances and indices (within the segment) of the nearest n_neighbors rows, sorted by distance in
+# ascending order.
+#
+# If a candidates mask is given, only candidates are returned. Start by probing the model for a multiple of the number of
+# neighbors wanted and dropping the non-candidates, and keep growing the probe (for the rows that are still short) until
+# there are enough candidates left. If the probe would have to cover a large fraction of the segment anyway (i.e.
+# candidates are rare), just calculate the distance to every candidate instead.
+def search_segment(nearest_neighbors_model, segment_features, features, n_neighbors, candidates_mask):
+  segment_size = len(segment_features)
+
+  if candidates_mask is None:
+    distances, indices = nearest_neighbors_model.kneighbors(features, n_neighbors = min(n_neighbors, segment_size))
+
+    return list(zip(distances, indices))
+
+  candidate_indices = np.flatnonzero(candidates_mask)
+  n_neighbors = min(n_neighbors, len(candidate_indices))
+
+  Metrics.observe('matchmaker_candidates', len(candidate_indices))
+
+  if n_neighbors == 0:
+    return [(np.array([], dtype = np.float64), np.array([], dtype = np.int64))] * len(features)
+
+  results = [None] * len(features)
+  pending_rows = np.arange(len(features))
+
+  probe_size = n_neighbors * INITIAL_PROBE_OVERSAMPLING
+
+  while (len(pending_rows) > 0) and (probe_size < len(candidate_indices)) and (probe_size < (segment_size * BRUTE_FORCE_PROBE_FRACTION)):
+    distances, indices = nearest_neighbors_model.kneighbors(features[pending_rows], n_neighbors = probe_size)
+
+    is_candidate = candidates_mask[indices]
+    candidates_found = np.count_nonzero(is_candidate, axis = 1)
+    has_enough_candidates = candidates_found >= n_neighbors
+
+    Metrics.increment('matchmaker_probed_neighbors_total', is_candidate.size)
+    Metrics.increment('matchmaker_discarded_neighbors_total', is_candidate.size - int(candidates_found.sum()))
+
+    for row, row_distances, row_indices, row_is_candidate in zip(
+      pending_rows[has_enough_candidates],
+      distances[has_enough_candidates],
+      indices[has_enough_candidates],
+      is_candidate[has_enough_candidates]
+    ):
+      results[row] = (row_distances[row_is_candidate][:n_neighbors], row_indices[row_is_candidate][:n_neighbors])
+
+    pending_rows = pending_rows[~has_enough_candidates]
+    probe_size *= PROBE_GROWTH_FACTOR
+
+  if len(pending_rows) > 0:
+    Metrics.increment('matchmaker_brute_force_searches_total', len(pending_rows))
+
+    candidate_features = segment_features[candidate_indices]
+
+    for row in pending_rows:
+      candidate_distances = np.sqrt(((candidate_features - features[row]) ** 2).sum(axis = 1))
+      nearest_first = np.argsort(candidate_distances, kind = 'stable')[:n_neighbors]
+
+      results[row] = (candidate_distances[nearest_first], candidate_indices[nearest_first])
+
+  return results
+
+# Merge per-segment nearest neighbors into the overall nearest n_neighbors population indices.
+def merge_nearest_neighbors(distances, population_indices, n_neighbors):
+  if len(population_indices) == 0:
+    return np.array([], dtype = np.int64)
+
+  distances = np.concatenate(distances)
+  population_indices = np.concatenate(population_indices)
+
+  # Break ties in distance by population index, so that results are deterministic regardless of the segment order.
+  nearest_first = np.lexsort((population_indices, distances))
+
+  return population_indices[nearest_first][:n_neighbors]
+
+# Fit one model per segment, each trained with its (contiguous) slice of the population. Returns a dict of segment, as a
+# (sex, sexual_orientation) tuple, to the segment's model and bounds.
+def train_segment_models(population_features, segments, nearest_neighbors_parameters = None):
+  return {
+    (segment['sex'], segment['sexual_orientation']): {
+      'start': segment['start'],
+      'stop': segment['stop'],
+      'nearest_neighbors_model': train_nearest_neighbors_model(
+        population_features[segment['start']:segment['stop']],
+        nearest_neighbors_parameters
+      )
+    }
+    for segment in segments
+  }
+
+# Fit the model, of the chosen backend (see NEAREST_NEIGHBORS_BACKEND). For the exact backend, the algorithm and leaf
+# size are the given (tuned) parameters, if any.
+# A formula of "minkowski" and p of 2 makes for a Euclidean distance metric.
+# https://scikit-learn.org/stable/modules/generated/sklearn.neighbors.NearestNeighbors.html
+def train_nearest_neighbors_model(features, nearest_neighbors_parameters = None):
+  if NEAREST_NEIGHBORS_BACKEND not in NEAREST_NEIGHBORS_BACKENDS:
+    raise ValueError(f'Unknown nearest neighbors backend {NEAREST_NEIGHBORS_BACKEND}; expected one of {NEAREST_NEIGHBORS_BACKENDS}.')
+
+  if NEAREST_NEIGHBORS_BACKEND == 'graph':
+    return GraphIndex.GraphIndex(**GRAPH_INDEX_PARAMETERS).fit(features)
+
+  return NearestNeighbors(
+    **(nearest_neighbors_parameters or { 'algorithm': 'auto' }),
+    metric = 'minkowski',
+    p = 2
+  ).fit(features)
+
+# The number of bytes taken up by the arrays of a fitted model: the features that it was fitted with (or its own copy
+# of them), and its index (if any).
+def measure_nearest_neighbors_model(nearest_neighbors_model):
+  if isinstance(nearest_neighbors_model, GraphIndex.GraphIndex):
+    arrays = [nearest_neighbors_model.features] + nearest_neighbors_model.layer_nodes + nearest_neighbors_model.layer_neighbors
+  elif nearest_neighbors_model._tree is not None:
+    arrays = list(nearest_neighbors_model._tree.get_arrays())
+  else:
+    arrays = [nearest_neighbors_model._fit_X]
+
+  return sum(array.nbytes for array in arrays)
+
+# Benchmark each of the exact backend's candidate algorithms and leaf sizes (see NEAREST_NEIGHBORS_TUNING_CANDIDATES),
+# and choose the fastest that is exact enough. A sample of the population (spread across the segments, in proportion to
+# their size) is held out as the queries, and each candidate is trained on the rest of each segment and timed searching
+# it for each query in turn, the same as a single real query would.
+#
+# Returns the chosen parameters and the timings of every candidate, to be recorded in the model artifact.
+def tune_nearest_neighbors_model(population_features, segments):
+  random_number_generator = np.random.default_rng(0)
+
+  query_positions = np.sort(random_number_generator.choice(
+    len(population_features),
+    size = min(NEAREST_NEIGHBORS_TUNING_QUERIES, len(population_features) // 2),
+    replace = False
+  ))
+
+  segment_samples = []
+
+  for segment in segments:
+    is_query = np.zeros(segment['stop'] - segment['start'], dtype = bool)
+    is_query[query_positions[(query_positions >= segment['start']) & (query_positions < segment['stop'])] - segment['start']] = True
+
+    segment_features = population_features[segment['start']:segment['stop']]
+
+    if is_query.any() and (not is_query.all()):
+      segment_samples.append((segment_features[~is_query], segment_features[is_query]))
+
+  timings = []
+
+  for parameters in NEAREST_NEIGHBORS_TUNING_CANDIDATES:
+    build_seconds = 0
+    query_seconds = 0
+    true_neighbors = 0
+    found_neighbors = 0
+
+    for index_features, query_features in segment_samples:
+      n_neighbors = min(NEAREST_NEIGHBORS_TUNING_NEIGHBORS, len(index_features))
+
+      start = time.perf_counter()
+      nearest_neighbors_model = NearestNeighbors(**parameters, metric = 'minkowski', p = 2).fit(index_features)
+      build_seconds += time.perf_counter() - start
+
+      for query in query_features:
+        start = time.perf_counter()
+        distances, indices = nearest_neighbors_model.kneighbors(query[np.newaxis, :], n_neighbors = n_neighbors)
+        query_seconds += time.perf_counter() - start
+
+        # Compare by distance rather than by index, as there are many duplicates (i.e. ties) in the population.
+        true_distances = np.sort(np.sqrt(((index_features - query) ** 2).sum(axis = 1)))[:n_neighbors]
+        true_neighbors += n_neighbors
+        found_neighbors += np.count_nonzero(np.isclose(distances[0], true_distances))
+
+    timings.append({
+      'parameters': parameters,
+      'build_seconds': build_seconds,
+      'query_milliseconds': query_seconds * 1000 / max(len(query_positions), 1),
+      'recall': found_neighbors / max(true_neighbors, 1)
+    })
+
+  exact_enough_timings = [timing for timing in timings if timing['recall'] >= NEAREST_NEIGHBORS_TUNING_MINIMUM_RECALL]
+
+  if len(exact_enough_timings) == 0:
+    return { 'parameters': { 'algorithm': 'brute' }, 'timings': timings }
+
+  fastest_timing = min(exact_enough_timings, key = lambda timing: timing['query_milliseconds'])
+
+  return { 'parameters': fastest_timing['parameters'], 'timings': timings }
+
+# The snapshot needs to be built again if there is no population manifest, it belongs to a different model artifact, or
+# any of the input data files that have been processed have since been modified or deleted. New input data files don't
+# need it to be, as they are ingested as a delta.
+def is_population_manifest_stale(population_manifest, model_artifact):
+  if population_manifest is None:
+    return True
+
+  if population_manifest['model_artifact_id'] != model_artifact['id']:
+    return True
+
+  return are_input_data_files_changed(population_manifest)
+
+def are_input_data_files_changed(population_manifest):
+  return any(
+    describe_input_data_file(input_data_file['path']) != input_data_file
+    for input_data_file in population_manifest['input_data_files']
+  )
+
+# Compact once the deltas, or the rows removed since the snapshot was built, are too large a part of the population.
+def is_population_compaction_due(population_manifest):
+  delta_rows = sum(population_delta['rows'] for population_delta in population_manifest['deltas'])
+  removed_rows = len(population_manifest['removed_row_ids']) - population_manifest['snapshot_removed_rows']
+
+  return max(delta_rows, removed_rows) > (population_manifest['snapshot_rows'] * POPULATION_COMPACTION_THRESHOLD)
+
+# How an input data file is recorded as processed in the population manifest: if any of this changes, it has been
+# modified (or deleted) since.
+def describe_input_data_file(input_data_file_path):
+  try:
+    input_data_file_stat = os.stat(input_data_file_path)
+    return { 'path': input_data_file_path, 'modified_time_ns': input_data_file_stat.st_mtime_ns, 'size': input_data_file_stat.st_size }
+  except FileNotFoundError:
+    return { 'path': input_data_file_path, 'modified_time_ns': None, 'size': None }
+
+# The modification time and size of every file that the engine is loaded from. If any of these change (or files are
+# added or removed), the engine needs to be loaded again.
+def build_source_fingerprint():
+  source_file_paths = DataPreprocessing.find_input_data_file_paths() + [
+    Serialization.MODEL_ARTIFACT_PATH,
+    Serialization.POPULATION_SNAPSHOT_PATH,
+    Serialization.POPULATION_MANIFEST_PATH
+  ]
+
+  source_fingerprint = []
+
+  for source_file_path in source_file_paths:
+    try:
+      source_file_stat = os.stat(source_file_path)
+      source_fingerprint.append((source_file_path, source_file_stat.st_mtime_ns, source_file_stat.st_size))
+    except FileNotFoundError:
+      source_fingerprint.append((source_file_path, None, None))
+
+  return tuple(source_fingerprint)
+
+# The one engine shared by everything in this process (e.g. every request handled by a web server worker).
+ENGINE = Engine()
+
+def get_engine(force_training = False, tune_nearest_neighbors = False):
+  return ENGINE.refresh(force_training = force_training, tune_nearest_neighbors = tune_nearest_neighbors)
@@ -0,0 +1,236 @@
+import heapq
+import math
+import numpy as np
+
+# Default build and search parameters (see GraphIndex).
+MAX_NEIGHBORS = 16
+EF_CONSTRUCTION = 100
+EF_SEARCH = 64
+
+# An approximate nearest neighbors index: a hierarchical navigable small world (HNSW) graph, as described in
+# https://arxiv.org/abs/1603.09320, implemented with NumPy. Search time grows roughly logarithmically with the number of
+# rows indexed, rather than linearly as for an exact search, at the cost of sometimes missing some of the true nearest
+# neighbors. Distances are Euclidean, the same as for the exact model.
+#
+# Every row is a node in the bottom layer of the graph, and a (randomly chosen, exponentially decreasing) few are also
+# nodes in each of the layers above it. A search greedily walks down from the top layer to find a good place to start
+# from in the bottom layer, and then does a beam search of the bottom layer from there.
+#
+# Parameters:
+# * max_neighbors: How many neighbors each node links to in each layer (twice as many in the bottom layer). More makes
+#   for better recall, at the cost of a larger index and slower builds and searches.
+# * ef_construction: The width of the beam search when finding each new node's neighbors while building the index. More
+#   makes for a better graph (and therefore recall), at the cost of slower builds.
+# * ef_search: The width of the beam search when searching (or the number of neighbors wanted, if more). More makes for
+#   better recall, at the cost of slower searches. Can be changed at any time, without building the index again.
+#
+# Has the same kneighbors interface as scikit-learn's NearestNeighbors, so can be used in its place. Once fitted, an
+# index is only ever read from, so can be searched from many threads at once.
+class GraphIndex:
+  def __init__(self, max_neighbors = MAX_NEIGHBORS, ef_construction = EF_CONSTRUCTION, ef_search = EF_SEARCH, random_state = 0):
+    self.max_neighbors = max_neighbors
+    self.ef_construction = ef_construction
+    self.ef_search = ef_search
+    self.random_state = random_state
+
+  # Keeps its own copy of the features, as float32 if they are float32 (see Engine.POPULATION_FEATURE_DTYPE), otherwise
+  # as float64.
+  def fit(self, features):
+    self.features = np.ascontiguousarray(features, dtype = np.result_type(features, np.float32))
+
+    # The layer of each node is drawn from an exponential distribution, so that each layer has around 1/max_neighbors
+    # of the nodes of the one below it.
+    random_number_generator = np.random.default_rng(self.random_state)
+    node_levels = np.floor(
+      -np.log(1 - random_number_generator.random(len(self.features))) / math.log(max(self.max_neighbors, 2))
+    ).astype(int)
+
+    # While building, each layer is a dict of node to a list of its neighbors.
+    layers = [{} for level in range(node_levels.max(initial = 0) + 1)]
+    self.entry_point = None
+    self.top_level = None
+
+    for node in range(len(self.features)):
+      self.__insert(layers, node, node_levels[node])
+
+    # Once built, store each layer as arrays (rather than Python objects), so that the index can be memory-mapped when
+    # it is loaded from the model artifact: the (sorted) nodes in the layer, and a row per node of its neighbors, padded
+    # with -1s.
+    self.layer_nodes = []
+    self.layer_neighbors = []
+
+    for level, layer in enumerate(layers):
+      layer_nodes = np.array(sorted(layer), dtype = np.int64)
+      layer_neighbors = np.full((len(layer_nodes), self.__max_layer_neighbors(level)), -1, dtype = np.int64)
+
+      for row, node in enumerate(layer_nodes):
+        layer_neighbors[row, :len(layer[node])] = layer[node]
+
+      self.layer_nodes.append(layer_nodes)
+      self.layer_neighbors.append(layer_neighbors)
+
+    return self
+
+  # Returns the distances and indices of the approximate nearest n_neighbors rows to each of the given rows, sorted by
+  # distance (and then by index, for ties) in ascending order, as arrays with a row per row of the given features.
+  def kneighbors(self, features, n_neighbors):
+    features = np.asarray(features, dtype = self.features.dtype)
+
+    distances = np.empty((len(features), n_neighbors), dtype = np.float64)
+    indices = np.empty((len(features), n_neighbors), dtype = np.int64)
+
+    for row, query in enumerate(features):
+      row_squared_distances, row_indices = self.__search(query, n_neighbors)
+
+      distances[row] = np.sqrt(row_squared_distances)
+      indices[row] = row_indices
+
+    return distances, indices
+
+  def __search(self, query, n_neighbors):
+    entry_point = self.entry_point
+
+    for level in range(self.top_level, 0, -1):
+      entry_point = self.__search_layer(query, [entry_point], 1, lambda node: self.__fitted_neighbors(node, level))[0][1]
+
+    nearest = self.__search_layer(query, [entry_point], max(self.ef_search, n_neighbors), lambda node: self.__fitted_neighbors(node, 0))
+
+    # Every node is reachable in the bottom layer, so it's rare to find fewer neighbors than wanted, but if it happens,
+    # fall back to calculating the distance to every row.
+    if len(nearest) < n_neighbors:
+      squared_distances = self.__squared_distances(query, np.arange(len(self.features)))
+      nearest = sorted(zip(squared_distances.tolist(), range(len(self.features))))
+
+    nearest = nearest[:n_neighbors]
+
+    return [squared_distance for squared_distance, node in nearest], [node for squared_distance, node in nearest]
+
+  def __insert(self, layers, node, node_level):
+    query = self.features[node]
+
+    if self.entry_point is None:
+      for level in range(node_level + 1):
+        layers[level][node] = []
+
+      self.entry_point = node
+      self.top_level = node_level
+      return
+
+    top_level = self.top_level
+    entry_points = [self.entry_point]
+
+    for level in range(top_level, node_level, -1):
+      entry_points = [self.__search_layer(query, entry_points, 1, layers[level].__getitem__)[0][1]]
+
+    for level in range(min(node_level, top_level), -1, -1):
+      nearest = self.__search_layer(query, entry_points, self.ef_construction, layers[level].__getitem__)
+      neighbors = self.__select_neighbors(nearest, self.max_neighbors)
+
+      layers[level][node] = neighbors
+
+      # Link back from each of the neighbors, and if that gives them too many, keep the best of them.
+      for neighbor in neighbors:
+        neighbor_neighbors = layers[level][neighbor]
+        neighbor_neighbors.append(node)
+
+        if len(neighbor_neighbors) > self.__max_layer_neighbors(level):
+          squared_distances = self.__squared_distances(self.features[neighbor], np.array(neighbor_neighbors))
+          layers[level][neighbor] = self.__select_neighbors(
+            sorted(zip(squared_distances.tolist(), neighbor_neighbors)),
+            self.__max_layer_neighbors(level)
+          )
+
+      entry_points = [nearest_node for squared_distance, nearest_node in nearest]
+
+    for level in range(top_level + 1, node_level + 1):
+      layers[level][node] = []
+
+    if node_level > top_level:
+      self.entry_point = node
+      self.top_level = node_level
+
+  # Beam search of one layer, starting from the given entry points. Returns a list of (squared distance, node) tuples of
+  # the nearest ef nodes found, sorted by distance (and then by node, for ties).
+  def __search_layer(self, query, entry_points, ef, neighbors_of):
+    visited = set(entry_points)
+
+    entry_squared_distances = self.__squared_distances(query, np.array(entry_points)).tolist()
+
+    # A min-heap of nodes to visit the neighbors of, and a max-heap (by negating) of the nearest nodes found so far.
+    candidates = list(zip(entry_squared_distances, entry_points))
+    heapq.heapify(candidates)
+    nearest = [(-squared_distance, -node) for squared_distance, node in candidates]
+    heapq.heapify(nearest)
+
+    while len(nearest) > ef:
+      heapq.heappop(nearest)
+
+    while candidates:
+      squared_distance, node = heapq.heappop(candidates)
+
+      if squared_distance > -nearest[0][0]:
+        break
+
+      neighbors = [neighbor for neighbor in neighbors_of(node) if neighbor not in visited]
+
+      if len(neighbors) == 0:
+        continue
+
+      visited.update(neighbors)
+
+      for neighbor_squared_distance, neighbor in zip(self.__squared_distances(query, np.array(neighbors)).tolist(), neighbors):
+        if (len(nearest) < ef) or (neighbor_squared_distance < -nearest[0][0]):
+          heapq.heappush(candidates, (neighbor_squared_distance, neighbor))
+          heapq.heappush(nearest, (-neighbor_squared_distance, -neighbor))
+
+          if len(nearest) > ef:
+            heapq.heappop(nearest)
+
+    return sorted((-negative_squared_distance, -negative_node) for negative_squared_distance, negative_node in nearest)
+
+  # Choose up to max_neighbors neighbors from the given (sorted) list of (squared distance, node) tuples, nearest first,
+  # skipping any that are nearer to an already chosen neighbor than they are to the node itself. This keeps the graph
+  # connected across clusters, rather than every link of a node pointing into the one cluster.
+  #
+  # The population has many duplicate rows, so any that are duplicates of the node itself (at a distance of 0) fill up
+  # what's left afterwards, rather than being skipped, so that every copy of a row is linked to the others. They come
+  # after the other neighbors, so that when a node has too many neighbors, its links out of the duplicates are kept.
+  def __select_neighbors(self, nearest, max_neighbors):
+    squared_distances = np.array([squared_distance for squared_distance, node in nearest])
+    nodes = np.array([node for squared_distance, node in nearest], dtype = np.int64)
+
+    # The squared distance between every pair of the nodes.
+    differences = self.features[nodes][:, np.newaxis, :] - self.features[nodes][np.newaxis, :, :]
+    pairwise_squared_distances = np.einsum('ijk,ijk->ij', differences, differences)
+
+    neighbors = []
+    duplicates = squared_distances == 0
+    skipped = duplicates.copy()
+
+    for position in range(len(nodes)):
+      if len(neighbors) >= max_neighbors:
+        break
+
+      if skipped[position]:
+        continue
+
+      neighbors.append(int(nodes[position]))
+      skipped |= pairwise_squared_distances[position] < squared_distances
+
+    return neighbors + nodes[duplicates][:max_neighbors - len(neighbors)].tolist()
+
+  def __fitted_neighbors(self, node, level):
+    if level == 0:
+      neighbors = self.layer_neighbors[0][node]
+    else:
+      neighbors = self.layer_neighbors[level][np.searchsorted(self.layer_nodes[level], node)]
+
+    return neighbors[neighbors >= 0].tolist()
+
+  def __squared_distances(self, query, nodes):
+    differences = self.features[nodes] - query
+
+    return np.einsum('ij,ij->i', differences, differences)
+
+  def __max_layer_neighbors(self, level):
+    return self.max_neighbors * 2 if level == 0 else self.max_neighbors
@@ -0,0 +1,401 @@
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import multiprocessing
+import os
+import os.path
+import tempfile
+import uuid
+import numpy as np
+import pandas as pd
+
+from . import data_preprocessing as DataPreprocessing
+from . import serialization as Serialization
+
+# Input data files are read in chunks of up to this many rows, and only a few chunks per process are ever in memory at
+# once, so the memory needed to build the population doesn't grow with the size of the input data.
+INGESTION_CHUNK_SIZE = 50000
+
+# How many processes to preprocess chunks in, one per CPU by default. With 1 (or if there is only one chunk), chunks are
+# preprocessed in this process, without starting any others.
+INGESTION_PROCESSES = int(os.environ.get('MATCHMAKER_INGESTION_PROCESSES', os.cpu_count() or 1))
+
+# The features that are scaled in preprocessing (after being ordinal encoded, for the categorical ones), each with the
+# encoder of the same name plus "_scaler".
+SCALED_FEATURES = ['age'] + DataPreprocessing.CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE
+
+# Building the population from the input data files, without ever holding all of the input data in memory, in two
+# passes over it. Each pass reads the input data files a chunk at a time, and preprocesses the chunks in parallel across
+# processes (see map_input_data_chunks):
+# 1. fit_encoders: each chunk is consolidated, and summarized by the values seen of each one-hot encoded feature and the
+#    range of each scaled feature. The summaries are combined into a new encoders bundle, fitted the same as if it had
+#    been fitted to all of the input data at once: the scalers are partially fitted to each chunk's range, and the
+#    one-hot encoder to the union of the values seen.
+# 2. create_population_snapshot: each chunk is preprocessed with the fitted encoders, and written to a temporary file in
+#    the same layout as the population snapshot, along with the segment of each of its rows. The chunks are then merged
+#    into the (memory-mapped) population snapshot, sorted by segment, a segment and a chunk at a time.
+#
+# So beyond a few chunks at a time, the only memory that grows with the input data is the removed row IDs and a small
+# summary per chunk (its layout, its first row ID and how many of its rows are in each segment).
+
+# Returns a new encoders bundle, fitted to the given input data files.
+def fit_encoders(input_data_file_paths):
+  encoders = DataPreprocessing.build_encoders(use_fitted_encoders = False)
+
+  # The ordinal encoder's categories are fixed, so it only needs fitting to something within them.
+  encoders.ordinal_encoder.fit(pd.DataFrame({
+    feature: [categories[0]]
+    for feature, categories in zip(DataPreprocessing.CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE, encoders.ordinal_encoder.categories)
+  }))
+
+  rows = 0
+  one_hot_categories = { feature: set() for feature in DataPreprocessing.CATEGORICAL_FEATURES_TO_ONE_HOT_ENCODE }
+
+  for input_data_chunk_summary in map_input_data_chunks(summarize_input_data_chunk, input_data_file_paths, encoders):
+    if input_data_chunk_summary['rows'] == 0:
+      continue
+
+    rows += input_data_chunk_summary['rows']
+
+    for feature, categories in input_data_chunk_summary['one_hot_categories'].items():
+      one_hot_categories[feature] |= categories
+
+    # A scaler fitted to just the minimum and maximum of a chunk is the same as one fitted to all of it.
+    for feature, feature_range in input_data_chunk_summary['scaled_feature_ranges'].items():
+      getattr(encoders, f'{feature}_scaler').partial_fit(pd.DataFrame({ feature: feature_range }))
+
+  if rows == 0:
+    raise ValueError('There is no input data to fit the encoders to.')
+
+  for feature in SCALED_FEATURES:
+    getattr(encoders, f'{feature}_scaler').n_samples_seen_ = rows
+
+  # The one-hot encoder's categories are the sorted distinct values of each feature, so fitting it to every value seen
+  # once is the same as fitting it to all of the input data. Pad each feature to the same length by repeating a value.
+  one_hot_categories = { feature: sorted(categories) for feature, categories in one_hot_categories.items() }
+  most_categories = max(len(categories) for categories in one_hot_categories.values())
+
+  encoders.one_hot_encoder.fit(pd.DataFrame({
+    feature: categories + categories[:1] * (most_categories - len(categories))
+    for feature, categories in one_hot_categories.items()
+  }))
+
+  return encoders
+
+def summarize_input_data_chunk(input_data_chunk, encoders):
+  data_frame = DataPreprocessing.filter_input_data(input_data_chunk).copy()
+
+  if len(data_frame) == 0:
+    return { 'rows': 0 }
+
+  data_frame = DataPreprocessing.consolidate_input_data(data_frame)
+
+  data_frame[DataPreprocessing.CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE] = encoders.ordinal_encoder.transform(
+    data_frame[DataPreprocessing.CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE]
+  )
+
+  return {
+    'rows': len(data_frame),
+    'one_hot_categories': {
+      feature: set(data_frame[feature].unique()) for feature in DataPreprocessing.CATEGORICAL_FEATURES_TO_ONE_HOT_ENCODE
+    },
+    'scaled_feature_ranges': {
+      feature: [np.nanmin(data_frame[feature].to_numpy(dtype = np.float64)), np.nanmax(data_frame[feature].to_numpy(dtype = np.float64))]
+      for feature in SCALED_FEATURES
+    }
+  }
+
+# Preprocess the given input data files with the given (fitted) encoders, and create the population snapshot of them,
+# leaving out the rows with the given row IDs, with the feature matrix as the given dtype (see
+# Engine.POPULATION_FEATURE_DTYPE). Rows are given IDs in order across all of the input data files, before any are
+# removed.
+#
+# Yields a tuple of the feature columns, the segments, the snapshot's sections (as writable arrays backed by the
+# memory-mapped file) and the next row ID to give out, and then renames the snapshot into place once the block
+# completes (see Serialization.create_population_snapshot), so that anything that it belongs to (i.e. the model
+# artifact, with the given ID) can be saved first.
+@contextlib.contextmanager
+def create_population_snapshot(input_data_file_paths, encoders, removed_row_ids, model_artifact_id, feature_dtype = 'float64'):
+  population_groups = build_population_groups()
+
+  with tempfile.TemporaryDirectory(dir = os.path.dirname(Serialization.POPULATION_SNAPSHOT_PATH) or None) as chunks_directory:
+    # Only a summary of each chunk is kept in memory, rather than any per row arrays: the group that each of its rows is
+    # in (see group_population_chunk) is written out next to it, and read back a group at a time while merging.
+    population_chunks = []
+    next_row_id = 0
+
+    for population_chunk in map_input_data_chunks(encode_input_data_chunk, input_data_file_paths, encoders, chunks_directory, feature_dtype):
+      if population_chunk['rows'] == 0:
+        continue
+
+      metadata, sections = Serialization.load_population_snapshot(population_chunk['path'])
+
+      population_chunk_groups = group_population_chunk(sections, next_row_id, removed_row_ids)
+      population_chunk_groups_path = f'{population_chunk["path"]}.groups.npy'
+      np.save(population_chunk_groups_path, population_chunk_groups)
+
+      population_chunks.append({
+        'path': population_chunk['path'],
+        'groups_path': population_chunk_groups_path,
+        'feature_columns': metadata['feature_columns'],
+        'feature_values': metadata['feature_values'],
+        'section_layouts': { name: (section.dtype, section.shape[1:]) for name, section in sections.items() },
+        'row_id_offset': next_row_id,
+        'group_rows': np.bincount(population_chunk_groups[population_chunk_groups >= 0], minlength = len(population_groups))
+      })
+
+      next_row_id += population_chunk['rows']
+
+      del sections, population_chunk_groups
+
+    if len(population_chunks) == 0:
+      raise ValueError('There is no input data to build the population from.')
+
+    feature_columns = population_chunks[0]['feature_columns']
+    feature_values = merge_feature_values([population_chunk['feature_values'] for population_chunk in population_chunks])
+
+    # Fail before building anything if the features can't be stored as the dtype.
+    build_feature_value_tables(feature_values, feature_dtype)
+
+    segments = []
+    start = 0
+
+    for group, (sex, sexual_orientation) in enumerate(population_groups):
+      stop = start + sum(int(population_chunk['group_rows'][group]) for population_chunk in population_chunks)
+
+      if (sex is not None) and (stop > start):
+        segments.append({ 'sex': sex, 'sexual_orientation': sexual_orientation, 'start': start, 'stop': stop })
+
+      start = stop
+
+    section_layouts = {
+      name: (
+        # Strings are as wide as the widest of any chunk.
+        max((population_chunk['section_layouts'][name][0] for population_chunk in population_chunks), key = lambda dtype: dtype.itemsize),
+        (start,) + shape
+      )
+      for name, (dtype, shape) in population_chunks[0]['section_layouts'].items()
+    }
+
+    with Serialization.create_population_snapshot(
+      metadata = {
+        'model_artifact_id': model_artifact_id,
+        'feature_columns': feature_columns,
+        'feature_values': feature_values,
+        'segments': segments
+      },
+      section_layouts = section_layouts
+    ) as population_sections:
+      position = 0
+
+      for group in range(len(population_groups)):
+        for population_chunk in population_chunks:
+          rows = int(population_chunk['group_rows'][group])
+
+          if rows == 0:
+            continue
+
+          metadata, sections = Serialization.load_population_snapshot(population_chunk['path'])
+          population_chunk_mask = np.load(population_chunk['groups_path'], mmap_mode = 'r') == group
+
+          for name, population_section in population_sections.items():
+            population_section[position:position + rows] = sections[name][population_chunk_mask]
+
+          # Row IDs carry on from the previous chunk's.
+          population_sections['row_ids'][position:position + rows] += population_chunk['row_id_offset']
+
+          position += rows
+
+      yield feature_columns, segments, population_sections, next_row_id
+
+# The groups that the population's rows are split into, in order: the segments, in segment order (see
+# Engine.SEGMENT_FEATURES), and then the rows that aren't in any segment (i.e. that have a sex or sexual orientation that
+# isn't known). Returns a list of tuples of each group's sex and sexual orientation (or a tuple of Nones).
+def build_population_groups():
+  segments = sorted(
+    (sex, sexual_orientation)
+    for sex in DataPreprocessing.SEX_VALUES
+    for sexual_orientation in DataPreprocessing.SEXUAL_ORIENTATION_VALUES
+  )
+
+  return segments + [(None, None)]
+
+# The number of the group (see build_population_groups) that each of a chunk's rows is in, or -1 for rows that are
+# removed (i.e. that have one of the given row IDs, once the chunk's row IDs have been offset by the given row ID).
+def group_population_chunk(sections, row_id_offset, removed_row_ids):
+  population_groups = build_population_groups()
+
+  segment_groups = np.empty((len(DataPreprocessing.SEX_VALUES), len(DataPreprocessing.SEXUAL_ORIENTATION_VALUES)), dtype = np.int8)
+
+  for sex_code, sex in enumerate(DataPreprocessing.SEX_VALUES):
+    for sexual_orientation_code, sexual_orientation in enumerate(DataPreprocessing.SEXUAL_ORIENTATION_VALUES):
+      segment_groups[sex_code, sexual_orientation_code] = population_groups.index((sex, sexual_orientation))
+
+  sex_codes = np.asarray(sections['sex'])
+  sexual_orientation_codes = np.asarray(sections['sexual_orientation'])
+  in_segment = (sex_codes >= 0) & (sexual_orientation_codes >= 0)
+
+  population_chunk_groups = np.full(len(sex_codes), len(population_groups) - 1, dtype = np.int8)
+  population_chunk_groups[in_segment] = segment_groups[sex_codes[in_segment], sexual_orientation_codes[in_segment]]
+  population_chunk_groups[np.isin(np.asarray(sections['row_ids']) + row_id_offset, removed_row_ids)] = -1
+
+  return population_chunk_groups
+
+# Preprocess a chunk with the given (fitted) encoders, and write it to a new file in the given directory, in the same
+# layout as the population snapshot. Its row IDs are its row numbers, from 0.
+def encode_input_data_chunk(input_data_chunk, encoders, chunks_directory, feature_dtype):
+  population_data_frame = DataPreprocessing.reindex_data_frame(DataPreprocessing.filter_input_data(input_data_chunk).copy())
+
+  if len(population_data_frame) == 0:
+    return { 'path': None, 'rows': 0 }
+
+  consolidated_population_data_frame = DataPreprocessing.consolidate_input_data(population_data_frame.copy())
+  preprocessed_population_data_frame = DataPreprocessing.encode_input_data(
+    consolidated_population_data_frame,
+    use_fitted_encoders = True,
+    encoders = encoders
+  )
+
+  metadata, sections = build_population_sections(
+    population_data_frame,
+    consolidated_population_data_frame,
+    preprocessed_population_data_frame,
+    encoders,
+    feature_dtype
+  )
+
+  population_chunk_path = os.path.join(chunks_directory, f'{uuid.uuid4().hex}.bin')
+
+  Serialization.save_population_snapshot(
+    metadata = metadata,
+    sections = sections,
+    snapshot_path = population_chunk_path
+  )
+
+  return { 'path': population_chunk_path, 'rows': len(population_data_frame) }
+
+# The metadata and sections of a population snapshot (or delta, or chunk) of the given population rows and their
+# consolidated and preprocessed counterparts (in the same order, preprocessed with the given encoders), with the feature
+# matrix as the given dtype. The metadata is the names of the feature columns and the distinct values of each (see
+# build_feature_value_tables).
+def build_population_sections(population_data_frame, consolidated_population_data_frame, preprocessed_population_data_frame, encoders, feature_dtype = 'float64'):
+  features_data_frame = preprocessed_population_data_frame.loc[:, ~preprocessed_population_data_frame.columns.isin(DataPreprocessing.DIRECT_LOOKUP_FEATURES)]
+  features = features_data_frame.to_numpy(dtype = np.float64)
+
+  metadata = {
+    'feature_columns': list(features_data_frame.columns),
+    'feature_values': [np.unique(features[:, column]).tolist() for column in range(features.shape[1])]
+  }
+
+  return metadata, {
+    'features': np.ascontiguousarray(features, dtype = feature_dtype),
+    'row_ids': population_data_frame.index.to_numpy(dtype = np.int64),
+    # Direct lookups are done against the values before consolidation (e.g. all of the languages spoken), hence the
+    # population data frame rather than the preprocessed one.
+    'sex': DataPreprocessing.encode_direct_lookup_codes(population_data_frame['sex'], DataPreprocessing.SEX_VALUES),
+    'sexual_orientation': DataPreprocessing.encode_direct_lookup_codes(population_data_frame['sexual_orientation'], DataPreprocessing.SEXUAL_ORIENTATION_VALUES),
+    'speaks_languages': DataPreprocessing.encode_speaks_languages(population_data_frame['speaks']),
+    'consolidated_speaks': encode_strings(preprocessed_population_data_frame['speaks']),
+    **build_display_sections(consolidated_population_data_frame, encoders)
+  }
+
+# The display attributes (see DataPreprocessing.DISPLAY_ATTRIBUTES) of every row are stored in the population snapshot
+# too, so that matches can be shown by looking their rows up, rather than by reversing the preprocessing of their
+# features. The sex, sexual orientation and consolidated speaks sections already hold three of them; the rest are each
+# stored in a section of their own: age as a whole number, the categorical features as codes (their index in
+# build_display_attribute_values) and the flags as booleans.
+DISPLAY_SECTION_ATTRIBUTES = [attribute for attribute in DataPreprocessing.DISPLAY_ATTRIBUTES if attribute not in DataPreprocessing.DIRECT_LOOKUP_FEATURES]
+DISPLAY_FLAG_ATTRIBUTES = ['have_children', 'want_children', 'pets_cats', 'pets_dogs']
+
+def build_display_sections(consolidated_population_data_frame, encoders):
+  display_attribute_values = build_display_attribute_values(encoders)
+  display_sections = {}
+
+  for attribute in DISPLAY_SECTION_ATTRIBUTES:
+    if attribute == 'age':
+      display_section = consolidated_population_data_frame[attribute].to_numpy(dtype = np.int16)
+    elif attribute in DISPLAY_FLAG_ATTRIBUTES:
+      display_section = consolidated_population_data_frame[attribute].to_numpy(dtype = bool)
+    else:
+      # The encoders would have failed to preprocess any value that isn't one of their categories.
+      display_section = DataPreprocessing.encode_direct_lookup_codes(consolidated_population_data_frame[attribute], display_attribute_values[attribute])
+
+    display_sections[f'display_{attribute}'] = display_section
+
+  return display_sections
+
+# The values of each categorical display attribute, that its codes are the index of: the categories of the (fitted)
+# encoder that it is preprocessed with.
+def build_display_attribute_values(encoders):
+  return {
+    **dict(zip(DataPreprocessing.CATEGORICAL_FEATURES_TO_ONE_HOT_ENCODE, encoders.one_hot_encoder.categories_)),
+    **dict(zip(DataPreprocessing.CATEGORICAL_FEATURES_TO_ORDINAL_ENCODE, encoders.ordinal_encoder.categories_))
+  }
+
+# Every feature only has a handful of distinct values (e.g. each age, once scaled), so a feature matrix stored as a
+# smaller dtype than float64 can be restored to exactly the values that it was preprocessed into, by looking them up.
+# Returns a tuple per feature column of its distinct values as the given dtype and as float64, both sorted, for
+# restore_features. Raises a ValueError if any of the distinct values of a column would be the same as the dtype.
+def build_feature_value_tables(feature_values, feature_dtype):
+  feature_value_tables = []
+
+  for column_values in feature_values:
+    values = np.array(column_values, dtype = np.float64)
+    compact_values = values.astype(feature_dtype)
+
+    if np.any(np.diff(compact_values) <= 0):
+      raise ValueError(f'The features can\'t be stored as {feature_dtype} without losing the difference between some of their values.')
+
+    feature_value_tables.append((compact_values, values))
+
+  return feature_value_tables
+
+# The union of the distinct values of each feature column of many population snapshots (or deltas, or chunks).
+def merge_feature_values(feature_values_list):
+  return [sorted(set(itertools.chain.from_iterable(column_values))) for column_values in zip(*feature_values_list)]
+
+# Restore a feature matrix stored as a smaller dtype to the float64 values that it was preprocessed into.
+def restore_features(features, feature_value_tables):
+  restored_features = np.empty(features.shape, dtype = np.float64)
+
+  for column, (compact_values, values) in enumerate(feature_value_tables):
+    restored_features[:, column] = values[np.searchsorted(compact_values, features[:, column])]
+
+  return restored_features
+
+# Fixed-width UTF-8 byte strings, so that they can be stored in the snapshot.
+def encode_strings(series):
+  return np.array([value.encode('utf-8') for value in series.astype(str)], dtype = np.bytes_)
+
+# Calls the given function with each chunk of the given input data files (and the given arguments), and yields the
+# results in the same order. Spread across INGESTION_PROCESSES processes, with only a couple of chunks per process read
+# ahead at a time, so that reading doesn't get too far ahead of preprocessing. The processes are spawned rather than
+# forked, as this may be running in a threaded process (e.g. a web server worker).
+def map_input_data_chunks(function, input_data_file_paths, *arguments):
+  input_data_chunks = (
+    input_data_chunk
+    for input_data_file_path in input_data_file_paths
+    for input_data_chunk in DataPreprocessing.read_input_data_file(input_data_file_path, chunk_size = INGESTION_CHUNK_SIZE)
+  )
+
+  first_input_data_chunks = list(itertools.islice(input_data_chunks, 2))
+  input_data_chunks = itertools.chain(first_input_data_chunks, input_data_chunks)
+
+  if (INGESTION_PROCESSES <= 1) or (len(first_input_data_chunks) <= 1):
+    for input_data_chunk in input_data_chunks:
+      yield function(input_data_chunk, *arguments)
+
+    return
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers = INGESTION_PROCESSES, mp_context = multiprocessing.get_context('spawn')) as executor:
+    pending_results = collections.deque()
+
+    for input_data_chunk in input_data_chunks:
+      pending_results.append(executor.submit(function, input_data_chunk, *arguments))
+
+      if len(pending_results) >= (INGESTION_PROCESSES * 2):
+        yield pending_results.popleft().result()
+
+    while len(pending_results) > 0:
+      yield pending_results.popleft().result()
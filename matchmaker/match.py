@@ -1,94 +1,158 @@
+import threading
 import names
+import numpy as np
 
+# The attributes of a match that Match decorates, which are columns of the matches data frame.
+MATCH_ATTRIBUTES = [
+  'score', 'age', 'sex', 'sexual_orientation', 'body_type', 'diet', 'drinks', 'drugs', 'education', 'ethnicity',
+  'have_children', 'want_children', 'pets_cats', 'pets_dogs', 'religion', 'smokes', 'speaks'
+]
+
+# The number of full names (per gender) in the name pool, and the seed for choosing them.
+NAME_POOL_SIZE = 4096
+NAME_POOL_SEED = 0
+
+# The matches for an input, from the matches data frame that Model.execute returns: a sequence of Match objects. Only
+# the data frame's columns (as arrays) and row ids are kept, rather than an object per match with its own copy of each
+# attribute, and each Match is created as it is asked for.
+class Matches:
+  __slots__ = ('columns', 'row_ids')
+
+  def __init__(self, matches_data_frame):
+    self.columns = { column: matches_data_frame[column].to_numpy() for column in MATCH_ATTRIBUTES }
+    self.row_ids = matches_data_frame.index.to_numpy()
+
+  def __len__(self):
+    return len(self.row_ids)
+
+  def __getitem__(self, position):
+    if not (-len(self.row_ids) <= position < len(self.row_ids)):
+      raise IndexError('Match position out of range.')
+
+    return Match(self, position % len(self.row_ids))
+
+  def __iter__(self):
+    for position in range(len(self.row_ids)):
+      yield Match(self, position)
+
+# A match: a view of one row of Matches, reading its attributes from the columns when they are asked for.
 class Match:
-  def __init__(self, match_row):
-    self.__score = match_row['score']
-    self.__age = match_row['age']
-    self.__sex = match_row['sex']
-    self.__sexual_orientation = match_row['sexual_orientation']
-    self.__body_type = match_row['body_type']
-    self.__diet = match_row['diet']
-    self.__drinks = match_row['drinks']
-    self.__drugs = match_row['drugs']
-    self.__education = match_row['education']
-    self.__ethnicity = match_row['ethnicity']
-    self.__have_children = match_row['have_children']
-    self.__want_children = match_row['want_children']
-    self.__pets_cats = match_row['pets_cats']
-    self.__pets_dogs = match_row['pets_dogs']
-    self.__religion = match_row['religion']
-    self.__smokes = match_row['smokes']
-    self.__speaks = match_row['speaks']
-
-  # The training data is anonymized, so generate random names to make the profile look more real.
+  __slots__ = ('matches', 'position')
+
+  def __init__(self, matches, position):
+    self.matches = matches
+    self.position = position
+
+  def attribute(self, name):
+    return self.matches.columns[name][self.position]
+
+  # The training data is anonymized, so give each profile a made-up name to make it look more real. The same profile
+  # always gets the same name (see get_name).
   def name(self):
-    name_gender = { 'm': 'male', 'f': 'female' }[self.__sex]
-    return names.get_full_name(gender = name_gender)
+    return get_name(self.matches.row_ids[self.position], self.attribute('sex'))
 
   # The following are decorator methods, one per attribute.
 
   def score(self):
-    return f'{self.__score:.0f}'
+    return f'{self.attribute("score"):.0f}'
 
   def age(self):
-    return f'{self.__age:.0f}'
+    return f'{self.attribute("age"):.0f}'
 
   def sex(self):
-    return { 'm': 'Male', 'f': 'Female' }[self.__sex]
+    return { 'm': 'Male', 'f': 'Female' }[self.attribute('sex')]
 
   def sexual_orientation(self):
-    return self.__sexual_orientation
+    return self.attribute('sexual_orientation')
 
   def body_type(self):
-    return self.__body_type.capitalize()
+    return self.attribute('body_type').capitalize()
 
   def diet(self):
-    return self.__diet.capitalize()
+    return self.attribute('diet').capitalize()
 
   def drinks(self):
-    return self.__drinks.capitalize()
+    return self.attribute('drinks').capitalize()
 
   def drugs(self):
-    return self.__drugs.capitalize()
+    return self.attribute('drugs').capitalize()
 
   def education(self):
-    return self.__education.capitalize().replace('_', ' ')
+    return self.attribute('education').capitalize().replace('_', ' ')
 
   def ethnicity(self):
-    return self.__ethnicity.capitalize().replace('_', ' / ')
+    return self.attribute('ethnicity').capitalize().replace('_', ' / ')
 
   def have_children(self):
-    return 'Has children' if self.__have_children else 'Does not have children'
+    return 'Has children' if self.attribute('have_children') else 'Does not have children'
 
   def want_children(self):
-    if self.__want_children:
-      if self.__have_children:
+    if self.attribute('want_children'):
+      if self.attribute('have_children'):
         return 'wants more'
       else:
         return 'wants them'
     else:
-      if self.__have_children:
+      if self.attribute('have_children'):
         return 'don\'t want any more'
       else:
         return 'doesn\'t want any'
 
   def pets_cats(self):
-    return 'Has cat(s)' if self.__pets_cats else 'Does not have cat(s)'
+    return 'Has cat(s)' if self.attribute('pets_cats') else 'Does not have cat(s)'
 
   def pets_dogs(self):
-    if self.__pets_dogs:
+    if self.attribute('pets_dogs'):
       return 'has dog(s)'
     else:
-      if self.__pets_cats:
+      if self.attribute('pets_cats'):
         return 'does not have dog(s)'
       else:
         return 'and does not have dog(s)'
 
   def religion(self):
-    return self.__religion.capitalize()
+    return self.attribute('religion').capitalize()
 
   def smokes(self):
-    return self.__smokes.capitalize()
+    return self.attribute('smokes').capitalize()
 
   def speaks(self):
-    return self.__speaks.capitalize()
+    return self.attribute('speaks').capitalize()
+
+NAME_POOL = None
+NAME_POOL_LOCK = threading.Lock()
+
+# The made-up full name of the profile with the given row id, from the name pool for its sex.
+def get_name(row_id, sex):
+  return get_name_pool()[sex][row_id % NAME_POOL_SIZE]
+
+# The name pool: a dict of sex to a list of full names, chosen (with a fixed seed) from the names package's lists of
+# first and last names, as likely as it would choose them. Built the first time it is needed.
+def get_name_pool():
+  global NAME_POOL
+
+  with NAME_POOL_LOCK:
+    if NAME_POOL is None:
+      random_number_generator = np.random.default_rng(NAME_POOL_SEED)
+
+      last_names = choose_names(names.FILES['last'], random_number_generator)
+      NAME_POOL = {
+        sex: [
+          f'{first_name} {last_name}'
+          for first_name, last_name in zip(choose_names(names.FILES[f'first:{gender}'], random_number_generator), last_names)
+        ]
+        for sex, gender in [('m', 'male'), ('f', 'female')]
+      }
+
+    return NAME_POOL
+
+# Choose NAME_POOL_SIZE names from one of the names package's files, the same way that it does: in proportion to their
+# frequency, out of the names that make up the first 90% of people.
+def choose_names(file_path, random_number_generator):
+  with open(file_path) as names_file:
+    name_lines = [line.split() for line in names_file]
+
+  cumulative_frequencies = np.array([float(name_line[2]) for name_line in name_lines])
+  name_indices = np.searchsorted(cumulative_frequencies, random_number_generator.random(NAME_POOL_SIZE) * 90, side = 'right')
+
+  return [name_lines[name_index][0].capitalize() for name_index in name_indices]
@@ -1,5 +1,4 @@
-import math
-import scipy
+import numpy as np
 
 from . import data_preprocessing as DataPreprocessing
 
@@ -8,17 +7,29 @@ def calculate_match_score(input_data_frame, matches_data_frame):
   input_data_frame = input_data_frame.drop(columns = DataPreprocessing.DIRECT_LOOKUP_FEATURES)
   matches_data_frame = matches_data_frame.drop(columns = DataPreprocessing.DIRECT_LOOKUP_FEATURES)
 
-  input_data = input_data_frame.iloc[0].values
+  return calculate_match_scores(
+    input_data_frame.iloc[[0]].to_numpy(dtype = float),
+    matches_data_frame.to_numpy(dtype = float)
+  )[0].tolist()
 
-  match_scores = []
+# Returns a matrix of match scores, with a row per input and a column per match, for the given (preprocessed, without
+# the direct lookup features) inputs and matches feature matrices.
+def calculate_match_scores(input_features, matches_features):
+  return bray_curtis_match_scores(input_features[:, np.newaxis, :], matches_features[np.newaxis, :, :])
 
-  for index, match_data in matches_data_frame.iterrows():
-    # https://docs.scipy.org/doc/scipy/reference/generated/scipy.spatial.distance.braycurtis.html#scipy.spatial.distance.braycurtis
-    # The distance is a decimal between 0 and 1, with 0 being identical and increasing towards 1 with difference.
-    # From documentation: "The Bray-Curtis distance is in the range [0, 1] if all coordinates are positive..."
-    # Flip it so that the higher the score the more similar it is, and convert to a rounded-down percentage.
-    distance = scipy.spatial.distance.braycurtis(input_data.astype(float), match_data.values.astype(float))
-    match_score = math.floor((1 - distance) * 100)
-    match_scores.append(match_score)
+# Returns an array of match scores for each pair of rows of the given (preprocessed, without the direct lookup features)
+# inputs and matches feature matrices, i.e. the score of the first input against the first match, and so on.
+def calculate_paired_match_scores(input_features, matches_features):
+  return bray_curtis_match_scores(input_features, matches_features)
 
-  return match_scores
+# https://docs.scipy.org/doc/scipy/reference/generated/scipy.spatial.distance.braycurtis.html#scipy.spatial.distance.braycurtis
+# The distance is a decimal between 0 and 1, with 0 being identical and increasing towards 1 with difference.
+# From documentation: "The Bray-Curtis distance is in the range [0, 1] if all coordinates are positive..."
+# Flip it so that the higher the score the more similar it is, and convert to a rounded-down percentage.
+#
+# Calculated the same way that scipy does (the sum of the absolute differences over the sum of the absolute sums), but
+# over the last axis of the (broadcast) arrays, so that any number of pairs are scored in one operation.
+def bray_curtis_match_scores(input_features, matches_features):
+  distances = np.abs(input_features - matches_features).sum(axis = -1) / np.abs(input_features + matches_features).sum(axis = -1)
+
+  return np.floor((1 - distances) * 100).astype(int)
@@ -0,0 +1,208 @@
+import bisect
+import contextlib
+import os
+import threading
+import time
+
+from . import result_cache as ResultCache
+
+# Opt in to collecting metrics with the MATCHMAKER_METRICS environment variable. When not collecting, timing a stage
+# costs no more than entering a shared, do-nothing context manager, and nothing is counted.
+METRICS_ENABLED = os.environ.get('MATCHMAKER_METRICS', 'false') == 'true'
+
+# Histogram bucket upper bounds: in seconds, for timings, for counts of things (e.g. candidates), and for batch sizes.
+SECONDS_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+COUNT_BUCKETS = [1, 10, 100, 1000, 10000, 100000, 1000000, 10000000]
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+# Every metric that is collected: its type, help text and (for histograms) buckets. Metrics are labelled by anything
+# else that is passed when they are recorded (e.g. the stage).
+METRICS = {
+  'matchmaker_stage_seconds': ('histogram', 'Time spent in each stage of finding and showing matches.', SECONDS_BUCKETS),
+  'matchmaker_queries_total': ('counter', 'Inputs that matches were asked for.', None),
+  'matchmaker_candidates': ('histogram', 'Candidates (rows that pass the direct lookups) per segment searched.', COUNT_BUCKETS),
+  'matchmaker_probed_neighbors_total': ('counter', 'Neighbors returned by probing the nearest neighbors models.', None),
+  'matchmaker_discarded_neighbors_total': ('counter', 'Probed neighbors that were discarded for not being candidates.', None),
+  'matchmaker_brute_force_searches_total': ('counter', 'Searches that calculated the distance to every candidate instead of probing.', None),
+  'matchmaker_coalesced_batch_size': ('histogram', 'Queries per batch run by the coalescer.', BATCH_SIZE_BUCKETS),
+  'matchmaker_coalescing_delay_seconds': ('histogram', 'Time that queries waited for the coalescer to run their batch.', SECONDS_BUCKETS)
+}
+
+# Observations of a metric with one set of labels: a count per bucket (the last being for values above every bucket),
+# and the overall count and sum.
+class Histogram:
+  def __init__(self, buckets):
+    self.buckets = buckets
+    self.bucket_counts = [0] * (len(buckets) + 1)
+    self.count = 0
+    self.sum = 0
+
+  def observe(self, value):
+    self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.count += 1
+    self.sum += value
+
+# Every metric's counters and histograms, by their labels, rendered in the Prometheus text exposition format (see
+# render). Safe to share between threads.
+class Registry:
+  def __init__(self):
+    self.__values = {}
+    self.__lock = threading.Lock()
+
+  def increment(self, name, value = 1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+
+    with self.__lock:
+      self.__values[key] = self.__values.get(key, 0) + value
+
+  def observe(self, name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+
+    with self.__lock:
+      histogram = self.__values.get(key)
+
+      if histogram is None:
+        histogram = self.__values[key] = Histogram(METRICS[name][2])
+
+      histogram.observe(value)
+
+  def reset(self):
+    with self.__lock:
+      self.__values.clear()
+
+  # https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format
+  def render(self):
+    lines = []
+
+    with self.__lock:
+      for name, (metric_type, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+
+        for (value_name, labels), value in sorted(self.__values.items(), key = lambda item: item[0]):
+          if value_name != name:
+            continue
+
+          if metric_type == 'histogram':
+            cumulative_count = 0
+
+            for bucket, bucket_count in zip(buckets + ['+Inf'], value.bucket_counts):
+              cumulative_count += bucket_count
+              lines.append(f'{name}_bucket{format_labels(labels + (("le", bucket),))} {cumulative_count}')
+
+            lines.append(f'{name}_sum{format_labels(labels)} {value.sum}')
+            lines.append(f'{name}_count{format_labels(labels)} {value.count}')
+          else:
+            lines.append(f'{name}{format_labels(labels)} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+# Times a stage: records it in the registry, passes it to every stage hook, and to the current thread's stage timings
+# (if they are being collected).
+class Stage:
+  def __init__(self, name):
+    self.name = name
+
+  def __enter__(self):
+    for stage_start_hook in STAGE_START_HOOKS:
+      stage_start_hook(self.name)
+
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, exception_type, exception, traceback):
+    seconds = time.perf_counter() - self.start
+
+    REGISTRY.observe('matchmaker_stage_seconds', seconds, stage = self.name)
+
+    for stage_hook in STAGE_HOOKS:
+      stage_hook(self.name, seconds)
+
+    stage_timings = getattr(STAGE_TIMINGS, 'stage_timings', None)
+    if stage_timings is not None:
+      stage_timings.append((self.name, seconds))
+
+    return False
+
+def format_labels(labels):
+  if len(labels) == 0:
+    return ''
+
+  return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+# The one registry shared by everything in this process.
+REGISTRY = Registry()
+
+# Functions called with the name and duration (in seconds) of every stage timed, e.g. to log slow stages, and with the
+# name of every stage as it starts.
+STAGE_HOOKS = []
+STAGE_START_HOOKS = []
+
+# The stage timings being collected by each thread (see collect_stage_timings).
+STAGE_TIMINGS = threading.local()
+
+NO_STAGE = contextlib.nullcontext()
+
+# Time the stage within the with block, e.g. with Metrics.stage('kneighbors'): ...
+def stage(name):
+  if not METRICS_ENABLED:
+    return NO_STAGE
+
+  return Stage(name)
+
+def increment(name, value = 1, **labels):
+  if METRICS_ENABLED:
+    REGISTRY.increment(name, value, **labels)
+
+def observe(name, value, **labels):
+  if METRICS_ENABLED:
+    REGISTRY.observe(name, value, **labels)
+
+def add_stage_hook(stage_hook):
+  STAGE_HOOKS.append(stage_hook)
+
+def remove_stage_hook(stage_hook):
+  STAGE_HOOKS.remove(stage_hook)
+
+def add_stage_start_hook(stage_start_hook):
+  STAGE_START_HOOKS.append(stage_start_hook)
+
+def remove_stage_start_hook(stage_start_hook):
+  STAGE_START_HOOKS.remove(stage_start_hook)
+
+# Collect the name and duration of every stage timed by this thread within the with block, as a list of tuples, e.g. to
+# report them for a single request (see format_server_timing).
+@contextlib.contextmanager
+def collect_stage_timings():
+  previous_stage_timings = getattr(STAGE_TIMINGS, 'stage_timings', None)
+  stage_timings = STAGE_TIMINGS.stage_timings = []
+
+  try:
+    yield stage_timings
+  finally:
+    STAGE_TIMINGS.stage_timings = previous_stage_timings
+
+# The value of a Server-Timing response header for the given stage timings, with the durations (in milliseconds) of
+# stages of the same name added up. https://www.w3.org/TR/server-timing/
+def format_server_timing(stage_timings):
+  stage_milliseconds = {}
+
+  for name, seconds in stage_timings:
+    stage_milliseconds[name] = stage_milliseconds.get(name, 0) + (seconds * 1000)
+
+  return ', '.join(f'{name};dur={milliseconds:.3f}' for name, milliseconds in stage_milliseconds.items())
+
+# Every metric (and the result cache's statistics, which are always kept) in the Prometheus text exposition format.
+def render_metrics():
+  result_cache_stats = ResultCache.RESULT_CACHE.stats()
+
+  return REGISTRY.render() + ''.join(
+    f'# HELP matchmaker_result_cache_{name} {help_text}\n# TYPE matchmaker_result_cache_{name} {metric_type}\nmatchmaker_result_cache_{name} {result_cache_stats[stat]}\n'
+    for name, stat, metric_type, help_text in [
+      ('size', 'size', 'gauge', 'Results in the result cache.'),
+      ('max_size', 'max_size', 'gauge', 'The most results that the result cache keeps.'),
+      ('hits_total', 'hits', 'counter', 'Results found in the result cache.'),
+      ('misses_total', 'misses', 'counter', 'Results not found in the result cache.'),
+      ('evictions_total', 'evictions', 'counter', 'Results evicted from the result cache to make room.')
+    ]
+  )
@@ -1,143 +1,200 @@
+import numpy as np
 import pandas as pd
-from sklearn.neighbors import NearestNeighbors
 
+from . import coalescer as Coalescer
 from . import data_preprocessing as DataPreprocessing
+from . import engine as Engine
 from . import match_score_calculator as MatchScoreCalculator
-from . import serialization as Serialization
-from . import utilities as Utilities
-
-def execute(input_data, force_training, matches_to_retrieve):
-  population_data_frame = DataPreprocessing.load_input_data()
-
-  candidates_data_frame = apply_direct_lookups(input_data, population_data_frame)
-
-  # If there are no candidates to search for similarity within after applying the direct lookups, stop here.
-  if len(candidates_data_frame) == 0:
-    return input_data, []
-
-  nearest_neighbors_model = Serialization.load_model()
-
-  # If there is no pre-trained model, always train a new one. If there is, use it unless forced to re-train a new one.
-  train_model = (nearest_neighbors_model is None) or force_training
-  if train_model:
-    population_data_frame = DataPreprocessing.preprocess_input_data(population_data_frame, use_fitted_encoders = False)
-
-    # Fit and save the model, trained with the entire population.
-    # A formula of "minkowski" and p of 2 makes for a Euclidean distance metric.
-    # https://scikit-learn.org/stable/modules/generated/sklearn.neighbors.NearestNeighbors.html
-    nearest_neighbors_model = NearestNeighbors(
-      algorithm = 'auto',
-      metric = 'minkowski',
-      p = 2
-    ).fit(population_data_frame.loc[:, ~population_data_frame.columns.isin(DataPreprocessing.DIRECT_LOOKUP_FEATURES)])
-
-    Serialization.save_model(nearest_neighbors_model)
-
-  # Convert the input data vector into a dataframe and pre-process, using pre-fitted encoders.
-  input_data.pop(1) # Remove relationship_status.
-  input_data_frame = pd.DataFrame([input_data], columns = candidates_data_frame.columns)
-  input_data_frame = DataPreprocessing.preprocess_input_data(input_data_frame, use_fitted_encoders = True)
-
-  # Fetch the indices of the nearest neighbors to the input. This is among the entire population, which will need to be
-  # filtered down to candidates, so get more than we need to ensure there are enough to get the amount that we want.
-  population_indices = nearest_neighbors_model.kneighbors(
-    input_data_frame.loc[:, ~input_data_frame.columns.isin(DataPreprocessing.DIRECT_LOOKUP_FEATURES)],
-    n_neighbors = (matches_to_retrieve * 5),
-    return_distance = False
+from . import metrics as Metrics
+from . import result_cache as ResultCache
+
+# The columns of the input data, once relationship_status has been removed.
+INPUT_DATA_FRAME_COLUMNS = [column for column in DataPreprocessing.INPUT_DATA_COLUMNS_TO_USE if column != 'relationship_status']
+
+# When coalescing queries (see Coalescer), queries from concurrent threads are run together in a batch, unless training.
+def execute(input_data, force_training, matches_to_retrieve, tune_nearest_neighbors = False):
+  if Coalescer.COALESCING_ENABLED and not force_training and not tune_nearest_neighbors:
+    return COALESCER.execute(input_data, matches_to_retrieve)
+
+  return execute_batch(
+    { 0: input_data },
+    force_training = force_training,
+    matches_to_retrieve = matches_to_retrieve,
+    tune_nearest_neighbors = tune_nearest_neighbors
   )[0]
 
-  # We did inference among the entire population, now we need to reduce that down to only the candidates and filter down
-  # to the X number of results that we want.
-  #
-  # Note that population_indices are the indices (not labels) of the row in the population data frame on which the model
-  # was fitted.
-  #
-  # The returned indices are sorted by distance in ascending order, so nearest first.
-
-  nearest_neighbors_indices = []
-
-  for index, population_index in enumerate(population_indices):
-    population_label = population_data_frame.index[population_index]
-
-    if population_label in candidates_data_frame.index:
-      nearest_neighbors_indices.append(population_index)
-
-      # Stop once we have enough.
-      if len(nearest_neighbors_indices) >= matches_to_retrieve:
-        break
-
-  # Fetch the neighbors' rows from the population data frame.
-  nearest_neighbors_data_frame = population_data_frame.iloc[nearest_neighbors_indices].copy()
-
-  # If we didn't fit the model, then the population never got preprocessed. But we still want to do value consolidation
-  # and things for display purposes. So preprocess just the nearest neighbour results.
-  if not train_model:
-    nearest_neighbors_data_frame = DataPreprocessing.preprocess_input_data(nearest_neighbors_data_frame, use_fitted_encoders = True)
-
-  nearest_neighbors_match_scores = MatchScoreCalculator.calculate_match_score(input_data_frame, nearest_neighbors_data_frame)
-
-  # Reverse some of the data preprocessing to make the data frames prettier for output.
-  input_data_frame, nearest_neighbors_data_frame = map(
-    Utilities.reverse_preprocessing,
-    (input_data_frame, nearest_neighbors_data_frame)
+# Find matches for many inputs at once. input_rows is a dict of input id to input data (each in the same format as for
+# execute), and the results are a dict of input id to the same tuple that execute returns. The inputs are preprocessed
+# together, and searched together in one batch per distinct set of direct lookups, rather than one by one.
+#
+# Each stage is timed (see Metrics).
+def execute_batch(input_rows, matches_to_retrieve, force_training = False, tune_nearest_neighbors = False):
+  Metrics.increment('matchmaker_queries_total', len(input_rows))
+
+  # Use the one engine state throughout (its population, models and encoders), even if the engine is loaded again part
+  # way through.
+  with Metrics.stage('engine_refresh'):
+    engine_state = Engine.get_engine(force_training = force_training, tune_nearest_neighbors = tune_nearest_neighbors).state
+
+  encoders = engine_state.encoders
+  population_version = engine_state.population_version
+
+  input_ids = list(input_rows.keys())
+  input_rows = list(input_rows.values())
+
+  # Convert the input data vectors into a dataframe and pre-process, using pre-fitted encoders.
+  input_data_frame = pd.DataFrame(
+    [input_data[:1] + input_data[2:] for input_data in input_rows], # Remove relationship_status.
+    columns = INPUT_DATA_FRAME_COLUMNS
   )
-
-  # Zip the match scores into the nearest neighbors as the first column and sort by them.
-  nearest_neighbors_data_frame.insert(loc = 0, column = 'score', value = nearest_neighbors_match_scores)
-  nearest_neighbors_data_frame.sort_values(by = 'score', ascending = False, inplace = True, ignore_index = True)
-
-  return input_data_frame, nearest_neighbors_data_frame
-
-# Apply pure logic-based filters to the population for features that must be exact, not merely similar.
-def apply_direct_lookups(input_data, population_data_frame):
-  input_sex = input_data[2]
-  input_sexual_orientation = input_data[3]
-  input_speaks = input_data[14]
-
-  candidates_data_frame = population_data_frame
+  # The input's display attributes are its consolidated values, kept from before they are encoded.
+  with Metrics.stage('preprocess_input'):
+    input_data_frame = DataPreprocessing.consolidate_input_data(input_data_frame)
+    input_display_data_frame = DataPreprocessing.build_display_data_frame(input_data_frame)
+    input_data_frame = DataPreprocessing.encode_input_data(input_data_frame, use_fitted_encoders = True, encoders = encoders)
+    input_features = input_data_frame.loc[:, ~input_data_frame.columns.isin(DataPreprocessing.DIRECT_LOOKUP_FEATURES)].to_numpy(dtype = float)
+
+  # Inputs with no candidates get the input data back with no matches.
+  results = {
+    input_ids[input_position]: (input_rows[input_position], []) for input_position in range(len(input_rows))
+  }
+
+  # Group the inputs that haven't been cached by their direct lookups: the sex and sexual_orientation segments of the
+  # population that are compatible with the input, and the input language.
+  input_groups = {}
+  input_result_cache_keys = [None] * len(input_rows)
+
+  for input_position, input_data in enumerate(input_rows):
+    input_sex = input_data[2]
+    input_sexual_orientation = input_data[3]
+    input_speaks = input_data[14]
+
+    input_result_cache_key = ResultCache.build_key(
+      input_features[input_position], input_sex, input_sexual_orientation, input_speaks, matches_to_retrieve
+    )
+    cached_result = ResultCache.RESULT_CACHE.get(population_version, input_result_cache_key)
+
+    # Copy cached results, as they are shared with every other query for the same input.
+    if cached_result is not None:
+      results[input_ids[input_position]] = tuple(data_frame.copy() for data_frame in cached_result)
+      continue
+
+    input_result_cache_keys[input_position] = input_result_cache_key
+
+    input_group_key = (tuple(compatible_segments(input_sex, input_sexual_orientation)), input_speaks)
+    input_groups.setdefault(input_group_key, []).append(input_position)
+
+  nearest_neighbors_indices = [None] * len(input_rows)
+
+  for (segments, input_speaks), input_positions in input_groups.items():
+    # Apply pure logic-based filters to the population for features that must be exact, not merely similar: down to the
+    # compatible segments, and to rows that speak the input language.
+    with Metrics.stage('candidates_mask'):
+      candidates_mask = engine_state.build_candidates_mask(segments, input_speaks)
+
+    # If there are no candidates to search for similarity within after applying the direct lookups, skip the search.
+    if not candidates_mask.any():
+      continue
+
+    # Fetch the indices (not labels) of the nearest candidates to each input. This only searches the compatible segments
+    # and only returns candidates, so is exactly the number that we want (unless there are fewer candidates than that).
+    with Metrics.stage('kneighbors'):
+      group_nearest_neighbors_indices = engine_state.kneighbors(
+        input_features[input_positions],
+        segments = segments,
+        n_neighbors = matches_to_retrieve,
+        candidates_mask = candidates_mask
+      )
+
+    for input_position, input_nearest_neighbors_indices in zip(input_positions, group_nearest_neighbors_indices):
+      nearest_neighbors_indices[input_position] = input_nearest_neighbors_indices
+
+  matched_input_positions = [
+    input_position for input_position in range(len(input_rows)) if nearest_neighbors_indices[input_position] is not None
+  ]
+
+  if len(matched_input_positions) == 0:
+    return results
+
+  # Fetch every input's neighbors' features and display attributes (labelled by their row ids in the population, which
+  # identify the profiles) from the population snapshot in one go, and keep track of where each input's neighbors start
+  # and end.
+  nearest_neighbors_bounds = np.cumsum([0] + [len(nearest_neighbors_indices[input_position]) for input_position in matched_input_positions])
+  all_nearest_neighbors_indices = np.concatenate([nearest_neighbors_indices[input_position] for input_position in matched_input_positions])
+
+  with Metrics.stage('fetch_population_rows'):
+    nearest_neighbors_features = engine_state.fetch_population_features(all_nearest_neighbors_indices)
+    nearest_neighbors_data_frame = engine_state.fetch_population_display_rows(all_nearest_neighbors_indices)
+
+  # Score every input against each of its neighbors in one go.
+  with Metrics.stage('match_scores'):
+    nearest_neighbors_match_scores = MatchScoreCalculator.calculate_paired_match_scores(
+      np.repeat(input_features[matched_input_positions], np.diff(nearest_neighbors_bounds), axis = 0),
+      nearest_neighbors_features
+    )
+
+  with Metrics.stage('assemble_results'):
+    for match, input_position in enumerate(matched_input_positions):
+      input_nearest_neighbors_data_frame = nearest_neighbors_data_frame.iloc[nearest_neighbors_bounds[match]:nearest_neighbors_bounds[match + 1]].copy()
+
+      # Zip the match scores into the nearest neighbors as the first column and sort by them.
+      input_nearest_neighbors_data_frame.insert(loc = 0, column = 'score', value = nearest_neighbors_match_scores[nearest_neighbors_bounds[match]:nearest_neighbors_bounds[match + 1]])
+      input_nearest_neighbors_data_frame.sort_values(by = 'score', ascending = False, inplace = True)
+
+      result = (input_display_data_frame.iloc[[input_position]].reset_index(drop = True), input_nearest_neighbors_data_frame)
+
+      ResultCache.RESULT_CACHE.put(population_version, input_result_cache_keys[input_position], result)
+      results[input_ids[input_position]] = tuple(data_frame.copy() for data_frame in result)
+
+  return results
+
+COALESCER = Coalescer.Coalescer(execute_batch, Coalescer.COALESCING_WINDOW, Coalescer.COALESCING_MAX_BATCH_SIZE)
+
+# Load the engine (training if necessary) and run a representative query for each combination of sex and sexual
+# orientation, so that everything that is loaded or cached on first use (the engine, the candidates masks, the
+# consolidated values, etc) is ready before the first real query.
+def warm_up(matches_to_retrieve):
+  warm_up_input_data = [
+    '30', # age
+    'single', # relationship_status
+    None, # sex
+    None, # sexual_orientation
+    'average', # body_type
+    'anything', # diet
+    'socially', # drinks
+    'never', # drugs
+    'graduated from college/university', # education
+    'white', # ethnicity
+    'doesn\'t have kids, but wants them', # offspring
+    'likes dogs and likes cats', # pets
+    'agnosticism', # religion
+    'no', # smokes
+    'english' # speaks
+  ]
+
+  warm_up_input_rows = {}
+
+  for sex in DataPreprocessing.SEX_VALUES:
+    for sexual_orientation in DataPreprocessing.SEXUAL_ORIENTATION_VALUES:
+      warm_up_input_rows[(sex, sexual_orientation)] = warm_up_input_data[:2] + [sex, sexual_orientation] + warm_up_input_data[4:]
+
+  execute_batch(warm_up_input_rows, matches_to_retrieve = matches_to_retrieve)
+
+# Returns a list of the (sex, sexual_orientation) segments of the population that are compatible with the input.
+def compatible_segments(input_sex, input_sexual_orientation):
+  other_sex = { 'm': 'f', 'f': 'm' }[input_sex]
 
   # If input is straight:
-  # * Filter sex to other sex.
-  # * Filter sexual_orientation to straight and bisexual.
+  # * Sex is the other sex and sexual_orientation is straight or bisexual.
   if input_sexual_orientation == 'straight':
-    candidates_data_frame = candidates_data_frame[
-      candidates_data_frame['sex'].isin([{ 'm': 'f', 'f': 'm' }[input_sex]]) &
-      candidates_data_frame['sexual_orientation'].isin(['straight', 'bisexual'])
-    ]
+    return [(other_sex, 'straight'), (other_sex, 'bisexual')]
   # If input is gay:
-  # * Filter sex to input sex.
-  # * Filter sexual_orientation to gay and bisexual.
+  # * Sex is the input sex and sexual_orientation is gay or bisexual.
   elif input_sexual_orientation == 'gay':
-    candidates_data_frame = candidates_data_frame[
-      (candidates_data_frame['sex'] == input_sex)
-      &
-      candidates_data_frame['sexual_orientation'].isin(['gay', 'bisexual'])
-    ]
+    return [(input_sex, 'gay'), (input_sex, 'bisexual')]
   # If input is bisexual:
-  # * If input is male, filter:
-  #   - (sex is male) and (sexual_orientation is gay or bisexual)
-  #   - or
-  #   - (sex is female) and (sexual_orientation is straight or bisexual)
-  # * If input is female, filter:
-  #   - (sex is male) and (sexual_orientation is straight or bisexual)
-  #   - or
-  #   - (sex is female) and (sexual_orientation is gay or bisexual)
+  # * (sex is the input sex) and (sexual_orientation is gay or bisexual)
+  # * or
+  # * (sex is the other sex) and (sexual_orientation is straight or bisexual)
   elif input_sexual_orientation == 'bisexual':
-    if input_sex == 'm':
-      candidates_data_frame = candidates_data_frame[
-        ((candidates_data_frame['sex'] == 'm') & candidates_data_frame['sexual_orientation'].isin(['gay', 'bisexual']))
-        |
-        ((candidates_data_frame['sex'] == 'f') & candidates_data_frame['sexual_orientation'].isin(['straight', 'bisexual']))
-      ]
-    elif input_sex == 'f':
-      candidates_data_frame = candidates_data_frame[
-        ((candidates_data_frame['sex'] == 'm') & candidates_data_frame['sexual_orientation'].isin(['straight', 'bisexual']))
-        |
-        ((candidates_data_frame['sex'] == 'f') & candidates_data_frame['sexual_orientation'].isin(['gay', 'bisexual']))
-      ]
-
-  # Filter by the input language. This is a comma-separated list of languages; filter down to any row that includes the
-  # input language, meaning there will be at least one language in common.
-  candidates_data_frame = candidates_data_frame[candidates_data_frame['speaks'].str.contains(input_speaks)]
-
-  return candidates_data_frame
+    return [(input_sex, 'gay'), (input_sex, 'bisexual'), (other_sex, 'straight'), (other_sex, 'bisexual')]
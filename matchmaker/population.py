@@ -0,0 +1,90 @@
+import os.path
+import time
+import pandas as pd
+
+from . import data_preprocessing as DataPreprocessing
+from . import engine as Engine
+from . import serialization as Serialization
+
+# Relative from the project root directory. Matches DataPreprocessing.INPUT_DATA_FILE_PATTERN, so that the profiles are
+# part of the input data from then on, and sorts after the original input data files.
+ADDED_PROFILES_FILE_PATH_FORMAT = os.path.join('data/okcupid_profiles_added_{timestamp}.csv')
+
+# Change the population without building the population snapshot (or training the models) again. See Engine for how
+# the changes are stored and searched. The engine is refreshed afterwards, so the changes are reflected in the next
+# query, and in every other process's next query, as they see that the population manifest has changed.
+#
+# Row IDs are the labels of the population rows, i.e. the index of the data frames of matches.
+
+# Ingest any input data files that have been added to the data directory since the population was built (e.g. a new
+# shard of profiles). Engines do this by themselves as soon as they notice the files, so this is only needed to do it
+# ahead of time.
+def ingest_new_input_data_files():
+  Engine.get_engine()
+
+# Add the given profiles (a data frame, or a list of dicts, with the input data columns) to the population. They are
+# written to a new input data file, so that they are kept when the population is built again, and ingested from it.
+# Returns the row ID that each profile was given, in the same order as the profiles, with None for any that are filtered
+# out of the input data (see DataPreprocessing.filter_input_data).
+def add_profiles(profiles):
+  profiles_data_frame = pd.DataFrame(profiles).reindex(columns = DataPreprocessing.INPUT_DATA_COLUMN_NAMES)
+
+  Engine.get_engine()
+
+  with Serialization.lock_population():
+    model_artifact = Serialization.load_model_artifact(DataPreprocessing.MODEL_ARTIFACT_SCHEMA)
+    population_manifest = Serialization.load_population_manifest()
+
+    added_profiles_file_path = ADDED_PROFILES_FILE_PATH_FORMAT.format(timestamp = time.time_ns())
+    profiles_data_frame.to_csv(added_profiles_file_path, index = False)
+
+    # Read back what was written, the same as any other input data file. Its index is each profile's position.
+    input_data = DataPreprocessing.filter_input_data(DataPreprocessing.read_input_data_file(added_profiles_file_path))
+    profile_positions = list(input_data.index)
+
+    row_ids_start = population_manifest['next_row_id']
+
+    Engine.ingest_population_delta(
+      DataPreprocessing.reindex_data_frame(input_data.copy()),
+      model_artifact,
+      population_manifest,
+      input_data_file_paths = [added_profiles_file_path]
+    )
+
+  Engine.get_engine()
+
+  row_ids = [None] * len(profiles_data_frame)
+
+  for row_id, profile_position in enumerate(profile_positions, start = row_ids_start):
+    row_ids[profile_position] = row_id
+
+  return row_ids
+
+# Remove the rows with the given row IDs from the population. They are kept in the population snapshot (or delta) until
+# it is next compacted, but are never matched again, and stay removed when the population is compacted.
+def remove_profiles(row_ids):
+  Engine.get_engine()
+
+  with Serialization.lock_population():
+    population_manifest = Serialization.load_population_manifest()
+
+    Serialization.save_population_manifest(dict(
+      population_manifest,
+      removed_row_ids = sorted(set(population_manifest['removed_row_ids']) | set(int(row_id) for row_id in row_ids))
+    ))
+
+  Engine.get_engine()
+
+# Build the population snapshot again from the input data files, with the deltas' rows and without the removed rows,
+# with the same fitted encoders and nearest neighbors tuning. Engines do this by themselves once the deltas or removed
+# rows grow past Engine.POPULATION_COMPACTION_THRESHOLD, so this is only needed to do it sooner.
+def compact():
+  Engine.get_engine()
+
+  with Serialization.lock_population():
+    Engine.build_population_snapshot(
+      Serialization.load_model_artifact(DataPreprocessing.MODEL_ARTIFACT_SCHEMA),
+      population_manifest = Serialization.load_population_manifest()
+    )
+
+  Engine.get_engine()
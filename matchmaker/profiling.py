@@ -0,0 +1,200 @@
+import cProfile
+import io
+import os
+import os.path
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+from . import ingestion as Ingestion
+from . import metrics as Metrics
+
+# The files written to the output directory: the cProfile statistics (for pstats, snakeviz, etc), the sampled call
+# stacks in the collapsed format (one line per stack, e.g. "main;execute;execute_batch 42", for flamegraph.pl,
+# speedscope, etc) and the report that is also printed.
+PROFILE_STATS_FILE_NAME = 'matchmaker.pstats'
+COLLAPSED_STACKS_FILE_NAME = 'matchmaker.collapsed'
+REPORT_FILE_NAME = 'report.txt'
+
+# How often (in seconds) to sample the call stack, and how many functions and allocation sites to report.
+SAMPLING_INTERVAL = 0.001
+TOP_FUNCTIONS = 25
+TOP_ALLOCATION_SITES = 10
+
+# Samples the call stack of a thread (the one that created it) from a background thread, counting each distinct stack.
+# Unlike cProfile's caller/callee pairs, these are whole stacks, so they can be drawn as a flame graph.
+class StackSampler:
+  def __init__(self, sampling_interval = SAMPLING_INTERVAL):
+    self.sampling_interval = sampling_interval
+    self.thread_id = threading.get_ident()
+    self.stack_counts = {}
+    self.__stopped = threading.Event()
+    self.__thread = threading.Thread(target = self.__sample, daemon = True)
+
+  def start(self):
+    self.__thread.start()
+
+  def stop(self):
+    self.__stopped.set()
+    self.__thread.join()
+
+  def __sample(self):
+    while not self.__stopped.wait(self.sampling_interval):
+      frame = sys._current_frames().get(self.thread_id)
+      stack = []
+
+      while frame is not None:
+        stack.append(f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})')
+        frame = frame.f_back
+
+      stack = ';'.join(reversed(stack))
+      self.stack_counts[stack] = self.stack_counts.get(stack, 0) + 1
+
+  def write_collapsed_stacks(self, output_path):
+    with open(output_path, 'w') as output_file:
+      for stack, count in sorted(self.stack_counts.items()):
+        output_file.write(f'{stack} {count}\n')
+
+# Attributes memory allocated (according to tracemalloc) to the pipeline stages timed by Metrics. The traces are cleared
+# as each stage starts and ends, so a snapshot only ever has to be taken of what was allocated since, which is quick.
+# For each stage, the peak memory allocated while it ran, and the sites of the memory still allocated when it ended (its
+# results and anything it cached, rather than temporaries), are recorded. Allocations within a stage nested in another
+# are attributed to both. The given profiler is paused while recording, so that it isn't counted.
+class StageAllocationTracker:
+  def __init__(self, profiler):
+    self.profiler = profiler
+    self.stage_allocations = {}
+    self.stage_peak_bytes = {}
+    self.__open_stages = []
+
+  def stage_started(self, name):
+    self.__record_allocations()
+    self.__open_stages.append((name, {}, [0]))
+
+  def stage_ended(self, name, seconds):
+    self.__record_allocations()
+    name, site_allocations, peak_bytes = self.__open_stages.pop()
+
+    add_site_allocations(self.stage_allocations.setdefault(name, {}), site_allocations)
+    self.stage_peak_bytes[name] = max(self.stage_peak_bytes.get(name, 0), peak_bytes[0])
+
+    if len(self.__open_stages) > 0:
+      parent_name, parent_site_allocations, parent_peak_bytes = self.__open_stages[-1]
+      add_site_allocations(parent_site_allocations, site_allocations)
+      parent_peak_bytes[0] = max(parent_peak_bytes[0], peak_bytes[0])
+
+  # Attribute what was allocated since the traces were last cleared (and is still allocated) to the innermost open stage,
+  # and clear them. Clearing the traces also resets the peak.
+  def __record_allocations(self):
+    self.profiler.disable()
+
+    if len(self.__open_stages) > 0:
+      name, site_allocations, peak_bytes = self.__open_stages[-1]
+      peak_bytes[0] = max(peak_bytes[0], tracemalloc.get_traced_memory()[1])
+
+      # Leaving out what was allocated by profiling (e.g. the stack samples).
+      for statistic in tracemalloc.take_snapshot().statistics('lineno'):
+        if statistic.traceback[0].filename not in [tracemalloc.__file__, __file__]:
+          add_site_allocations(
+            site_allocations,
+            { f'{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}': (statistic.size, statistic.count) }
+          )
+
+    tracemalloc.clear_traces()
+    self.profiler.enable()
+
+  def format_report(self, top_allocation_sites = TOP_ALLOCATION_SITES):
+    lines = []
+
+    for name, site_allocations in self.stage_allocations.items():
+      lines.append(
+        f'{name}: peak {self.stage_peak_bytes[name] / 1024:.1f} KiB, '
+        f'still allocated at the end {sum(size for size, count in site_allocations.values()) / 1024:.1f} KiB'
+      )
+
+      for site, (size, count) in sorted(site_allocations.items(), key = lambda item: item[1][0], reverse = True)[:top_allocation_sites]:
+        lines.append(f'  {size / 1024:>10.1f} KiB {count:>8} blocks  {site}')
+
+    return '\n'.join(lines)
+
+def add_site_allocations(site_allocations, other_site_allocations):
+  for site, (size, count) in other_site_allocations.items():
+    total_size, total_count = site_allocations.get(site, (0, 0))
+    site_allocations[site] = (total_size + size, total_count + count)
+
+# Call the given function the given number of times (passing it the call's index), under cProfile, a stack sampler and
+# tracemalloc, attributing the time and memory allocated to each pipeline stage timed by Metrics (which is turned on for
+# the duration; see StageAllocationTracker). Sizes are added up over every call. Input data is ingested in this process,
+# rather than in a pool, so that training is profiled too.
+#
+# Writes the profile statistics, the collapsed stacks and a report (also returned) to the output directory.
+def profile(function, calls, output_directory, sampling_interval = SAMPLING_INTERVAL):
+  os.makedirs(output_directory, exist_ok = True)
+
+  stage_seconds = {}
+
+  def stage_timed(name, seconds):
+    total_seconds, count = stage_seconds.get(name, (0, 0))
+    stage_seconds[name] = (total_seconds + seconds, count + 1)
+
+  profiler = cProfile.Profile()
+  stage_allocation_tracker = StageAllocationTracker(profiler)
+  stack_sampler = StackSampler(sampling_interval = sampling_interval)
+
+  metrics_enabled = Metrics.METRICS_ENABLED
+  ingestion_processes = Ingestion.INGESTION_PROCESSES
+
+  Metrics.METRICS_ENABLED = True
+  Ingestion.INGESTION_PROCESSES = 1
+
+  try:
+    Metrics.add_stage_start_hook(stage_allocation_tracker.stage_started)
+    Metrics.add_stage_hook(stage_allocation_tracker.stage_ended)
+    Metrics.add_stage_hook(stage_timed)
+    tracemalloc.start()
+    stack_sampler.start()
+
+    start = time.perf_counter()
+
+    try:
+      for call in range(calls):
+        profiler.enable()
+
+        try:
+          function(call)
+        finally:
+          profiler.disable()
+    finally:
+      seconds = time.perf_counter() - start
+
+      stack_sampler.stop()
+      tracemalloc.stop()
+      Metrics.remove_stage_hook(stage_timed)
+      Metrics.remove_stage_hook(stage_allocation_tracker.stage_ended)
+      Metrics.remove_stage_start_hook(stage_allocation_tracker.stage_started)
+  finally:
+    Metrics.METRICS_ENABLED = metrics_enabled
+    Ingestion.INGESTION_PROCESSES = ingestion_processes
+
+  profiler.dump_stats(os.path.join(output_directory, PROFILE_STATS_FILE_NAME))
+  stack_sampler.write_collapsed_stacks(os.path.join(output_directory, COLLAPSED_STACKS_FILE_NAME))
+
+  functions_report = io.StringIO()
+  pstats.Stats(profiler, stream = functions_report).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+  report = '\n\n'.join([
+    f'{calls} calls in {seconds:.3f}s (profiled, so slower than usual).',
+    'Time per stage (total, mean):\n' + '\n'.join(
+      f'{name:<24} {total_seconds:>10.3f}s {(total_seconds / count) * 1000:>10.3f}ms'
+      for name, (total_seconds, count) in stage_seconds.items()
+    ),
+    'Memory per stage (the highest peak of any one run of it, and what was still allocated at the end of it, added up over every run, by site):\n' + stage_allocation_tracker.format_report(),
+    'Top functions by cumulative time:\n' + functions_report.getvalue().strip()
+  ])
+
+  with open(os.path.join(output_directory, REPORT_FILE_NAME), 'w') as report_file:
+    report_file.write(report + '\n')
+
+  return report
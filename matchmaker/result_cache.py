@@ -0,0 +1,78 @@
+import collections
+import threading
+
+# The maximum number of results to keep. Each result is an input's (small) data frame and its matches data frame, so
+# this bounds the memory used to roughly that many times the size of a page of matches.
+RESULT_CACHE_MAX_SIZE = 2048
+
+# A bounded cache of match results, evicting the least recently used result once it is full. Keys are built from the
+# input once it has been preprocessed (see build_key), so inputs that only differ in ways that don't survive
+# preprocessing (e.g. values that are consolidated to the same value) share a result.
+#
+# Results are only valid for the version of the population that they were found in (see Engine.EngineState.population_version),
+# which changes whenever the population is built again or profiles are added or removed, so the cache is emptied
+# whenever it is asked for a result from a different one. Safe to share between threads.
+class ResultCache:
+  def __init__(self, max_size):
+    self.max_size = max_size
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+    self.__results = collections.OrderedDict()
+    self.__population_version = None
+    self.__lock = threading.Lock()
+
+  # Returns the result cached for the given key, or None if there isn't one.
+  def get(self, population_version, key):
+    with self.__lock:
+      self.__invalidate(population_version)
+
+      result = self.__results.get(key)
+
+      if result is None:
+        self.misses += 1
+      else:
+        self.hits += 1
+        self.__results.move_to_end(key)
+
+      return result
+
+  def put(self, population_version, key, result):
+    with self.__lock:
+      self.__invalidate(population_version)
+
+      self.__results[key] = result
+      self.__results.move_to_end(key)
+
+      while len(self.__results) > self.max_size:
+        self.__results.popitem(last = False)
+        self.evictions += 1
+
+  def clear(self):
+    with self.__lock:
+      self.__results.clear()
+
+  def stats(self):
+    with self.__lock:
+      return {
+        'size': len(self.__results),
+        'max_size': self.max_size,
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions
+      }
+
+  def __invalidate(self, population_version):
+    if population_version != self.__population_version:
+      self.__results.clear()
+      self.__population_version = population_version
+
+# The key for an input: its encoded features (minus the direct lookup features, which are matched exactly), its direct
+# lookup values as they are used to filter candidates, and the number of matches.
+def build_key(input_features, input_sex, input_sexual_orientation, input_speaks, matches_to_retrieve):
+  return (input_features.tobytes(), input_sex, input_sexual_orientation, input_speaks, matches_to_retrieve)
+
+# The one result cache shared by everything in this process.
+RESULT_CACHE = ResultCache(max_size = RESULT_CACHE_MAX_SIZE)
@@ -1,14 +1,210 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
 import os.path
+import uuid
 import joblib
+import numpy as np
 
 # Relative from the project root directory.
-NEAREST_NEIGHBORS_MODEL_PATH = 'models/nearest_neighbors_entire_population.skmodel'
+MODEL_ARTIFACT_PATH = 'models/matchmaker.skmodel'
+POPULATION_SNAPSHOT_PATH = 'models/population_snapshot.bin'
+POPULATION_DELTA_PATH_FORMAT = 'models/population_delta_{delta_id}.bin'
+POPULATION_MANIFEST_PATH = 'models/population_manifest.json'
+POPULATION_MANIFEST_LOCK_PATH = 'models/population_manifest.lock'
 
-def load_model():
-  if os.path.isfile(NEAREST_NEIGHBORS_MODEL_PATH):
-    return joblib.load(NEAREST_NEIGHBORS_MODEL_PATH) 
-  else:
+# The model artifact is the one file holding everything that training produces: the trained models, the fitted encoders
+# and the feature columns, along with a hash of the schema that they were saved with (see load_model_artifact) and a
+# unique id, so that other files built alongside it (i.e. the population snapshot) can tell if they belong to it. Saved
+# uncompressed, so that the arrays within it can be memory-mapped on load rather than copied.
+# Bump the version whenever the contents change, so that older model artifacts fail to load rather than being misused.
+MODEL_ARTIFACT_VERSION = 4
+
+# The population snapshot is a fixed-layout binary file so that it can be memory-mapped read-only, meaning every process
+# that loads it (e.g. every web server worker) shares the one copy in the OS page cache. The layout is:
+# * 8 bytes: magic number.
+# * 8 bytes: little-endian unsigned length of the header.
+# * The header: UTF-8 JSON containing the layout version, metadata, and the name, dtype, shape and offset of each section.
+# * The sections: each one a C-ordered array, starting on an aligned offset.
+# Bump the version whenever the layout or the contents change, so that older snapshots get rebuilt rather than loaded.
+POPULATION_SNAPSHOT_MAGIC = b'MMSNAPSH'
+POPULATION_SNAPSHOT_VERSION = 6
+POPULATION_SNAPSHOT_ALIGNMENT = 64
+
+# Returns the model artifact (a dict), or None if there is no model artifact. The arrays within it are memory-mapped
+# copy-on-write, so are shared with every other process that loads it until (if ever) they are written to.
+#
+# Fails (rather than returning a model artifact that doesn't fit the code) if it was saved with a different version or
+# schema (anything JSON-serializable describing what the contents depend on) to the given one.
+def load_model_artifact(schema):
+  if not os.path.isfile(MODEL_ARTIFACT_PATH):
+    return None
+
+  model_artifact = joblib.load(MODEL_ARTIFACT_PATH, mmap_mode = 'c')
+
+  if (not isinstance(model_artifact, dict)) or (model_artifact.get('schema_hash') != build_schema_hash(schema)):
+    raise ValueError(f'The model artifact at {MODEL_ARTIFACT_PATH} was saved with a different version or schema; train the model again.')
+
+  return model_artifact
+
+# Save the given model artifact (a dict) along with the hash of the given schema, and return its id (a new random one,
+# unless one is given, e.g. to have already written it into files built alongside it). Written to a temporary file and
+# then renamed over the top, so that a process loading the model artifact never sees it half-written.
+def save_model_artifact(model_artifact, schema, model_artifact_id = None):
+  model_artifact = dict(model_artifact, id = model_artifact_id or uuid.uuid4().hex, schema_hash = build_schema_hash(schema))
+
+  temporary_model_artifact_path = f'{MODEL_ARTIFACT_PATH}.{os.getpid()}.tmp'
+
+  joblib.dump(model_artifact, temporary_model_artifact_path, compress = 0)
+  os.replace(temporary_model_artifact_path, MODEL_ARTIFACT_PATH)
+
+  return model_artifact['id']
+
+def build_schema_hash(schema):
+  return hashlib.sha256(
+    json.dumps({ 'version': MODEL_ARTIFACT_VERSION, 'schema': schema }, sort_keys = True).encode('utf-8')
+  ).hexdigest()
+
+# Returns a tuple of the snapshot's metadata and a dict of its sections (as read-only arrays backed by the memory-mapped
+# file), or None if there is no snapshot or it was written with a different layout version. Population deltas (see
+# Engine.ingest_population_delta) are written in the same layout, and loaded by passing their path.
+def load_population_snapshot(snapshot_path = None):
+  snapshot_path = snapshot_path or POPULATION_SNAPSHOT_PATH
+
+  if not os.path.isfile(snapshot_path):
+    return None
+
+  with open(snapshot_path, 'rb') as snapshot_file:
+    if snapshot_file.read(len(POPULATION_SNAPSHOT_MAGIC)) != POPULATION_SNAPSHOT_MAGIC:
+      return None
+
+    header_length = int.from_bytes(snapshot_file.read(8), byteorder = 'little')
+    header = json.loads(snapshot_file.read(header_length).decode('utf-8'))
+
+  if header['version'] != POPULATION_SNAPSHOT_VERSION:
     return None
 
-def save_model(nearest_neighbors_model):
-  joblib.dump(nearest_neighbors_model, NEAREST_NEIGHBORS_MODEL_PATH)
+  snapshot_buffer = np.memmap(snapshot_path, dtype = np.uint8, mode = 'r')
+
+  sections = {
+    section['name']: np.ndarray(
+      shape = tuple(section['shape']),
+      dtype = np.dtype(section['dtype']),
+      buffer = snapshot_buffer,
+      offset = section['offset']
+    )
+    for section in header['sections']
+  }
+
+  return header['metadata'], sections
+
+# Write the given metadata (anything JSON-serializable) and sections (a dict of section name to array) to the snapshot
+# file. Written to a temporary file and then renamed over the top, so that a process loading the snapshot never sees it
+# half-written, and processes that already have the previous snapshot mapped keep their (still valid) copy.
+def save_population_snapshot(metadata, sections, snapshot_path = None):
+  section_layouts = { name: (np.asarray(array).dtype, np.shape(array)) for name, array in sections.items() }
+
+  with create_population_snapshot(metadata, section_layouts, snapshot_path) as snapshot_sections:
+    for name, array in sections.items():
+      snapshot_sections[name][...] = array
+
+# Create a snapshot file with the given metadata and sections (a dict of section name to a tuple of its dtype and shape),
+# and yield its sections as writable arrays backed by the memory-mapped file, to be filled in (e.g. bit by bit, for
+# populations too large to hold in memory at once). The same as save_population_snapshot, the file is written to a
+# temporary path, and only renamed into place once the block completes.
+@contextlib.contextmanager
+def create_population_snapshot(metadata, section_layouts, snapshot_path = None):
+  snapshot_path = snapshot_path or POPULATION_SNAPSHOT_PATH
+  section_layouts = { name: (np.dtype(dtype), tuple(shape)) for name, (dtype, shape) in section_layouts.items() }
+
+  # The header contains the section offsets, which depend on the length of the header, so reserve plenty of room for
+  # the offsets by measuring a header with placeholder offsets of the maximum possible length.
+  header = {
+    'version': POPULATION_SNAPSHOT_VERSION,
+    'metadata': metadata,
+    'sections': [
+      { 'name': name, 'dtype': dtype.str, 'shape': list(shape), 'offset': 2 ** 63 }
+      for name, (dtype, shape) in section_layouts.items()
+    ]
+  }
+  header_length = len(json.dumps(header).encode('utf-8'))
+
+  offset = align_offset(len(POPULATION_SNAPSHOT_MAGIC) + 8 + header_length)
+  for section in header['sections']:
+    section['offset'] = offset
+    dtype, shape = section_layouts[section['name']]
+    offset = align_offset(offset + (dtype.itemsize * int(np.prod(shape))))
+
+  header_bytes = json.dumps(header).encode('utf-8').ljust(header_length)
+
+  temporary_snapshot_path = f'{snapshot_path}.{os.getpid()}.tmp'
+
+  with open(temporary_snapshot_path, 'wb') as snapshot_file:
+    snapshot_file.write(POPULATION_SNAPSHOT_MAGIC)
+    snapshot_file.write(header_length.to_bytes(8, byteorder = 'little'))
+    snapshot_file.write(header_bytes)
+    snapshot_file.truncate(max(offset, snapshot_file.tell()))
+
+  try:
+    snapshot_buffer = np.memmap(temporary_snapshot_path, dtype = np.uint8, mode = 'r+')
+
+    sections = {
+      section['name']: np.ndarray(
+        shape = tuple(section['shape']),
+        dtype = np.dtype(section['dtype']),
+        buffer = snapshot_buffer,
+        offset = section['offset']
+      )
+      for section in header['sections']
+    }
+
+    yield sections
+
+    snapshot_buffer.flush()
+    del sections, snapshot_buffer
+  except BaseException:
+    os.remove(temporary_snapshot_path)
+    raise
+
+  os.replace(temporary_snapshot_path, snapshot_path)
+
+# The population manifest records what the population is made up of on top of the population snapshot: the input data
+# files that have been processed, the population deltas added since the snapshot was built, and the rows removed. See
+# Engine for how it is used. Returns None if there is no manifest.
+def load_population_manifest():
+  if not os.path.isfile(POPULATION_MANIFEST_PATH):
+    return None
+
+  with open(POPULATION_MANIFEST_PATH, 'r') as manifest_file:
+    return json.load(manifest_file)
+
+# Written to a temporary file and then renamed over the top, the same as the population snapshot. Every manifest saved
+# is given a new random revision, which identifies that version of the population. Returns the manifest saved.
+def save_population_manifest(manifest):
+  manifest = dict(manifest, revision = uuid.uuid4().hex)
+
+  temporary_manifest_path = f'{POPULATION_MANIFEST_PATH}.{os.getpid()}.tmp'
+
+  with open(temporary_manifest_path, 'w') as manifest_file:
+    json.dump(manifest, manifest_file, indent = 2)
+
+  os.replace(temporary_manifest_path, POPULATION_MANIFEST_PATH)
+
+  return manifest
+
+# Exclusive lock (across processes) for changing the population, i.e. the snapshot, the deltas and the manifest, so that
+# two processes don't both build or add to it at once.
+@contextlib.contextmanager
+def lock_population():
+  with open(POPULATION_MANIFEST_LOCK_PATH, 'a') as lock_file:
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+    try:
+      yield
+    finally:
+      fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def align_offset(offset):
+  return -(-offset // POPULATION_SNAPSHOT_ALIGNMENT) * POPULATION_SNAPSHOT_ALIGNMENT
@@ -0,0 +1,68 @@
+import threading
+import unittest
+from unittest import mock
+
+from matchmaker import Coalescer
+from matchmaker import Metrics
+
+class TestCoalescer(unittest.TestCase):
+  def setUp(self):
+    self.batches = []
+
+  def batch_function(self, input_rows, matches_to_retrieve):
+    self.batches.append((list(input_rows.values()), matches_to_retrieve))
+
+    if 'error' in input_rows.values():
+      raise ValueError('error')
+
+    return { input_id: (input_data, matches_to_retrieve) for input_id, input_data in input_rows.items() }
+
+  # Execute each input (with the number of matches) in its own thread, at the same time. Returns the results (or the
+  # exceptions raised) in the same order.
+  def execute_concurrently(self, coalescer, inputs):
+    results = [None] * len(inputs)
+    barrier = threading.Barrier(len(inputs))
+
+    def execute(position, input_data, matches_to_retrieve):
+      barrier.wait()
+
+      try:
+        results[position] = coalescer.execute(input_data, matches_to_retrieve)
+      except ValueError as exception:
+        results[position] = exception
+
+    threads = [threading.Thread(target = execute, args = (position,) + inputs[position]) for position in range(len(inputs))]
+
+    for thread in threads:
+      thread.start()
+
+    for thread in threads:
+      thread.join()
+
+    return results
+
+  def test_coalesces(self):
+    coalescer = Coalescer.Coalescer(self.batch_function, window = 1, max_batch_size = 4)
+    registry = Metrics.Registry()
+
+    with mock.patch.object(Metrics, 'METRICS_ENABLED', True), mock.patch.object(Metrics, 'REGISTRY', registry):
+      results = self.execute_concurrently(coalescer, [(input_data, 40) for input_data in 'abcd'] + [('e', 10)])
+
+    # The batch of four is run as soon as it is full, and the other number of matches is run on its own (after the
+    # window).
+    self.assertEqual(results, [('a', 40), ('b', 40), ('c', 40), ('d', 40), ('e', 10)])
+    self.assertEqual(sorted((sorted(input_rows), matches_to_retrieve) for input_rows, matches_to_retrieve in self.batches), [(['a', 'b', 'c', 'd'], 40), (['e'], 10)])
+    self.assertIn('matchmaker_coalesced_batch_size_count 2', registry.render())
+    self.assertIn('matchmaker_coalesced_batch_size_sum 5', registry.render())
+    self.assertIn('matchmaker_coalescing_delay_seconds_count 5', registry.render())
+
+  def test_exception(self):
+    coalescer = Coalescer.Coalescer(self.batch_function, window = 1, max_batch_size = 2)
+
+    results = self.execute_concurrently(coalescer, [('a', 40), ('error', 40)])
+
+    self.assertEqual(len(self.batches), 1)
+    self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
@@ -195,5 +196,87 @@ class TestDataPreprocessing(unittest.TestCase):
       check_dtype = False
     )
 
+class TestDirectLookupEncodings(unittest.TestCase):
+  def test_encode_direct_lookup_codes(self):
+    self.assertEqual(
+      list(DataPreprocessing.encode_direct_lookup_codes(pd.Series(['m', 'f', 'f', 'x']), DataPreprocessing.SEX_VALUES)),
+      [0, 1, 1, -1]
+    )
+
+  def test_encode_speaks_languages(self):
+    speaks_languages = DataPreprocessing.encode_speaks_languages(pd.Series([
+      'english',
+      'english (fluently), spanish (poorly)',
+      'hindi (fluently), c++, russian',
+      'mandarin (okay)',
+      'c++'
+    ]))
+
+    def bitmask(*languages):
+      return sum(1 << DataPreprocessing.SPEAKS_LANGUAGES.index(language) for language in languages)
+
+    self.assertEqual(
+      list(speaks_languages),
+      [
+        bitmask('english'),
+        bitmask('english', 'spanish'),
+        bitmask('hindi', 'russian'),
+        bitmask('mandarin_chinese'),
+        0
+      ]
+    )
+
+class TestEncoders(unittest.TestCase):
+  def setUp(self):
+    self.raw_data_frame = pd.DataFrame(
+      [
+        ['30', 'm', 'straight', 'thin', 'anything', 'rarely', 'never', 'graduated from college/university', 'white', 'wants kids', 'has dogs', 'christianity', 'no', 'english'],
+        ['25', 'f', 'gay', 'a little extra', 'vegan', 'very often', 'often', 'dropped out of space camp', 'hispanic / latin', 'has a kid', 'has cats', 'judaism', 'sometimes', 'english'],
+        ['41', 'f', 'straight', 'fit', 'vegetarian', 'socially', 'never', 'graduated from masters program', 'asian', 'doesn\'t want kids', 'has dogs and has cats', 'buddhism', 'yes', 'english, japanese']
+      ],
+      columns = [column for column in DataPreprocessing.INPUT_DATA_COLUMNS_TO_USE if column != 'relationship_status']
+    )
+
+    # Neither building nor fitting new bundles should touch (or load) the shared fitted bundle.
+    for patcher in [
+      mock.patch.object(DataPreprocessing, 'FITTED_ENCODERS', None),
+      mock.patch.object(DataPreprocessing, 'reload_fitted_encoders', side_effect = AssertionError('Loaded the fitted encoders.'))
+    ]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def test_new_encoders(self):
+    encoders = DataPreprocessing.build_encoders(use_fitted_encoders = False)
+    other_encoders = DataPreprocessing.build_encoders(use_fitted_encoders = False)
+
+    for field in DataPreprocessing.Encoders._fields:
+      self.assertIsNot(getattr(encoders, field), getattr(other_encoders, field))
+      self.assertFalse(hasattr(getattr(encoders, field), 'n_features_in_'))
+
+    self.assertEqual(encoders.age_scaler.feature_range, DataPreprocessing.CONTINUOUS_FEATURE_AGE_SCALER_RANGE)
+    self.assertIsNone(DataPreprocessing.FITTED_ENCODERS)
+
+  # Preprocessing fits and uses the bundle that it is given, and only that bundle, so fitting another bundle (e.g. when
+  # training again) doesn't change how the first one encodes. (Preprocessing changes the data frame in place, so each
+  # run gets a copy.)
+  def test_given_encoders(self):
+    encoders = DataPreprocessing.build_encoders(use_fitted_encoders = False)
+    preprocessed_data_frame = DataPreprocessing.preprocess_input_data(self.raw_data_frame.copy(), use_fitted_encoders = False, encoders = encoders)
+
+    self.assertEqual(encoders.age_scaler.n_samples_seen_, 3)
+    self.assertAlmostEqual(preprocessed_data_frame['age'].max(), DataPreprocessing.CONTINUOUS_FEATURE_AGE_SCALER_RANGE[1])
+
+    other_encoders = DataPreprocessing.build_encoders(use_fitted_encoders = False)
+    DataPreprocessing.preprocess_input_data(self.raw_data_frame.iloc[:2].copy(), use_fitted_encoders = False, encoders = other_encoders)
+
+    self.assertEqual(other_encoders.age_scaler.n_samples_seen_, 2)
+    self.assertEqual(encoders.age_scaler.n_samples_seen_, 3)
+
+    assert_frame_equal(
+      DataPreprocessing.preprocess_input_data(self.raw_data_frame.copy(), use_fitted_encoders = True, encoders = encoders),
+      preprocessed_data_frame
+    )
+    self.assertIsNone(DataPreprocessing.FITTED_ENCODERS)
+
 if __name__ == '__main__':
   unittest.main()
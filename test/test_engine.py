@@ -0,0 +1,255 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+from matchmaker import DataPreprocessing
+from matchmaker import Engine
+from matchmaker import Ingestion
+from matchmaker import Model
+
+# Write an input data file of the given number of random (but valid) profiles.
+def write_input_data_file(input_data_file_path, rows, seed):
+  random_number_generator = np.random.default_rng(seed)
+
+  def choose(*values):
+    return values[random_number_generator.integers(len(values))]
+
+  pd.DataFrame([
+    {
+      'age': random_number_generator.integers(18, 70),
+      'relationship_status': 'single',
+      'sex': choose('m', 'f'),
+      'sexual_orientation': choose('straight', 'straight', 'gay', 'bisexual'),
+      'body_type': choose('thin', 'average', 'fit', 'curvy', 'a little extra'),
+      'diet': choose('anything', 'vegetarian', 'vegan'),
+      'drinks': choose('not at all', 'rarely', 'socially', 'often'),
+      'drugs': choose('never', 'sometimes', 'often'),
+      'education': choose('high school', 'graduated from college/university', 'graduated from masters program'),
+      'ethnicity': choose('white', 'asian', 'black', 'hispanic / latin', 'white, other'),
+      'offspring': choose('wants kids', 'doesn\'t want kids', 'has a kid', 'has kids, but doesn\'t want more'),
+      'pets': choose('likes dogs and likes cats', 'has cats', 'has dogs', 'dislikes cats'),
+      'religion': choose('agnosticism', 'atheism', 'christianity', 'judaism', 'buddhism'),
+      'smokes': choose('no', 'sometimes', 'yes'),
+      'speaks': choose('english', 'english, spanish', 'english (fluently), french')
+    }
+    for row in range(rows)
+  ]).reindex(columns = DataPreprocessing.INPUT_DATA_COLUMN_NAMES).to_csv(input_data_file_path, index = False)
+
+class TestEngine(unittest.TestCase):
+  def setUp(self):
+    self.temporary_directory = tempfile.TemporaryDirectory()
+    self.input_data_file_path = os.path.join(self.temporary_directory.name, 'okcupid_profiles_1.csv')
+
+    with open(self.input_data_file_path, 'w') as input_data_file:
+      input_data_file.write('age\n30\n')
+
+  def tearDown(self):
+    self.temporary_directory.cleanup()
+
+  def build_source_fingerprint(self):
+    with mock.patch.object(DataPreprocessing, 'INPUT_DATA_FILE_PATTERN', os.path.join(self.temporary_directory.name, '*.csv')):
+      return Engine.build_source_fingerprint()
+
+  def test_source_fingerprint_unchanged(self):
+    self.assertEqual(self.build_source_fingerprint(), self.build_source_fingerprint())
+
+  def test_source_fingerprint_changed(self):
+    source_fingerprint = self.build_source_fingerprint()
+
+    with open(self.input_data_file_path, 'a') as input_data_file:
+      input_data_file.write('25\n')
+
+    self.assertNotEqual(self.build_source_fingerprint(), source_fingerprint)
+
+  def test_not_loaded(self):
+    self.assertFalse(Engine.Engine().is_loaded())
+
+  def test_input_data_files_changed(self):
+    population_manifest = { 'input_data_files': [Engine.describe_input_data_file(self.input_data_file_path)] }
+
+    self.assertFalse(Engine.are_input_data_files_changed(population_manifest))
+
+    with open(self.input_data_file_path, 'a') as input_data_file:
+      input_data_file.write('25\n')
+
+    self.assertTrue(Engine.are_input_data_files_changed(population_manifest))
+
+  def test_population_compaction_due(self):
+    population_manifest = { 'deltas': [{ 'rows': 5 }], 'removed_row_ids': [1, 2], 'snapshot_rows': 100, 'snapshot_removed_rows': 1 }
+
+    self.assertFalse(Engine.is_population_compaction_due(population_manifest))
+    self.assertTrue(Engine.is_population_compaction_due(dict(population_manifest, deltas = [{ 'rows': 5 }, { 'rows': 6 }])))
+    self.assertTrue(Engine.is_population_compaction_due(dict(population_manifest, removed_row_ids = list(range(12)))))
+
+class TestTuneNearestNeighborsModel(unittest.TestCase):
+  def test_tune_nearest_neighbors_model(self):
+    population_features = np.random.default_rng(0).random((300, 4))
+    segments = [{ 'start': 0, 'stop': 100 }, { 'start': 100, 'stop': 300 }]
+
+    nearest_neighbors_tuning = Engine.tune_nearest_neighbors_model(population_features, segments)
+
+    self.assertIn(nearest_neighbors_tuning['parameters'], Engine.NEAREST_NEIGHBORS_TUNING_CANDIDATES)
+    self.assertEqual(
+      [timing['parameters'] for timing in nearest_neighbors_tuning['timings']],
+      Engine.NEAREST_NEIGHBORS_TUNING_CANDIDATES
+    )
+
+    for timing in nearest_neighbors_tuning['timings']:
+      self.assertEqual(timing['recall'], 1.0)
+
+class TestSearchSegment(unittest.TestCase):
+  def setUp(self):
+    random_number_generator = np.random.default_rng(0)
+
+    self.segment_features = random_number_generator.random((2000, 4))
+    self.features = random_number_generator.random((20, 4))
+    self.random_number_generator = random_number_generator
+
+  # Search with the given candidates mask, checking that each row gets exactly the nearest n_neighbors candidates (or all
+  # of them, if there are fewer), by comparing distances to those of a brute force search of the candidates, as ties
+  # could be broken either way. Returns the probe sizes that the model was searched with.
+  def search(self, candidates_mask, n_neighbors = 10):
+    nearest_neighbors_model = Engine.train_nearest_neighbors_model(self.segment_features)
+
+    with mock.patch.object(nearest_neighbors_model, 'kneighbors', wraps = nearest_neighbors_model.kneighbors) as kneighbors:
+      results = Engine.search_segment(nearest_neighbors_model, self.segment_features, self.features, n_neighbors, candidates_mask)
+
+    candidate_indices = np.flatnonzero(candidates_mask)
+
+    for row_features, (distances, indices) in zip(self.features, results):
+      candidate_distances = np.sqrt(((self.segment_features[candidate_indices] - row_features) ** 2).sum(axis = 1))
+
+      self.assertEqual(len(indices), min(n_neighbors, len(candidate_indices)))
+      self.assertEqual(len(set(indices)), len(indices))
+      self.assertTrue(candidates_mask[indices].all())
+      np.testing.assert_allclose(distances, np.sqrt(((self.segment_features[indices] - row_features) ** 2).sum(axis = 1)))
+      np.testing.assert_allclose(distances, np.sort(candidate_distances)[:n_neighbors])
+
+    return [call.kwargs['n_neighbors'] for call in kneighbors.call_args_list]
+
+  def build_candidates_mask(self, density):
+    return self.random_number_generator.random(len(self.segment_features)) < density
+
+  def test_dense_candidates(self):
+    self.assertEqual(self.search(self.build_candidates_mask(0.5)), [10 * Engine.INITIAL_PROBE_OVERSAMPLING])
+
+  def test_selective_candidates(self):
+    # Fewer candidates than one in every INITIAL_PROBE_OVERSAMPLING rows, so probes have to grow.
+    probe_sizes = self.search(self.build_candidates_mask(0.08))
+
+    self.assertGreater(len(probe_sizes), 1)
+    self.assertEqual(
+      probe_sizes,
+      [10 * Engine.INITIAL_PROBE_OVERSAMPLING * (Engine.PROBE_GROWTH_FACTOR ** probe) for probe in range(len(probe_sizes))]
+    )
+
+  def test_brute_force(self):
+    # Plenty of candidates, but all of them far from the inputs, so no probe finds any before covering
+    # BRUTE_FORCE_PROBE_FRACTION of the segment.
+    candidates_mask = self.build_candidates_mask(0.3)
+    self.segment_features[candidates_mask] += 10
+
+    probe_sizes = self.search(candidates_mask)
+
+    self.assertLess(probe_sizes[-1], len(self.segment_features) * Engine.BRUTE_FORCE_PROBE_FRACTION)
+    self.assertGreaterEqual(probe_sizes[-1] * Engine.PROBE_GROWTH_FACTOR, len(self.segment_features) * Engine.BRUTE_FORCE_PROBE_FRACTION)
+
+  def test_fewer_candidates_than_neighbors(self):
+    candidates_mask = np.zeros(len(self.segment_features), dtype = bool)
+    candidates_mask[[3, 500, 1999]] = True
+
+    self.assertEqual(self.search(candidates_mask), [])
+
+  def test_no_candidates(self):
+    self.assertEqual(self.search(np.zeros(len(self.segment_features), dtype = bool)), [])
+
+class TestPopulationFeatureDtype(unittest.TestCase):
+  def setUp(self):
+    self.temporary_directory = tempfile.TemporaryDirectory()
+    self.working_directory = os.getcwd()
+
+    os.chdir(self.temporary_directory.name)
+    os.mkdir('data')
+    os.mkdir('models')
+
+    write_input_data_file('data/okcupid_profiles_1.csv', rows = 500, seed = 0)
+
+  def tearDown(self):
+    os.chdir(self.working_directory)
+    self.temporary_directory.cleanup()
+
+  def execute_batch(self, population_feature_dtype, input_rows):
+    engine = Engine.Engine()
+
+    # Loading the engine replaces the shared fitted encoders, so put them back afterwards.
+    with mock.patch.object(Engine, 'POPULATION_FEATURE_DTYPE', population_feature_dtype), mock.patch.object(Engine, 'ENGINE', engine), \
+      mock.patch.object(Ingestion, 'INGESTION_PROCESSES', 1), mock.patch.object(DataPreprocessing, 'FITTED_ENCODERS', None):
+      return engine, Model.execute_batch(input_rows, matches_to_retrieve = 20)
+
+  def test_matches_unchanged(self):
+    input_rows = {
+      (sex, sexual_orientation): [
+        '30', 'single', sex, sexual_orientation, 'thin', 'anything', 'rarely', 'never', 'graduated from college/university',
+        'white', 'wants kids', 'has dogs', 'christianity', 'no', 'english'
+      ]
+      for sex in DataPreprocessing.SEX_VALUES
+      for sexual_orientation in DataPreprocessing.SEXUAL_ORIENTATION_VALUES
+    }
+
+    engine, results = self.execute_batch('float64', input_rows)
+    compact_engine, compact_results = self.execute_batch('float32', input_rows)
+
+    self.assertEqual(compact_engine.state.population_features.dtype, np.float32)
+    self.assertEqual(compact_engine.state.memory_usage()['population_features'] * 2, engine.state.memory_usage()['population_features'])
+
+    for input_id, (input_data_frame, matches_data_frame) in results.items():
+      compact_input_data_frame, compact_matches_data_frame = compact_results[input_id]
+
+      self.assertGreater(len(matches_data_frame), 0)
+      pd.testing.assert_frame_equal(compact_input_data_frame, input_data_frame)
+      pd.testing.assert_frame_equal(compact_matches_data_frame, matches_data_frame)
+
+class TestEngineState(unittest.TestCase):
+  def setUp(self):
+    self.temporary_directory = tempfile.TemporaryDirectory()
+    self.working_directory = os.getcwd()
+
+    os.chdir(self.temporary_directory.name)
+    os.mkdir('data')
+    os.mkdir('models')
+
+    write_input_data_file('data/okcupid_profiles_1.csv', rows = 300, seed = 0)
+
+  def tearDown(self):
+    os.chdir(self.working_directory)
+    self.temporary_directory.cleanup()
+
+  def test_load_publishes_new_state(self):
+    engine = Engine.Engine()
+    segments = Model.compatible_segments('m', 'straight')
+
+    with mock.patch.object(Ingestion, 'INGESTION_PROCESSES', 1), mock.patch.object(DataPreprocessing, 'FITTED_ENCODERS', None):
+      engine_state = engine.refresh().state
+      candidates_mask = engine_state.build_candidates_mask(segments, 'english')
+
+      write_input_data_file('data/okcupid_profiles_2.csv', rows = 50, seed = 1)
+      new_engine_state = engine.refresh().state
+
+    self.assertIsNot(new_engine_state, engine_state)
+    self.assertEqual(len(new_engine_state.population_row_ids), len(engine_state.population_row_ids) + 50)
+    self.assertNotEqual(new_engine_state.population_version, engine_state.population_version)
+
+    # The previous state still answers queries against its own population, as one that is part way through would.
+    features = engine_state.fetch_population_features(np.arange(5))
+    self.assertIs(engine_state.build_candidates_mask(segments, 'english'), candidates_mask)
+
+    for nearest_neighbors_indices in engine_state.kneighbors(features, segments, n_neighbors = 10, candidates_mask = candidates_mask):
+      self.assertEqual(len(nearest_neighbors_indices), 10)
+      self.assertTrue(candidates_mask[nearest_neighbors_indices].all())
+      self.assertEqual(len(engine_state.fetch_population_display_rows(nearest_neighbors_indices)), 10)
+
+if __name__ == '__main__':
+  unittest.main()
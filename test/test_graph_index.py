@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+
+from matchmaker import GraphIndex
+
+class TestGraphIndex(unittest.TestCase):
+  def setUp(self):
+    random_number_generator = np.random.default_rng(0)
+
+    self.features = random_number_generator.random((500, 8))
+    self.queries = random_number_generator.random((20, 8))
+    self.graph_index = GraphIndex.GraphIndex(max_neighbors = 8, ef_construction = 50, ef_search = 50).fit(self.features)
+
+  def test_kneighbors(self):
+    distances, indices = self.graph_index.kneighbors(self.queries, n_neighbors = 10)
+
+    self.assertEqual(distances.shape, (20, 10))
+    self.assertEqual(indices.shape, (20, 10))
+
+    # Distances are to the rows found, nearest first.
+    np.testing.assert_allclose(distances, np.linalg.norm(self.features[indices] - self.queries[:, np.newaxis, :], axis = 2))
+    self.assertTrue((np.diff(distances, axis = 1) >= 0).all())
+
+  def test_recall(self):
+    distances, indices = self.graph_index.kneighbors(self.queries, n_neighbors = 10)
+
+    true_indices = np.argsort(np.linalg.norm(self.features - self.queries[:, np.newaxis, :], axis = 2), axis = 1)[:, :10]
+
+    recall = np.mean([len(np.intersect1d(row_true_indices, row_indices)) / 10 for row_true_indices, row_indices in zip(true_indices, indices)])
+    self.assertGreaterEqual(recall, 0.95)
+
+  # Every copy of a duplicated row is linked to the others, so the nearest of them are all found. Compared by distance,
+  # as the copies are ties (see benchmarks.nearest_neighbors).
+  def test_duplicates(self):
+    random_number_generator = np.random.default_rng(0)
+
+    features = np.repeat(random_number_generator.random((100, 8)), 20, axis = 0)
+    random_number_generator.shuffle(features)
+    queries = features[:20] + random_number_generator.normal(scale = 0.01, size = (20, 8))
+
+    graph_index = GraphIndex.GraphIndex(max_neighbors = 8, ef_construction = 50, ef_search = 50).fit(features)
+    distances, indices = graph_index.kneighbors(queries, n_neighbors = 30)
+
+    true_distances = np.sort(np.linalg.norm(features - queries[:, np.newaxis, :], axis = 2), axis = 1)[:, :30]
+
+    # Found rows count if they're no further away than the true 30th nearest row.
+    recall = np.mean((distances <= true_distances[:, -1:]) | np.isclose(distances, true_distances[:, -1:]))
+    self.assertGreaterEqual(recall, 0.95)
+
+  def test_all_rows(self):
+    distances, indices = self.graph_index.kneighbors(self.queries[:1], n_neighbors = 500)
+
+    self.assertEqual(sorted(indices[0]), list(range(500)))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+from matchmaker import DataPreprocessing
+from matchmaker import Ingestion
+from matchmaker import Serialization
+
+class TestIngestion(unittest.TestCase):
+  def setUp(self):
+    self.temporary_directory = tempfile.TemporaryDirectory()
+
+    rows = [
+      ['30', 'single', 'm', 'straight', 'thin', 'anything', 'rarely', 'never', 'graduated from college/university', 'white', 'doesn\'t have kids, but wants them', 'likes dogs and dislikes cats', 'christianity', 'no', 'english'],
+      ['25', 'single', 'f', 'gay', 'a little extra', 'vegan', 'very often', 'often', 'dropped out of space camp', 'hispanic / latin', 'has kids, but doesn\'t want more', 'has dogs and has cats', 'judaism and very serious about it', 'sometimes', 'spanish (fluently), english'],
+      ['41', 'married', 'f', 'straight', 'fit', 'vegetarian', 'socially', 'never', 'graduated from masters program', 'asian', 'has a kid', 'has cats', 'buddhism', 'yes', 'english, japanese'],
+      ['52', 'available', 'm', 'bisexual', 'average', 'mostly anything', 'often', 'sometimes', 'high school', 'black', 'doesn\'t want kids', 'has dogs', 'atheism', 'when drinking', 'french'],
+      ['19', 'single', 'f', 'straight', 'curvy', 'anything', 'not at all', 'never', 'working on college/university', 'white, other', 'wants kids', 'likes cats', 'agnosticism', 'no', 'english (poorly)']
+    ]
+    columns = [
+      'age', 'relationship_status', 'sex', 'sexual_orientation', 'body_type', 'diet', 'drinks', 'drugs', 'education',
+      'ethnicity', 'offspring', 'pets', 'religion', 'smokes', 'speaks'
+    ]
+
+    self.input_data_file_paths = [os.path.join(self.temporary_directory.name, f'okcupid_profiles_{number}.csv') for number in [1, 2]]
+
+    for input_data_file_path, file_rows in zip(self.input_data_file_paths, [rows * 3, rows[1:] * 2]):
+      pd.DataFrame(file_rows, columns = columns).reindex(columns = DataPreprocessing.INPUT_DATA_COLUMN_NAMES).to_csv(input_data_file_path, index = False)
+
+  def tearDown(self):
+    self.temporary_directory.cleanup()
+
+  def build(self, chunk_size, removed_row_ids = []):
+    with mock.patch.object(Ingestion, 'INGESTION_CHUNK_SIZE', chunk_size), mock.patch.object(Ingestion, 'INGESTION_PROCESSES', 1):
+      encoders = Ingestion.fit_encoders(self.input_data_file_paths)
+
+      with mock.patch.object(Serialization, 'POPULATION_SNAPSHOT_PATH', os.path.join(self.temporary_directory.name, 'population_snapshot.bin')):
+        with Ingestion.create_population_snapshot(self.input_data_file_paths, encoders, removed_row_ids, 'model_artifact_id') as (feature_columns, segments, sections, next_row_id):
+          return encoders, feature_columns, segments, { name: np.array(section) for name, section in sections.items() }, next_row_id
+
+  def test_fit_encoders(self):
+    encoders = self.build(chunk_size = 2)[0]
+
+    fitted_encoders = DataPreprocessing.build_encoders(use_fitted_encoders = False)
+    DataPreprocessing.preprocess_input_data(DataPreprocessing.load_input_data(self.input_data_file_paths), use_fitted_encoders = False, encoders = fitted_encoders)
+
+    for feature in Ingestion.SCALED_FEATURES:
+      scaler = getattr(encoders, f'{feature}_scaler')
+      fitted_scaler = getattr(fitted_encoders, f'{feature}_scaler')
+
+      np.testing.assert_array_equal(scaler.data_min_, fitted_scaler.data_min_)
+      np.testing.assert_array_equal(scaler.data_max_, fitted_scaler.data_max_)
+      self.assertEqual(scaler.n_samples_seen_, fitted_scaler.n_samples_seen_)
+
+    for categories, fitted_categories in zip(encoders.one_hot_encoder.categories_, fitted_encoders.one_hot_encoder.categories_):
+      np.testing.assert_array_equal(categories, fitted_categories)
+
+  def test_create_population_snapshot_chunked(self):
+    encoders, feature_columns, segments, sections, next_row_id = self.build(chunk_size = 100)
+    chunked_encoders, chunked_feature_columns, chunked_segments, chunked_sections, chunked_next_row_id = self.build(chunk_size = 2)
+
+    self.assertEqual(chunked_feature_columns, feature_columns)
+    self.assertEqual(chunked_segments, segments)
+    self.assertEqual(chunked_next_row_id, next_row_id)
+
+    for name, section in sections.items():
+      np.testing.assert_array_equal(chunked_sections[name], section)
+
+  def test_create_population_snapshot_segments(self):
+    encoders, feature_columns, segments, sections, next_row_id = self.build(chunk_size = 2, removed_row_ids = [0, 1])
+
+    # 4 of each 5 rows of the first file are in the population (married people are dropped), as are 3 of each 4 of the
+    # second.
+    self.assertEqual(next_row_id, 18)
+    self.assertEqual(len(sections['row_ids']), 16)
+    self.assertNotIn(0, sections['row_ids'])
+    self.assertNotIn(1, sections['row_ids'])
+
+    self.assertEqual(
+      [(segment['sex'], segment['sexual_orientation']) for segment in segments],
+      [('f', 'gay'), ('f', 'straight'), ('m', 'bisexual'), ('m', 'straight')]
+    )
+    self.assertEqual(segments[-1]['stop'], 16)
+
+    for segment in segments:
+      segment_row_ids = sections['row_ids'][segment['start']:segment['stop']]
+
+      # Kept in input data order within each segment.
+      np.testing.assert_array_equal(segment_row_ids, np.sort(segment_row_ids))
+      np.testing.assert_array_equal(
+        sections['sex'][segment['start']:segment['stop']],
+        DataPreprocessing.SEX_VALUES.index(segment['sex'])
+      )
+
+  def test_create_population_snapshot_display_sections(self):
+    encoders, feature_columns, segments, sections, next_row_id = self.build(chunk_size = 2)
+
+    consolidated_data_frame = DataPreprocessing.consolidate_input_data(DataPreprocessing.load_input_data(self.input_data_file_paths))
+    display_data_frame = DataPreprocessing.build_display_data_frame(consolidated_data_frame).loc[sections['row_ids']]
+    display_attribute_values = Ingestion.build_display_attribute_values(encoders)
+
+    for attribute in Ingestion.DISPLAY_SECTION_ATTRIBUTES:
+      display_section = sections[f'display_{attribute}']
+
+      if attribute in display_attribute_values:
+        display_section = np.array(display_attribute_values[attribute], dtype = object)[display_section]
+
+      np.testing.assert_array_equal(display_section, display_data_frame[attribute].to_numpy())
+
+    self.assertEqual(sections['display_age'].dtype, np.int16)
+    self.assertEqual(sections['display_ethnicity'].dtype, np.int8)
+    self.assertEqual(sections['display_have_children'].dtype, bool)
+
+if __name__ == '__main__':
+  unittest.main()
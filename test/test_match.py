@@ -25,11 +25,24 @@ class TestMatch(unittest.TestCase):
       'speaks': 'russian'
     })
 
-    self.match = Match.Match(match_data)
+    self.matches = Match.Matches(pd.DataFrame([match_data], index = pd.Index([5522], name = 'row_id')))
+    self.match = self.matches[0]
+
+  def test_matches(self):
+    self.assertEqual(len(self.matches), 1)
+    self.assertEqual([match.religion() for match in self.matches], ['Judaism'])
+
+    with self.assertRaises(IndexError):
+      self.matches[1]
 
   def test_name(self):
     self.assertIsInstance(self.match.name(), str)
 
+    # The same profile always gets the same name.
+    self.assertEqual(self.match.name(), self.match.name())
+    self.assertEqual(self.match.name(), Match.get_name(5522, 'f'))
+    self.assertNotEqual(self.match.name(), Match.get_name(5523, 'f'))
+
   def test_score(self):
     self.assertEqual(self.match.score(), '75')
 
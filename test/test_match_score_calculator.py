@@ -1,5 +1,8 @@
+import math
 import unittest
+import numpy as np
 import pandas as pd
+import scipy.spatial
 
 from matchmaker import MatchScoreCalculator
 from matchmaker import DataPreprocessing
@@ -129,13 +132,54 @@ class TestMatchScoreCalculator(unittest.TestCase):
       columns = DataPreprocessing.INPUT_DATA_COLUMNS_TO_USE
     )
 
-    input_data_frame = DataPreprocessing.preprocess_input_data(input_data_frame, use_fitted_encoders = True)
-    matches_data_frame = DataPreprocessing.preprocess_input_data(matches_data_frame, use_fitted_encoders = True)
+    self.input_data_frame = input_data_frame
+    self.matches_data_frame = matches_data_frame
 
-    self.match_scores = MatchScoreCalculator.calculate_match_score(input_data_frame, matches_data_frame)
+    # The features of the input and the matches for comparing the scorers to scipy, preprocessed with new encoders fitted
+    # to them, so that they don't need a trained model artifact.
+    features = DataPreprocessing.preprocess_input_data(
+      pd.concat([input_data_frame, matches_data_frame], ignore_index = True),
+      use_fitted_encoders = False,
+      encoders = DataPreprocessing.build_encoders(use_fitted_encoders = False)
+    ).drop(columns = DataPreprocessing.DIRECT_LOOKUP_FEATURES).to_numpy(dtype = float)
+
+    self.input_features = features[:1]
+    self.matches_features = features[1:]
 
   def test(self):
-    self.assertEqual(self.match_scores, [100, 97, 77, 64, 10])
+    input_data_frame = DataPreprocessing.preprocess_input_data(self.input_data_frame.copy(), use_fitted_encoders = True)
+    matches_data_frame = DataPreprocessing.preprocess_input_data(self.matches_data_frame.copy(), use_fitted_encoders = True)
+
+    self.assertEqual(MatchScoreCalculator.calculate_match_score(input_data_frame, matches_data_frame), [100, 97, 77, 64, 10])
+
+  def test_matrix(self):
+    # Every match against itself and every other match, as well as against the input.
+    inputs_features = np.concatenate([self.input_features, self.matches_features])
+
+    expected_match_scores = [
+      [math.floor((1 - scipy.spatial.distance.braycurtis(input_features, match_features)) * 100) for match_features in self.matches_features]
+      for input_features in inputs_features
+    ]
+
+    self.assertEqual(
+      MatchScoreCalculator.calculate_match_scores(inputs_features, self.matches_features).tolist(),
+      expected_match_scores
+    )
+
+  def test_paired(self):
+    # Each of the input and the matches paired with a different match, so that no two pairs share an input.
+    inputs_features = np.concatenate([self.input_features, self.matches_features])
+    matches_features = np.concatenate([self.matches_features, self.matches_features[::-1]])[:len(inputs_features)]
+
+    expected_match_scores = [
+      math.floor((1 - scipy.spatial.distance.braycurtis(input_features, match_features)) * 100)
+      for input_features, match_features in zip(inputs_features, matches_features)
+    ]
+
+    self.assertEqual(
+      MatchScoreCalculator.calculate_paired_match_scores(inputs_features, matches_features).tolist(),
+      expected_match_scores
+    )
  
 if __name__ == '__main__':
   unittest.main()
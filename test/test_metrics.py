@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+from matchmaker import Metrics
+
+class TestMetrics(unittest.TestCase):
+  def setUp(self):
+    self.registry = Metrics.Registry()
+
+  def test_histogram(self):
+    for value in [0.0001, 0.003, 0.003, 20]:
+      self.registry.observe('matchmaker_stage_seconds', value, stage = 'kneighbors')
+
+    rendered = self.registry.render()
+
+    self.assertIn('# TYPE matchmaker_stage_seconds histogram', rendered)
+    self.assertIn('matchmaker_stage_seconds_bucket{stage="kneighbors",le="0.0005"} 1', rendered)
+    self.assertIn('matchmaker_stage_seconds_bucket{stage="kneighbors",le="0.0025"} 1', rendered)
+    self.assertIn('matchmaker_stage_seconds_bucket{stage="kneighbors",le="0.005"} 3', rendered)
+    self.assertIn('matchmaker_stage_seconds_bucket{stage="kneighbors",le="+Inf"} 4', rendered)
+    self.assertIn('matchmaker_stage_seconds_count{stage="kneighbors"} 4', rendered)
+
+  def test_counter(self):
+    self.registry.increment('matchmaker_discarded_neighbors_total', 3)
+    self.registry.increment('matchmaker_discarded_neighbors_total', 4)
+
+    self.assertIn('matchmaker_discarded_neighbors_total 7', self.registry.render())
+
+  def test_disabled(self):
+    with mock.patch.object(Metrics, 'METRICS_ENABLED', False), mock.patch.object(Metrics, 'REGISTRY', self.registry):
+      with Metrics.collect_stage_timings() as stage_timings:
+        with Metrics.stage('kneighbors'):
+          pass
+
+      Metrics.increment('matchmaker_queries_total')
+
+    self.assertEqual(stage_timings, [])
+    self.assertNotIn('matchmaker_queries_total 1', self.registry.render())
+
+  def test_stage_timings(self):
+    stage_hook = mock.Mock()
+
+    with mock.patch.object(Metrics, 'METRICS_ENABLED', True), mock.patch.object(Metrics, 'REGISTRY', self.registry), mock.patch.object(Metrics, 'STAGE_HOOKS', [stage_hook]):
+      with Metrics.collect_stage_timings() as stage_timings:
+        for stage in ['kneighbors', 'kneighbors', 'render']:
+          with Metrics.stage(stage):
+            pass
+
+    self.assertEqual([name for name, seconds in stage_timings], ['kneighbors', 'kneighbors', 'render'])
+    self.assertEqual(stage_hook.call_count, 3)
+    self.assertIn('matchmaker_stage_seconds_count{stage="kneighbors"} 2', self.registry.render())
+
+    self.assertEqual(
+      Metrics.format_server_timing([('kneighbors', 0.001), ('render', 0.0025), ('kneighbors', 0.002)]),
+      'kneighbors;dur=3.000, render;dur=2.500'
+    )
+
+if __name__ == '__main__':
+  unittest.main()
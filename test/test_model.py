@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+
+from matchmaker import Coalescer
+from matchmaker import DataPreprocessing
+from matchmaker import Engine
+from matchmaker import Ingestion
+from matchmaker import Model
+from matchmaker import ResultCache
+from .test_engine import write_input_data_file
+
+class TestModel(unittest.TestCase):
+  def test_compatible_segments_straight(self):
+    self.assertEqual(Model.compatible_segments('m', 'straight'), [('f', 'straight'), ('f', 'bisexual')])
+    self.assertEqual(Model.compatible_segments('f', 'straight'), [('m', 'straight'), ('m', 'bisexual')])
+
+  def test_compatible_segments_gay(self):
+    self.assertEqual(Model.compatible_segments('m', 'gay'), [('m', 'gay'), ('m', 'bisexual')])
+    self.assertEqual(Model.compatible_segments('f', 'gay'), [('f', 'gay'), ('f', 'bisexual')])
+
+  def test_compatible_segments_bisexual(self):
+    self.assertEqual(
+      Model.compatible_segments('m', 'bisexual'),
+      [('m', 'gay'), ('m', 'bisexual'), ('f', 'straight'), ('f', 'bisexual')]
+    )
+    self.assertEqual(
+      Model.compatible_segments('f', 'bisexual'),
+      [('f', 'gay'), ('f', 'bisexual'), ('m', 'straight'), ('m', 'bisexual')]
+    )
+
+class TestExecuteBatch(unittest.TestCase):
+  def setUp(self):
+    self.temporary_directory = tempfile.TemporaryDirectory()
+    self.working_directory = os.getcwd()
+
+    os.chdir(self.temporary_directory.name)
+    os.mkdir('data')
+    os.mkdir('models')
+
+    write_input_data_file('data/okcupid_profiles_1.csv', rows = 600, seed = 0)
+
+    # Loading the engine replaces the shared fitted encoders, so put them back afterwards.
+    for patcher in [
+      mock.patch.object(Engine, 'ENGINE', Engine.Engine()),
+      mock.patch.object(Ingestion, 'INGESTION_PROCESSES', 1),
+      mock.patch.object(DataPreprocessing, 'FITTED_ENCODERS', None),
+      mock.patch.object(Coalescer, 'COALESCING_ENABLED', False),
+      mock.patch.object(ResultCache, 'RESULT_CACHE', ResultCache.ResultCache(max_size = 100))
+    ]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    os.chdir(self.working_directory)
+    self.temporary_directory.cleanup()
+
+  def build_input_data(self, age, sex, sexual_orientation, speaks, drinks = 'rarely'):
+    return [
+      age, 'single', sex, sexual_orientation, 'thin', 'anything', drinks, 'never', 'graduated from college/university',
+      'white', 'wants kids', 'has dogs', 'christianity', 'no', speaks
+    ]
+
+  # Each input's result in a batch is the same as its result on its own, whichever segments and languages the other
+  # inputs in the batch are looking in, whether or not they have any candidates, and whether or not their results were
+  # already cached.
+  def test_same_as_execute(self):
+    input_rows = {
+      10: self.build_input_data('30', 'm', 'straight', 'english'),
+      11: self.build_input_data('45', 'f', 'straight', 'spanish'),
+      12: self.build_input_data('25', 'm', 'gay', 'english'),
+      13: self.build_input_data('30', 'm', 'straight', 'japanese'), # Nobody speaks Japanese, so no candidates.
+      14: self.build_input_data('52', 'f', 'bisexual', 'french', drinks = 'often'),
+      15: self.build_input_data('30', 'm', 'straight', 'english', drinks = 'socially'),
+      16: self.build_input_data('38', 'f', 'gay', 'english'),
+      17: self.build_input_data('21', 'm', 'bisexual', 'spanish'),
+      18: self.build_input_data('30', 'm', 'straight', 'english') # The same as the first.
+    }
+
+    expected_results = {}
+
+    for input_id, input_data in input_rows.items():
+      ResultCache.RESULT_CACHE.clear()
+      expected_results[input_id] = Model.execute(input_data, force_training = False, matches_to_retrieve = 10)
+
+    # Cache some of the inputs' results first, so that the batch has both hits and misses, interleaved.
+    ResultCache.RESULT_CACHE.clear()
+    Model.execute_batch({ input_id: input_rows[input_id] for input_id in [11, 14, 16] }, matches_to_retrieve = 10)
+
+    results = Model.execute_batch(input_rows, matches_to_retrieve = 10)
+
+    self.assertEqual(list(results.keys()), list(input_rows.keys()))
+    self.assertEqual(ResultCache.RESULT_CACHE.stats()['hits'], 3)
+
+    for input_id, (input_data_frame, matches_data_frame) in results.items():
+      expected_input_data_frame, expected_matches_data_frame = expected_results[input_id]
+
+      if input_id == 13:
+        self.assertEqual(input_data_frame, expected_input_data_frame)
+        self.assertEqual(matches_data_frame, [])
+        self.assertEqual(expected_matches_data_frame, [])
+        continue
+
+      self.assertEqual(len(matches_data_frame), 10)
+      pd.testing.assert_frame_equal(input_data_frame, expected_input_data_frame)
+      pd.testing.assert_frame_equal(matches_data_frame, expected_matches_data_frame)
+
+if __name__ == '__main__':
+  unittest.main()
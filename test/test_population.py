@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+from matchmaker import DataPreprocessing
+from matchmaker import Engine
+from matchmaker import Ingestion
+from matchmaker import Model
+from matchmaker import Population
+from matchmaker import Serialization
+from .test_engine import write_input_data_file
+
+class TestPopulation(unittest.TestCase):
+  def setUp(self):
+    self.temporary_directory = tempfile.TemporaryDirectory()
+    self.working_directory = os.getcwd()
+
+    os.chdir(self.temporary_directory.name)
+    os.mkdir('data')
+    os.mkdir('models')
+
+    write_input_data_file('data/okcupid_profiles_1.csv', rows = 300, seed = 0)
+
+    # Loading the engine replaces the shared fitted encoders, so put them back afterwards.
+    for patcher in [
+      mock.patch.object(Engine, 'ENGINE', Engine.Engine()),
+      mock.patch.object(Ingestion, 'INGESTION_PROCESSES', 1),
+      mock.patch.object(DataPreprocessing, 'FITTED_ENCODERS', None)
+    ]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+    self.input_data = [
+      '30', 'single', 'm', 'straight', 'thin', 'anything', 'rarely', 'never', 'graduated from college/university', 'white',
+      'wants kids', 'has dogs', 'christianity', 'no', 'english'
+    ]
+
+  def tearDown(self):
+    os.chdir(self.working_directory)
+    self.temporary_directory.cleanup()
+
+  def execute(self):
+    return Model.execute(self.input_data, force_training = False, matches_to_retrieve = 20)[1]
+
+  def test_add_remove_and_compact(self):
+    engine_state = Engine.get_engine().state
+    matches_data_frame = self.execute()
+
+    np.testing.assert_array_equal(np.sort(engine_state.population_row_ids), np.arange(300))
+
+    # Profiles that are exactly what the input is looking for, apart from one that is filtered out of the population (and
+    # so isn't given a row ID).
+    profile = {
+      'age': 30, 'relationship_status': 'single', 'sex': 'f', 'sexual_orientation': 'straight', 'body_type': 'thin',
+      'diet': 'anything', 'drinks': 'rarely', 'drugs': 'never', 'education': 'graduated from college/university',
+      'ethnicity': 'white', 'offspring': 'wants kids', 'pets': 'has dogs', 'religion': 'christianity', 'smokes': 'no',
+      'speaks': 'english'
+    }
+    added_row_ids = Population.add_profiles([profile, dict(profile, relationship_status = 'married'), profile, profile])
+
+    self.assertEqual(added_row_ids, [300, None, 301, 302])
+
+    added_row_ids = [row_id for row_id in added_row_ids if row_id is not None]
+
+    added_engine_state = Engine.get_engine().state
+    population_manifest = Serialization.load_population_manifest()
+
+    self.assertNotEqual(added_engine_state.population_version, engine_state.population_version)
+    self.assertEqual(len(population_manifest['deltas']), 1)
+    self.assertEqual(population_manifest['next_row_id'], 303)
+    np.testing.assert_array_equal(added_engine_state.population_row_ids[-3:], added_row_ids)
+
+    added_matches_data_frame = self.execute()
+
+    self.assertEqual(set(added_matches_data_frame.index[:3]), set(added_row_ids))
+    self.assertEqual(list(added_matches_data_frame['score'][:3]), [100] * 3)
+
+    # Remove one of the added profiles and the best of the original matches.
+    removed_row_ids = [301, int(matches_data_frame.index[0])]
+    Population.remove_profiles(removed_row_ids)
+
+    removed_matches_data_frame = self.execute()
+
+    self.assertNotEqual(Engine.get_engine().state.population_version, added_engine_state.population_version)
+    self.assertEqual(Serialization.load_population_manifest()['removed_row_ids'], sorted(removed_row_ids))
+    self.assertFalse(removed_matches_data_frame.index.isin(removed_row_ids).any())
+    self.assertEqual(set(removed_matches_data_frame.index[:2]), { 300, 302 })
+
+    # Compacting rebuilds the snapshot with the delta's rows and without the removed ones, keeping every row ID, so the
+    # matches are the same.
+    Population.compact()
+
+    compacted_engine_state = Engine.get_engine().state
+    population_manifest = Serialization.load_population_manifest()
+
+    self.assertEqual(population_manifest['deltas'], [])
+    self.assertEqual(population_manifest['removed_row_ids'], sorted(removed_row_ids))
+    self.assertEqual(len(compacted_engine_state.population_delta_features), 0)
+    np.testing.assert_array_equal(
+      np.sort(compacted_engine_state.population_row_ids),
+      np.setdiff1d(np.arange(303), removed_row_ids)
+    )
+
+    compacted_matches_data_frame = self.execute()
+
+    pd.testing.assert_frame_equal(
+      compacted_matches_data_frame.sort_values(['score', 'row_id'], ascending = [False, True]),
+      removed_matches_data_frame.sort_values(['score', 'row_id'], ascending = [False, True])
+    )
+
+    # Profiles added after compacting carry on from the last row ID given out, even though some have been removed.
+    self.assertEqual(Population.add_profiles([profile]), [303])
+
+if __name__ == '__main__':
+  unittest.main()
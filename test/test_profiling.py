@@ -0,0 +1,46 @@
+import os.path
+import tempfile
+import unittest
+
+from matchmaker import Ingestion
+from matchmaker import Metrics
+from matchmaker import Profiling
+
+class TestProfiling(unittest.TestCase):
+  def test_profile(self):
+    def build_lists(call):
+      with Metrics.stage('build_lists'):
+        return [list(range(1000)) for _ in range(100)]
+
+    with tempfile.TemporaryDirectory() as output_directory:
+      report = Profiling.profile(build_lists, 3, output_directory)
+
+      for file_name in [Profiling.PROFILE_STATS_FILE_NAME, Profiling.COLLAPSED_STACKS_FILE_NAME, Profiling.REPORT_FILE_NAME]:
+        self.assertTrue(os.path.exists(os.path.join(output_directory, file_name)))
+
+    self.assertIn('3 calls in', report)
+    self.assertIn('build_lists: peak', report)
+    self.assertIn('test_profiling.py:13', report)
+    self.assertEqual(Metrics.STAGE_HOOKS, [])
+    self.assertEqual(Metrics.STAGE_START_HOOKS, [])
+
+  # Metrics are turned on, and ingestion kept in this process, only while profiling, even if the function raises.
+  def test_profile_restores_settings(self):
+    metrics_enabled = Metrics.METRICS_ENABLED
+    ingestion_processes = Ingestion.INGESTION_PROCESSES
+    settings = []
+
+    def fail(call):
+      settings.append((Metrics.METRICS_ENABLED, Ingestion.INGESTION_PROCESSES))
+      raise RuntimeError()
+
+    with tempfile.TemporaryDirectory() as output_directory:
+      with self.assertRaises(RuntimeError):
+        Profiling.profile(fail, 1, output_directory)
+
+    self.assertEqual(settings, [(True, 1)])
+    self.assertEqual(Metrics.METRICS_ENABLED, metrics_enabled)
+    self.assertEqual(Ingestion.INGESTION_PROCESSES, ingestion_processes)
+
+if __name__ == '__main__':
+  unittest.main()
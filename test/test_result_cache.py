@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+
+from matchmaker import ResultCache
+
+class TestResultCache(unittest.TestCase):
+  def setUp(self):
+    self.result_cache = ResultCache.ResultCache(max_size = 2)
+
+  def test_hit_and_miss(self):
+    self.assertIsNone(self.result_cache.get('a', 'x'))
+
+    self.result_cache.put('a', 'x', 1)
+
+    self.assertEqual(self.result_cache.get('a', 'x'), 1)
+    self.assertEqual(self.result_cache.stats()['hits'], 1)
+    self.assertEqual(self.result_cache.stats()['misses'], 1)
+
+  def test_least_recently_used_evicted(self):
+    self.result_cache.put('a', 'x', 1)
+    self.result_cache.put('a', 'y', 2)
+    self.result_cache.get('a', 'x')
+    self.result_cache.put('a', 'z', 3)
+
+    self.assertEqual(self.result_cache.get('a', 'x'), 1)
+    self.assertIsNone(self.result_cache.get('a', 'y'))
+    self.assertEqual(self.result_cache.get('a', 'z'), 3)
+    self.assertEqual(self.result_cache.stats()['evictions'], 1)
+
+  def test_invalidated_by_population_version(self):
+    self.result_cache.put('a', 'x', 1)
+
+    self.assertIsNone(self.result_cache.get('b', 'x'))
+    self.assertEqual(self.result_cache.stats()['size'], 0)
+
+  def test_build_key(self):
+    self.assertEqual(
+      ResultCache.build_key(np.array([0.5, 1.0]), 'm', 'straight', 'english', 40),
+      ResultCache.build_key(np.array([0.5, 1.0]), 'm', 'straight', 'english', 40)
+    )
+    self.assertNotEqual(
+      ResultCache.build_key(np.array([0.5, 1.0]), 'm', 'straight', 'english', 40),
+      ResultCache.build_key(np.array([0.5, 1.0]), 'm', 'straight', 'english', 50)
+    )
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+
+from matchmaker import Serialization
+
+class TestSerialization(unittest.TestCase):
+  def setUp(self):
+    self.temporary_directory = tempfile.TemporaryDirectory()
+    self.population_snapshot_path = os.path.join(self.temporary_directory.name, 'population_snapshot.bin')
+    self.model_artifact_path = os.path.join(self.temporary_directory.name, 'matchmaker.skmodel')
+
+  def tearDown(self):
+    self.temporary_directory.cleanup()
+
+  def test_population_snapshot(self):
+    features = np.array([[0.5, 1, 0], [5, 0.1, 3]])
+    row_ids = np.array([7, 9], dtype = np.int64)
+    speaks = np.array([b'english', b'japanese, english (fluently)'])
+
+    with mock.patch.object(Serialization, 'POPULATION_SNAPSHOT_PATH', self.population_snapshot_path):
+      Serialization.save_population_snapshot(
+        metadata = { 'feature_columns': ['age', 'pets_cats', 'smokes'] },
+        sections = { 'features': features, 'row_ids': row_ids, 'speaks': speaks }
+      )
+
+      metadata, sections = Serialization.load_population_snapshot()
+
+    self.assertEqual(metadata, { 'feature_columns': ['age', 'pets_cats', 'smokes'] })
+    np.testing.assert_array_equal(sections['features'], features)
+    np.testing.assert_array_equal(sections['row_ids'], row_ids)
+    np.testing.assert_array_equal(sections['speaks'], speaks)
+
+    # Memory-mapped read-only, not copied.
+    self.assertFalse(sections['features'].flags.writeable)
+
+  def test_population_snapshot_missing(self):
+    with mock.patch.object(Serialization, 'POPULATION_SNAPSHOT_PATH', self.population_snapshot_path):
+      self.assertIsNone(Serialization.load_population_snapshot())
+
+  def test_population_manifest(self):
+    population_manifest_path = os.path.join(self.temporary_directory.name, 'population_manifest.json')
+
+    with mock.patch.object(Serialization, 'POPULATION_MANIFEST_PATH', population_manifest_path):
+      self.assertIsNone(Serialization.load_population_manifest())
+
+      first_manifest = Serialization.save_population_manifest({ 'removed_row_ids': [3] })
+      second_manifest = Serialization.save_population_manifest({ 'removed_row_ids': [3, 5] })
+
+      self.assertEqual(Serialization.load_population_manifest(), second_manifest)
+
+    self.assertEqual(second_manifest['removed_row_ids'], [3, 5])
+    self.assertNotEqual(first_manifest['revision'], second_manifest['revision'])
+
+  def test_model_artifact(self):
+    features = np.arange(12, dtype = np.float64).reshape(4, 3)
+
+    with mock.patch.object(Serialization, 'MODEL_ARTIFACT_PATH', self.model_artifact_path):
+      model_artifact_id = Serialization.save_model_artifact(
+        { 'feature_columns': ['age', 'pets_cats', 'smokes'], 'features': features },
+        schema = { 'feature_sort_order': ['^age$'] }
+      )
+
+      model_artifact = Serialization.load_model_artifact({ 'feature_sort_order': ['^age$'] })
+
+    self.assertEqual(model_artifact['id'], model_artifact_id)
+    self.assertEqual(model_artifact['feature_columns'], ['age', 'pets_cats', 'smokes'])
+    np.testing.assert_array_equal(model_artifact['features'], features)
+
+    # Memory-mapped, not copied.
+    self.assertIsInstance(model_artifact['features'], np.memmap)
+
+  def test_model_artifact_schema_mismatch(self):
+    with mock.patch.object(Serialization, 'MODEL_ARTIFACT_PATH', self.model_artifact_path):
+      Serialization.save_model_artifact({ 'feature_columns': ['age'] }, schema = { 'feature_sort_order': ['^age$'] })
+
+      with self.assertRaises(ValueError):
+        Serialization.load_model_artifact({ 'feature_sort_order': ['^sex$', '^age$'] })
+
+  def test_model_artifact_missing(self):
+    with mock.patch.object(Serialization, 'MODEL_ARTIFACT_PATH', self.model_artifact_path):
+      self.assertIsNone(Serialization.load_model_artifact({}))
+
+if __name__ == '__main__':
+  unittest.main()
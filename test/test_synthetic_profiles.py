@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+
+from benchmarks import synthetic_profiles as SyntheticProfiles
+from matchmaker import DataPreprocessing
+
+class TestSyntheticProfiles(unittest.TestCase):
+  def setUp(self):
+    self.temporary_directory = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.temporary_directory.cleanup()
+
+  def generate_profiles_file(self, rows, seed = 0):
+    output_path = os.path.join(self.temporary_directory.name, f'okcupid_profiles_{seed}.csv')
+    SyntheticProfiles.generate_profiles_file(rows, output_path, seed = seed)
+
+    return output_path
+
+  def test_layout(self):
+    with mock.patch.object(SyntheticProfiles, 'GENERATION_CHUNK_SIZE', 1000):
+      output_path = self.generate_profiles_file(2500)
+
+    profiles = pd.read_csv(output_path)
+
+    self.assertEqual(list(profiles.columns), DataPreprocessing.INPUT_DATA_COLUMN_NAMES)
+    self.assertEqual(len(profiles), 2500)
+
+    # Every profile that isn't filtered out can be preprocessed.
+    input_data = DataPreprocessing.load_input_data([output_path])
+    preprocessed_input_data = DataPreprocessing.preprocess_input_data(
+      input_data.copy(),
+      use_fitted_encoders = False,
+      encoders = DataPreprocessing.build_encoders(use_fitted_encoders = False)
+    )
+
+    self.assertGreater(len(input_data), 2000)
+    self.assertEqual(len(preprocessed_input_data), len(input_data))
+
+  def test_distributions(self):
+    profiles = pd.read_csv(self.generate_profiles_file(20000))
+
+    self.assertAlmostEqual((profiles['sex'] == 'm').mean(), 0.598, delta = 0.02)
+    self.assertAlmostEqual((profiles['sexual_orientation'] == 'straight').mean(), 0.86, delta = 0.02)
+    self.assertAlmostEqual(profiles['body_type'].isna().mean(), 0.088, delta = 0.02)
+    self.assertAlmostEqual(profiles['offspring'].isna().mean(), 0.593, delta = 0.02)
+    self.assertTrue(profiles['age'].between(18, 110).all())
+
+  def test_seeded(self):
+    pd.testing.assert_frame_equal(
+      pd.read_csv(self.generate_profiles_file(100, seed = 1)),
+      pd.read_csv(self.generate_profiles_file(100, seed = 1))
+    )
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,5 +1,80 @@
+import logging
+import os
+import sys
+import threading
+import time
 from django.apps import AppConfig
+from django.conf import settings
+
+# The web servers that serve the app, by the name of their script (or their package, when run with python -m). Every
+# other process that loads the apps (management commands, test runners, task queue workers, shells, etc) doesn't serve
+# requests, so doesn't warm up. Set MATCHMAKER_SERVER to warm up in a server that isn't one of these.
+SERVER_SCRIPTS = ['gunicorn', 'uvicorn', 'daphne', 'hypercorn', 'uwsgi', 'waitress-serve']
+
+# The scripts that run management commands. Of their commands, only runserver serves requests.
+MANAGEMENT_COMMAND_SCRIPTS = ['manage.py', 'django-admin', 'django-admin.py', 'django']
+
+# Whether this process serves requests. runserver serves from a child process (with RUN_MAIN set) when reloading on
+# changes, which it does by default.
+def is_server_process():
+    if getattr(settings, 'MATCHMAKER_SERVER', False):
+        return True
+
+    script = os.path.basename(sys.argv[0]) if len(sys.argv) > 0 else ''
+
+    if script == '__main__.py':
+        script = os.path.basename(os.path.dirname(sys.argv[0]))
+
+    if script in SERVER_SCRIPTS:
+        return True
+
+    return (
+        (script in MANAGEMENT_COMMAND_SCRIPTS) and
+        (sys.argv[1:2] == ['runserver']) and
+        ((os.environ.get('RUN_MAIN') == 'true') or ('--noreload' in sys.argv))
+    )
 
 
 class MatchmakerConfig(AppConfig):
     name = 'matchmaker'
+
+    # Seconds to wait before trying to warm up again after failing, doubling with each failure up to the maximum.
+    WARM_UP_RETRY_DELAY = 1
+    WARM_UP_MAX_RETRY_DELAY = 60
+
+    # Set once the engine has been loaded and warmed up (see warm_up), and the app is ready to serve matches. Set
+    # straight away if not warming up.
+    warm = threading.Event()
+
+    # The exception raised by the last attempt to warm up, while it is being retried.
+    warm_up_error = None
+
+    # Warm up in the background, rather than blocking the worker from booting, so that it can answer readiness checks
+    # (see views.ready) in the meantime. Only web servers warm up (see is_server_process).
+    def ready(self):
+        if not getattr(settings, 'MATCHMAKER_WARM_UP', True):
+            self.warm.set()
+        elif is_server_process():
+            threading.Thread(target = self.warm_up, name = 'matchmaker-warm-up', daemon = True).start()
+
+    # Keeps trying until warmed up, backing off between attempts.
+    @classmethod
+    def warm_up(cls):
+        import matchmaker as Matchmaker
+
+        retry_delay = cls.WARM_UP_RETRY_DELAY
+
+        while True:
+            try:
+                Matchmaker.Model.warm_up(matches_to_retrieve = settings.MATCHMAKER_MATCHES_TO_RETRIEVE)
+            except Exception as exception:
+                cls.warm_up_error = exception
+                logging.getLogger(__name__).exception('Failed to warm up the matchmaker engine; retrying in %s seconds.', retry_delay)
+
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, cls.WARM_UP_MAX_RETRY_DELAY)
+            else:
+                cls.warm_up_error = None
+                cls.warm.set()
+
+                return
@@ -0,0 +1,51 @@
+import orjson
+import matchmaker as Matchmaker
+
+# Finding matches, for the views: the CPU-bound work of each request, which the async views run on the search executor
+# (see search_executor). Nothing here depends on Django, so that it can be run in other processes.
+
+# The attributes of a match, in the order that they are in the matches data frame.
+MATCH_ATTRIBUTES = Matchmaker.Match.MATCH_ATTRIBUTES
+
+# Returns the matches as a sequence of Match objects (see Matchmaker.Match.Matches).
+def find_matches(input_data, matches_to_retrieve):
+  input_data_frame, matches_data_frame = Matchmaker.Model.execute(
+    input_data = input_data,
+    force_training = False,
+    matches_to_retrieve = matches_to_retrieve
+  )
+
+  # Inputs without any candidates get no matches data frame.
+  if len(matches_data_frame) == 0:
+    return []
+
+  with Matchmaker.Metrics.stage('build_matches'):
+    return Matchmaker.Match.Matches(matches_data_frame)
+
+# Returns the given attributes of every match, encoded as JSON, e.g. { "matches": [{ "score": 87, "age": 29, ... }] }.
+# The attributes are read a column at a time, rather than iterating over the rows of the matches data frame.
+def find_matches_json(input_data, fields, matches_to_retrieve):
+  input_data_frame, matches_data_frame = Matchmaker.Model.execute(
+    input_data = input_data,
+    force_training = False,
+    matches_to_retrieve = matches_to_retrieve
+  )
+
+  if len(matches_data_frame) == 0:
+    return orjson.dumps({ 'matches': [] })
+
+  with Matchmaker.Metrics.stage('serialize_matches'):
+    # Ages are whole numbers of years.
+    matches_data_frame['age'] = matches_data_frame['age'].astype(int)
+
+    columns = [matches_data_frame[field].tolist() for field in fields]
+
+    return orjson.dumps({ 'matches': [dict(zip(fields, values)) for values in zip(*columns)] })
+
+# Call the function, returning its result along with the name and duration of every stage that it timed (see
+# Matchmaker.Metrics.collect_stage_timings), as those are collected per thread.
+def call_collecting_stage_timings(function, *args):
+  with Matchmaker.Metrics.collect_stage_timings() as stage_timings:
+    result = function(*args)
+
+  return result, stage_timings
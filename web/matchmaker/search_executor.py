@@ -0,0 +1,106 @@
+import asyncio
+import concurrent.futures
+import functools
+import multiprocessing
+import threading
+from django.conf import settings
+import matchmaker as Matchmaker
+from . import search as Search
+
+# Raised when the search executor is already running and queueing as much as it can.
+class QueueFull(Exception):
+  pass
+
+# Runs the CPU-bound work of finding matches for the async views, so that the event loop is free to serve other requests
+# in the meantime. At most concurrency searches run at once (on a pool of threads, or of processes to use every core
+# despite the GIL), and at most queue_depth more wait for one of them to finish; beyond that, searches are turned away
+# straight away (see QueueFull) rather than queueing up without limit.
+class SearchExecutor:
+  def __init__(self, executor_type, concurrency, queue_depth, warm_up = False):
+    self.executor_type = executor_type
+    self.concurrency = concurrency
+    self.queue_depth = queue_depth
+    self.__pending = 0
+    self.__lock = threading.Lock()
+
+    if executor_type == 'thread':
+      self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers = concurrency, thread_name_prefix = 'matchmaker-search')
+    elif executor_type == 'process':
+      # Each process loads (and, optionally, warms up) its own engine, sharing the memory-mapped population snapshot
+      # and model artifact.
+      self.__executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers = concurrency,
+        mp_context = multiprocessing.get_context('spawn'),
+        initializer = Matchmaker.Model.warm_up if warm_up else None,
+        initargs = (settings.MATCHMAKER_MATCHES_TO_RETRIEVE,) if warm_up else ()
+      )
+    else:
+      raise ValueError(f'Unknown search executor type: {executor_type}.')
+
+  # Run the function (one of Search's) with the given arguments. Returns its result, and the name and duration of every
+  # stage that it timed.
+  async def run(self, function, *args):
+    with self.__lock:
+      if self.__pending >= (self.concurrency + self.queue_depth):
+        raise QueueFull()
+
+      self.__pending += 1
+
+    try:
+      result, stage_timings = await asyncio.get_running_loop().run_in_executor(
+        self.__executor,
+        functools.partial(Search.call_collecting_stage_timings, function, *args)
+      )
+    finally:
+      with self.__lock:
+        self.__pending -= 1
+
+    # Metrics are collected per process, so record the stages timed in another process in this one's.
+    if self.executor_type == 'process':
+      for name, seconds in stage_timings:
+        Matchmaker.Metrics.observe('matchmaker_stage_seconds', seconds, stage = name)
+
+    return result, stage_timings
+
+  def stats(self):
+    with self.__lock:
+      pending = self.__pending
+
+    return {
+      'running': min(pending, self.concurrency),
+      'queued': max(pending - self.concurrency, 0),
+      'concurrency': self.concurrency,
+      'queue_depth': self.queue_depth
+    }
+
+  # Every stat (see stats) in the Prometheus text exposition format.
+  def render_metrics(self):
+    stats = self.stats()
+
+    return ''.join(
+      f'# HELP matchmaker_search_executor_{name} {help_text}\n# TYPE matchmaker_search_executor_{name} gauge\nmatchmaker_search_executor_{name} {stats[name]}\n'
+      for name, help_text in [
+        ('running', 'Searches running on the search executor.'),
+        ('queued', 'Searches waiting for the search executor.'),
+        ('concurrency', 'The most searches that the search executor runs at once.'),
+        ('queue_depth', 'The most searches that wait for the search executor.')
+      ]
+    )
+
+SEARCH_EXECUTOR = None
+SEARCH_EXECUTOR_LOCK = threading.Lock()
+
+# The one search executor for this process, created on first use.
+def get_search_executor():
+  global SEARCH_EXECUTOR
+
+  with SEARCH_EXECUTOR_LOCK:
+    if SEARCH_EXECUTOR is None:
+      SEARCH_EXECUTOR = SearchExecutor(
+        settings.MATCHMAKER_SEARCH_EXECUTOR,
+        settings.MATCHMAKER_SEARCH_CONCURRENCY,
+        settings.MATCHMAKER_SEARCH_QUEUE_DEPTH,
+        warm_up = settings.MATCHMAKER_WARM_UP
+      )
+
+    return SEARCH_EXECUTOR
@@ -1,3 +1,226 @@
-from django.test import TestCase
+import json
+from unittest import mock
+from urllib.parse import urlencode
+import pandas as pd
+from django.apps import apps
+from django.test import SimpleTestCase, override_settings
+import matchmaker as Matchmaker
+from . import apps as MatchmakerApps
+from . import search_executor as SearchExecutor
 
-# Create your tests here.
+PROFILE_FORM_DATA = {
+  'age': 30,
+  'relationship_status': 'single',
+  'sex': 'm',
+  'sexual_orientation': 'straight',
+  'body_type': 'thin',
+  'diet': 'anything',
+  'drinks': 'rarely',
+  'drugs': 'never',
+  'education': 'completed_undergraduate_study',
+  'ethnicity': 'white',
+  'offspring': 'no_kids',
+  'pets': 'dogs',
+  'religion': 'christianity',
+  'smokes': 'no',
+  'speaks': 'english'
+}
+
+MATCH_ROWS = [
+  [87, 29.0, 'f', 'straight', 'fit', 'anything', 'socially', 'never', 'completed_undergraduate_study', 'white', False, True, False, True, 'christianity', 'no', 'english'],
+  [74, 33.0, 'f', 'bisexual', 'average', 'vegetarian', 'rarely', 'never', 'high_school', 'asian', True, False, True, False, 'agnosticism', 'no', 'english']
+]
+
+# The result of Matchmaker.Model.execute for an input with the given matches (or none at all, as for an input without
+# any candidates).
+def build_model_result(match_rows):
+  input_data_frame = pd.DataFrame([MATCH_ROWS[0][1:]], columns = Matchmaker.DataPreprocessing.DISPLAY_ATTRIBUTES)
+
+  if len(match_rows) == 0:
+    return input_data_frame, []
+
+  return input_data_frame, pd.DataFrame(
+    match_rows,
+    columns = Matchmaker.Match.MATCH_ATTRIBUTES,
+    index = pd.Index([5522, 4338][:len(match_rows)], name = 'row_id')
+  )
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class MatchesApiTests(SimpleTestCase):
+  path = '/api/matches'
+
+  def request(self, method, data, match_rows = MATCH_ROWS):
+    with mock.patch.object(Matchmaker.Model, 'execute', return_value = build_model_result(match_rows)) as execute:
+      response = getattr(self.client, method)(self.path, data)
+
+    return response, execute
+
+  def test_matches(self):
+    response, execute = self.request('post', PROFILE_FORM_DATA)
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response['Content-Type'], 'application/json')
+
+    matches = json.loads(response.content)['matches']
+
+    self.assertEqual([list(match.keys()) for match in matches], [Matchmaker.Match.MATCH_ATTRIBUTES] * 2)
+    self.assertEqual([match['score'] for match in matches], [87, 74])
+    self.assertEqual([match['age'] for match in matches], [29, 33])
+    self.assertEqual(execute.call_args.kwargs['input_data'][2:4], ['m', 'straight'])
+
+  def test_fields(self):
+    response, execute = self.request('get', dict(PROFILE_FORM_DATA, fields = 'score,age,religion'))
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(
+      json.loads(response.content),
+      { 'matches': [{ 'score': 87, 'age': 29, 'religion': 'christianity' }, { 'score': 74, 'age': 33, 'religion': 'agnosticism' }] }
+    )
+
+  def test_no_matches(self):
+    response, execute = self.request('post', PROFILE_FORM_DATA, match_rows = [])
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(json.loads(response.content), { 'matches': [] })
+
+  def test_invalid_profile(self):
+    response, execute = self.request('post', dict(PROFILE_FORM_DATA, age = 5))
+
+    self.assertEqual(response.status_code, 422)
+    self.assertIn('age', json.loads(response.content))
+    execute.assert_not_called()
+
+  def test_unknown_fields(self):
+    response, execute = self.request('get', dict(PROFILE_FORM_DATA, fields = 'score,height'))
+
+    self.assertEqual(response.status_code, 422)
+    self.assertEqual(json.loads(response.content)['fields'][0]['message'], 'Unknown field: height.')
+    execute.assert_not_called()
+
+  def test_method_not_allowed(self):
+    response, execute = self.request('put', PROFILE_FORM_DATA)
+
+    self.assertEqual(response.status_code, 405)
+    execute.assert_not_called()
+
+# The async views, with their searches run on the search executor. (Data is url-encoded by hand, as the async test
+# client doesn't encode it.)
+@override_settings(SECURE_SSL_REDIRECT = False)
+class AsyncViewsTests(SimpleTestCase):
+  async def request(self, method, path, data, match_rows = MATCH_ROWS):
+    with mock.patch.object(Matchmaker.Model, 'execute', return_value = build_model_result(match_rows)):
+      if method == 'get':
+        return await self.async_client.get(f'{path}?{urlencode(data)}')
+      else:
+        return await getattr(self.async_client, method)(path, urlencode(data), content_type = 'application/x-www-form-urlencoded')
+
+  async def test_matches(self):
+    response = await self.request('post', '/matches/async', PROFILE_FORM_DATA)
+
+    self.assertEqual(response.status_code, 200)
+    self.assertContains(response, 'Christianity')
+
+  async def test_no_matches(self):
+    response = await self.request('post', '/matches/async', PROFILE_FORM_DATA, match_rows = [])
+
+    self.assertContains(response, 'No matches :(')
+
+  async def test_api_matches(self):
+    response = await self.request('get', '/api/matches/async', dict(PROFILE_FORM_DATA, fields = 'score,age'))
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(json.loads(response.content), { 'matches': [{ 'score': 87, 'age': 29 }, { 'score': 74, 'age': 33 }] })
+
+  async def test_api_no_matches(self):
+    response = await self.request('post', '/api/matches/async', PROFILE_FORM_DATA, match_rows = [])
+
+    self.assertEqual(json.loads(response.content), { 'matches': [] })
+
+  async def test_api_invalid_profile(self):
+    response = await self.request('post', '/api/matches/async', dict(PROFILE_FORM_DATA, age = 5))
+
+    self.assertEqual(response.status_code, 422)
+
+  async def test_api_method_not_allowed(self):
+    response = await self.request('put', '/api/matches/async', PROFILE_FORM_DATA)
+
+    self.assertEqual(response.status_code, 405)
+
+  async def test_search_executor_full(self):
+    with mock.patch.object(SearchExecutor.SearchExecutor, 'run', side_effect = SearchExecutor.QueueFull()):
+      response = await self.request('post', '/api/matches/async', PROFILE_FORM_DATA)
+
+    self.assertEqual(response.status_code, 503)
+    self.assertEqual(response['Retry-After'], '1')
+
+@override_settings(SECURE_SSL_REDIRECT = False)
+class ReadyTests(SimpleTestCase):
+  def setUp(self):
+    self.app_config = apps.get_app_config('matchmaker')
+
+    MatchmakerApps.MatchmakerConfig.warm.clear()
+    MatchmakerApps.MatchmakerConfig.warm_up_error = None
+
+  def tearDown(self):
+    MatchmakerApps.MatchmakerConfig.warm.clear()
+    MatchmakerApps.MatchmakerConfig.warm_up_error = None
+
+  @override_settings(MATCHMAKER_WARM_UP = False)
+  def test_warm_up_disabled(self):
+    with mock.patch('threading.Thread') as thread:
+      self.app_config.ready()
+
+    thread.assert_not_called()
+    self.assertContains(self.client.get('/ready'), 'Ready')
+
+  @override_settings(MATCHMAKER_WARM_UP = True)
+  def test_warm_up(self):
+    self.assertContains(self.client.get('/ready'), 'Warming up', status_code = 503)
+
+    with mock.patch.object(MatchmakerApps, 'is_server_process', return_value = True), mock.patch.object(Matchmaker.Model, 'warm_up') as warm_up:
+      self.app_config.ready()
+      self.assertTrue(MatchmakerApps.MatchmakerConfig.warm.wait(5))
+
+    warm_up.assert_called_once()
+    self.assertContains(self.client.get('/ready'), 'Ready')
+
+  @override_settings(MATCHMAKER_WARM_UP = True)
+  def test_warm_up_retried(self):
+    ready_responses = []
+
+    # Check readiness while waiting to retry.
+    def sleep(seconds):
+      ready_responses.append((seconds, self.client.get('/ready')))
+
+    with mock.patch.object(Matchmaker.Model, 'warm_up', side_effect = [RuntimeError(), RuntimeError(), None]) as warm_up, mock.patch('time.sleep', sleep):
+      with self.assertLogs(MatchmakerApps.__name__, 'ERROR'):
+        MatchmakerApps.MatchmakerConfig.warm_up()
+
+    self.assertEqual(warm_up.call_count, 3)
+    self.assertEqual([seconds for seconds, response in ready_responses], [1, 2])
+
+    for seconds, response in ready_responses:
+      self.assertContains(response, 'Warming up failed; retrying', status_code = 503)
+
+    self.assertContains(self.client.get('/ready'), 'Ready')
+
+  @override_settings(MATCHMAKER_WARM_UP = True)
+  def test_not_server_process(self):
+    for argv in [['manage.py', 'migrate'], ['manage.py', 'runserver'], ['/usr/bin/pytest'], ['celery', '-A', 'web', 'worker'], ['-c'], []]:
+      with self.subTest(argv = argv), mock.patch('sys.argv', argv), mock.patch.dict('os.environ', { 'RUN_MAIN': '' }), mock.patch('threading.Thread') as thread:
+        self.assertFalse(MatchmakerApps.is_server_process())
+        self.app_config.ready()
+
+        thread.assert_not_called()
+
+  def test_server_process(self):
+    for argv in [['/usr/bin/gunicorn', 'web.wsgi'], ['/usr/lib/python3/site-packages/uvicorn/__main__.py', 'web.asgi:application'], ['manage.py', 'runserver', '--noreload']]:
+      with self.subTest(argv = argv), mock.patch('sys.argv', argv):
+        self.assertTrue(MatchmakerApps.is_server_process())
+
+    # runserver's child process, which it reloads on changes.
+    with mock.patch('sys.argv', ['manage.py', 'runserver']), mock.patch.dict('os.environ', { 'RUN_MAIN': 'true' }):
+      self.assertTrue(MatchmakerApps.is_server_process())
+
+    with mock.patch('sys.argv', ['mod_wsgi']), override_settings(MATCHMAKER_SERVER = True):
+      self.assertTrue(MatchmakerApps.is_server_process())
@@ -5,5 +5,10 @@ from . import views
 urlpatterns = [
   path('', views.home, name = 'home'),
   path('profile', views.profile, name = 'profile'),
-  path('matches', views.matches, name = 'matches')
+  path('matches', views.matches, name = 'matches'),
+  path('matches/async', views.matches_async, name = 'matches_async'),
+  path('api/matches', views.matches_api, name = 'matches_api'),
+  path('api/matches/async', views.matches_api_async, name = 'matches_api_async'),
+  path('ready', views.ready, name = 'ready'),
+  path('metrics', views.metrics, name = 'metrics')
 ]
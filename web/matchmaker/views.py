@@ -1,6 +1,14 @@
+import functools
+import orjson
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from .apps import MatchmakerConfig
 from .forms import ProfileForm
+from . import search as Search
+from . import search_executor as SearchExecutor
 import matchmaker as Matchmaker
 
 def home(request):
@@ -13,39 +21,177 @@ def profile(request):
 
   return render(request, 'profile.html', context)
 
+# When collecting metrics, time each stage of handling the request (see Matchmaker.Metrics), and report them in a
+# Server-Timing header.
+def server_timing(view):
+  @functools.wraps(view)
+  def timed_view(request, *args, **kwargs):
+    if not Matchmaker.Metrics.METRICS_ENABLED:
+      return view(request, *args, **kwargs)
+
+    with Matchmaker.Metrics.collect_stage_timings() as stage_timings:
+      with Matchmaker.Metrics.stage(view.__name__):
+        response = view(request, *args, **kwargs)
+
+    response['Server-Timing'] = Matchmaker.Metrics.format_server_timing(stage_timings)
+
+    return response
+
+  return timed_view
+
+@server_timing
 def matches(request):
-  profile_form = ProfileForm(request.POST)
-
-  if profile_form.is_valid():
-    input_data_frame, matches_data_frame = Matchmaker.Model.execute(
-      input_data = [
-        profile_form.cleaned_data['age'],
-        profile_form.cleaned_data['relationship_status'],
-        profile_form.cleaned_data['sex'],
-        profile_form.cleaned_data['sexual_orientation'],
-        profile_form.cleaned_data['body_type'],
-        profile_form.cleaned_data['diet'],
-        profile_form.cleaned_data['drinks'],
-        profile_form.cleaned_data['drugs'],
-        profile_form.cleaned_data['education'],
-        profile_form.cleaned_data['ethnicity'],
-        profile_form.cleaned_data['offspring'],
-        profile_form.cleaned_data['pets'],
-        profile_form.cleaned_data['religion'],
-        profile_form.cleaned_data['smokes'],
-        profile_form.cleaned_data['speaks']
-      ],
-      force_training = False,
-      matches_to_retrieve = 50
-    )
+  with Matchmaker.Metrics.stage('form_validation'):
+    profile_form = ProfileForm(request.POST)
+    is_valid = profile_form.is_valid()
 
-    if len(matches_data_frame) == 0:
-      return HttpResponse('No matches :(')
-    else:
-      context = {
-        'matches': [Matchmaker.Match.Match(match_row) for index, match_row in matches_data_frame.iterrows()]
-      }
+  if is_valid:
+    matches = Search.find_matches(build_input_data(profile_form), settings.MATCHMAKER_MATCHES_TO_RETRIEVE)
 
-      return render(request, 'matches.html', context)
+    return render_matches(request, matches)
   else:
     return HttpResponse(profile_form.errors.as_json(), status = 422, content_type = 'application/json')
+
+# The same as matches, but asynchronous: finding the matches is run on the search executor (see SearchExecutor), so that
+# under ASGI, the worker can serve other requests in the meantime. If the search executor is full, responds with a 503.
+async def matches_async(request):
+  with Matchmaker.Metrics.stage('form_validation'):
+    profile_form = ProfileForm(request.POST)
+    is_valid = profile_form.is_valid()
+
+  if not is_valid:
+    return HttpResponse(profile_form.errors.as_json(), status = 422, content_type = 'application/json')
+
+  try:
+    matches, stage_timings = await SearchExecutor.get_search_executor().run(
+      Search.find_matches, build_input_data(profile_form), settings.MATCHMAKER_MATCHES_TO_RETRIEVE
+    )
+  except SearchExecutor.QueueFull:
+    return search_executor_full()
+
+  return add_server_timing(render_matches(request, matches), stage_timings)
+
+# The same as matches, but for API clients: the matches' attributes (as they are, without the decorating that the Match
+# objects do) as JSON (see Search.find_matches_json). Accepts the same fields as the profile form, either as a form post
+# or query string parameters, and optionally a comma-separated list of attributes to include (e.g.
+# fields=score,age,religion); otherwise, all of them are included. Nothing is rendered.
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+@server_timing
+def matches_api(request):
+  profile_form, fields, error_response = validate_matches_api_request(request)
+
+  if error_response is not None:
+    return error_response
+
+  content = Search.find_matches_json(build_input_data(profile_form), fields, settings.MATCHMAKER_MATCHES_TO_RETRIEVE)
+
+  return HttpResponse(content, content_type = 'application/json')
+
+# The same as matches_api, but asynchronous (see matches_async).
+async def matches_api_async(request):
+  if request.method not in ['GET', 'POST']:
+    return HttpResponseNotAllowed(['GET', 'POST'])
+
+  profile_form, fields, error_response = validate_matches_api_request(request)
+
+  if error_response is not None:
+    return error_response
+
+  try:
+    content, stage_timings = await SearchExecutor.get_search_executor().run(
+      Search.find_matches_json, build_input_data(profile_form), fields, settings.MATCHMAKER_MATCHES_TO_RETRIEVE
+    )
+  except SearchExecutor.QueueFull:
+    return search_executor_full()
+
+  return add_server_timing(HttpResponse(content, content_type = 'application/json'), stage_timings)
+
+# Django's csrf_exempt decorator doesn't support async views (in this version), but this is all it does.
+matches_api_async.csrf_exempt = True
+
+# Returns the profile form and the attributes to include for a request to the matches API, and a response to return
+# instead if either is invalid.
+def validate_matches_api_request(request):
+  parameters = request.POST if request.method == 'POST' else request.GET
+
+  with Matchmaker.Metrics.stage('form_validation'):
+    profile_form = ProfileForm(parameters)
+    is_valid = profile_form.is_valid()
+
+  if not is_valid:
+    return profile_form, None, HttpResponse(profile_form.errors.as_json(), status = 422, content_type = 'application/json')
+
+  fields = [field for field in parameters.get('fields', '').split(',') if field != ''] or Search.MATCH_ATTRIBUTES
+  unknown_fields = [field for field in fields if field not in Search.MATCH_ATTRIBUTES]
+
+  if len(unknown_fields) > 0:
+    return profile_form, fields, HttpResponse(
+      orjson.dumps({ 'fields': [{ 'message': f'Unknown field: {field}.', 'code': 'invalid' } for field in unknown_fields] }),
+      status = 422,
+      content_type = 'application/json'
+    )
+
+  return profile_form, fields, None
+
+def render_matches(request, matches):
+  if len(matches) == 0:
+    return HttpResponse('No matches :(')
+
+  with Matchmaker.Metrics.stage('render'):
+    return render(request, 'matches.html', { 'matches': matches })
+
+def search_executor_full():
+  response = HttpResponse('Too many requests for matches; try again shortly.', status = 503)
+  response['Retry-After'] = '1'
+
+  return response
+
+# When collecting metrics, report the given stage timings (of work done on the search executor) in a Server-Timing
+# header. The async views can't collect their own stage timings (as with server_timing), as those are collected per
+# thread, and many requests are served concurrently by the one thread.
+def add_server_timing(response, stage_timings):
+  if Matchmaker.Metrics.METRICS_ENABLED:
+    response['Server-Timing'] = Matchmaker.Metrics.format_server_timing(stage_timings)
+
+  return response
+
+# The input data for the model from a valid profile form, in the order that Matchmaker.Model.execute expects.
+def build_input_data(profile_form):
+  return [
+    profile_form.cleaned_data['age'],
+    profile_form.cleaned_data['relationship_status'],
+    profile_form.cleaned_data['sex'],
+    profile_form.cleaned_data['sexual_orientation'],
+    profile_form.cleaned_data['body_type'],
+    profile_form.cleaned_data['diet'],
+    profile_form.cleaned_data['drinks'],
+    profile_form.cleaned_data['drugs'],
+    profile_form.cleaned_data['education'],
+    profile_form.cleaned_data['ethnicity'],
+    profile_form.cleaned_data['offspring'],
+    profile_form.cleaned_data['pets'],
+    profile_form.cleaned_data['religion'],
+    profile_form.cleaned_data['smokes'],
+    profile_form.cleaned_data['speaks']
+  ]
+
+# For Prometheus: the metrics collected (see Matchmaker.Metrics), and the search executor's (if it has been used), in its
+# text exposition format.
+def metrics(request):
+  content = Matchmaker.Metrics.render_metrics()
+
+  if SearchExecutor.SEARCH_EXECUTOR is not None:
+    content += SearchExecutor.SEARCH_EXECUTOR.render_metrics()
+
+  return HttpResponse(content, content_type = 'text/plain; version=0.0.4; charset=utf-8')
+
+# For load balancers: only ready to be sent requests once the matchmaker engine is warm (or isn't being warmed up). Says
+# so if warming up has failed, while it is retried.
+def ready(request):
+  if MatchmakerConfig.warm.is_set():
+    return HttpResponse('Ready')
+  elif MatchmakerConfig.warm_up_error is not None:
+    return HttpResponse('Warming up failed; retrying', status = 503)
+  else:
+    return HttpResponse('Warming up', status = 503)
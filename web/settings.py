@@ -134,5 +134,24 @@ STATICFILES_DIRS = [
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
+
+# Matchmaker
+
+MATCHMAKER_MATCHES_TO_RETRIEVE = 50
+
+# Load and warm up the matchmaker engine when the app boots, rather than on the first request for matches.
+MATCHMAKER_WARM_UP = os.environ.get('MATCHMAKER_WARM_UP', 'true') != 'false'
+
+# Warming up only happens in web servers that are recognized as such (see apps.is_server_process). Set this to warm up in
+# any other server.
+MATCHMAKER_SERVER = os.environ.get('MATCHMAKER_SERVER', 'false') == 'true'
+
+# The async views run the CPU-bound work of finding matches on a bounded pool of threads (or of processes, to use every
+# core): at most MATCHMAKER_SEARCH_CONCURRENCY at once, with at most MATCHMAKER_SEARCH_QUEUE_DEPTH more waiting, beyond
+# which requests are turned away with a 503.
+MATCHMAKER_SEARCH_EXECUTOR = os.environ.get('MATCHMAKER_SEARCH_EXECUTOR', 'thread')
+MATCHMAKER_SEARCH_CONCURRENCY = int(os.environ.get('MATCHMAKER_SEARCH_CONCURRENCY', os.cpu_count() or 1))
+MATCHMAKER_SEARCH_QUEUE_DEPTH = int(os.environ.get('MATCHMAKER_SEARCH_QUEUE_DEPTH', 64))
+
 # Activate Django-Heroku.
 django_heroku.settings(locals())